@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+ATP 生产环境入口：把 Flask 应用包装为 ASGI 应用，由 Hypercorn 以多进程方式运行
+
+使用方法：
+    python asgi.py --workers 4 --port 5000
+    python main.py --prod
+
+两种方式都会把工作进程数写入 ATP_WORKER_PROCESSES，各进程据此平分并发上限和限速。
+直接用 hypercorn 命令启动时需自行设置该变量，否则每个进程都按全部额度运行。
+
+每个工作进程有自己的事件循环和请求线程池；收到 SIGTERM / Ctrl+C 时停止接收新连接，
+等待进行中的请求和文档翻译任务结束后再退出。
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+
+from job_queue import job_queue
+from translators.http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+# 工作进程数，以及每个工作进程的请求线程数
+DEFAULT_WORKERS = int(os.getenv("ATP_WORKERS", "2"))
+DEFAULT_WORKER_THREADS = int(os.getenv("ATP_WORKER_THREADS", "32"))
+# 关闭时等待进行中的请求、以及排队和运行中的文档翻译任务的最长秒数
+GRACEFUL_TIMEOUT = float(os.getenv("ATP_GRACEFUL_TIMEOUT", "30"))
+SHUTDOWN_TIMEOUT = float(os.getenv("ATP_SHUTDOWN_TIMEOUT", "300"))
+
+
+class ASGIApplication:
+    """用 asgiref 的 WsgiToAsgi 把 WSGI 应用包装为 ASGI 应用，并处理 lifespan 事件
+
+    每个请求在自己的线程中执行（Flask 的异步视图在所在线程中运行自己的事件循环），
+    响应体逐块发送，SSE 流式响应不会被缓冲。
+    lifespan 关闭时停止接收新任务，等待文档翻译任务结束，再关闭共享的 HTTP 连接池。
+
+    参数:
+        load_app: 返回 WSGI 应用的函数，在工作进程启动时调用（主进程无需导入应用）
+        max_threads: 同时处理的请求数上限
+        shutdown_timeout: 关闭时等待文档翻译任务的最长秒数
+    """
+
+    def __init__(self, load_app, max_threads: int = None, shutdown_timeout: float = None):
+        self.load_app = load_app
+        self.max_threads = max_threads or DEFAULT_WORKER_THREADS
+        self.shutdown_timeout = SHUTDOWN_TIMEOUT if shutdown_timeout is None else shutdown_timeout
+        self.wsgi_app = None
+        self._bridge = None
+        self._slots = None
+
+    def _start(self) -> None:
+        if self._bridge is None:
+            self.wsgi_app = self.load_app()
+            self._bridge = WsgiToAsgi(self.wsgi_app)
+            self._slots = asyncio.Semaphore(self.max_threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            # 服务器未发送 lifespan 事件时在首个请求时加载应用
+            self._start()
+            # WsgiToAsgi 默认让所有请求共用一个线程，按请求划分上下文使每个请求有自己的线程
+            async with self._slots, ThreadSensitiveContext():
+                await self._bridge(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self._handle_lifespan(receive, send)
+        elif scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": 1000})
+
+    async def _handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._start()
+                self._check_worker_processes()
+                logger.info(f"工作进程 {os.getpid()} 已启动（{self.max_threads} 个请求线程）")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    def _check_worker_processes() -> None:
+        # Hypercorn 不向应用传递工作进程数，未经 serve 启动时只能提示手动设置
+        if "ATP_WORKER_PROCESSES" not in os.environ and multiprocessing.parent_process() is not None:
+            logger.warning("未设置 ATP_WORKER_PROCESSES，各工作进程都按配置的全部并发上限和限速运行；"
+                           "直接用 hypercorn 启动多个工作进程时请将其设为进程数")
+
+    def shutdown(self) -> None:
+        logger.info(f"工作进程 {os.getpid()} 正在关闭，等待 {job_queue.pending()} 个文档翻译任务")
+        job_queue.shutdown(self.shutdown_timeout)
+        http_client.close()
+        logger.info(f"工作进程 {os.getpid()} 已关闭")
+
+
+def load_flask_app():
+    from main import app
+    return app
+
+
+def serve(host: str = "0.0.0.0", port: int = 5000, workers: int = None) -> int:
+    """用 Hypercorn 启动多个工作进程，每个进程加载 asgi:application"""
+    from hypercorn.config import Config
+    from hypercorn.run import run
+
+    config = Config()
+    config.application_path = "asgi:application"
+    config.bind = [f"{host}:{port}"]
+    config.workers = max(1, workers or DEFAULT_WORKERS)
+    # 工作进程（spawn 启动，继承环境变量）据此平分并发上限和限速
+    os.environ["ATP_WORKER_PROCESSES"] = str(config.workers)
+    config.graceful_timeout = GRACEFUL_TIMEOUT
+    # lifespan 关闭阶段要等待文档翻译任务，超时需留出余量
+    config.shutdown_timeout = SHUTDOWN_TIMEOUT + 10
+    config.accesslog = "-"
+    logger.info(f"Hypercorn: {config.workers} 个工作进程，监听 {host}:{port}")
+    return run(config)
+
+
+application = ASGIApplication(load_flask_app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ATP 生产环境服务器")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("ATP_PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="工作进程数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(serve(args.host, args.port, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import logging
+import os
+import zipfile
+
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+
+def extract_archive(zip_path: str, dest_folder: str, prefix: str, allowed_extensions,
+                    max_files: int, max_bytes: int) -> list:
+    """解压 zip 中支持的文档到 dest_folder，返回 [(原文件名, 保存路径)]
+
+    目录结构会并入文件名（secure_filename 把路径分隔符换成下划线），其他类型的文件跳过。
+    文件数或解压后的总大小超过上限时抛出 ValueError。
+    """
+    if not zipfile.is_zipfile(zip_path):
+        raise ValueError(f"{os.path.basename(zip_path)} 不是有效的 zip 文件")
+
+    extracted = []
+    used = set()
+    with zipfile.ZipFile(zip_path) as archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and not os.path.basename(info.filename).startswith('.')
+            and info.filename.rsplit('.', 1)[-1].lower() in allowed_extensions
+        ]
+        if len(members) > max_files:
+            raise ValueError(f"压缩包中的文档数 {len(members)} 超过上限 {max_files}")
+        # 按声明的解压大小预先检查，防止压缩炸弹
+        total = sum(info.file_size for info in members)
+        if total > max_bytes:
+            raise ValueError(f"压缩包解压后 {total // (1024 * 1024)}MB，超过上限 {max_bytes // (1024 * 1024)}MB")
+
+        for info in members:
+            name = secure_filename(info.filename)
+            if not name:
+                continue
+            # 不同目录中的同名文件合并后可能重名，加序号区分
+            base, ext = os.path.splitext(name)
+            number = 1
+            while name in used:
+                number += 1
+                name = f"{base}_{number}{ext}"
+            used.add(name)
+            path = os.path.join(dest_folder, f"{prefix}_{name}")
+            with archive.open(info) as source, open(path, 'wb') as target:
+                remaining = info.file_size
+                while True:
+                    block = source.read(min(1024 * 1024, remaining + 1))
+                    if not block:
+                        break
+                    remaining -= len(block)
+                    if remaining < 0:
+                        raise ValueError(f"{info.filename} 的实际大小与声明不符")
+                    target.write(block)
+            extracted.append((name, path))
+    logger.info(f"从 {os.path.basename(zip_path)} 解压 {len(extracted)} 个文档")
+    return extracted
+
+
+def bundle_outputs(entries, zip_path: str) -> int:
+    """把各文档的译文打包为 zip，entries 为 [(包内文件名, 译文路径)]，返回打包的文件数"""
+    used = set()
+    count = 0
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for arcname, path in entries:
+            base, ext = os.path.splitext(arcname)
+            number = 1
+            while arcname in used:
+                number += 1
+                arcname = f"{base}_{number}{ext}"
+            used.add(arcname)
+            archive.write(path, arcname)
+            count += 1
+    return count
+
+
+class BatchProgress:
+    """汇总批量任务中各文档的块进度，合计后报告给 on_progress(已完成块数, 总块数)"""
+
+    def __init__(self, documents: int, on_progress=None):
+        self.done = [0] * documents
+        self.total = [0] * documents
+        self.on_progress = on_progress
+
+    def tracker(self, index: int):
+        def update(done: int, total: int) -> None:
+            self.done[index] = done
+            self.total[index] = total
+            if self.on_progress:
+                self.on_progress(sum(self.done), sum(self.total))
+        return update
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+ATP 离线压测：启动本地桩服务和 ATP，依次压测 /translate、/upload（生成的 TXT/DOCX 语料）
+和各 /review 模式，报告吞吐量、p50/p95/p99 延迟和 ATP 进程的峰值内存。
+
+使用方法：
+    python -m bench.benchmark                                   # 默认场景
+    python -m bench.benchmark --sizes 10KB,1MB,10MB,50MB --formats txt,docx
+    python -m bench.benchmark --output bench/baseline.json      # 保存基线
+    python -m bench.benchmark --baseline bench/baseline.json    # 与基线比较，退化时退出码为 1
+
+ATP 在临时工作目录中运行（上传、输出、翻译记忆都在该目录），不影响本地数据。
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.stub_server import add_arguments, options_from_args, start_in_thread
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_KEY = "sk-or-bench"
+MODEL = "bench/stub-model"
+REVIEW_MODES = ("single", "dual", "two-stage", "meeting", "multi")
+
+_WORDS = (
+    "the system translation document model request chunk latency budget review quality "
+    "language paragraph context token stream server client cache memory throughput parallel "
+    "network response format table header footer section revision glossary term consistent"
+).split()
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(B|KB|MB|GB)?\s*$", re.IGNORECASE)
+_SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def parse_size(value: str) -> int:
+    match = _SIZE_RE.match(value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"无法解析的大小: {value}")
+    return int(float(match.group(1)) * _SIZE_UNITS[(match.group(2) or "B").upper()])
+
+
+def format_size(size: int) -> str:
+    for unit in ("GB", "MB", "KB"):
+        if size >= _SIZE_UNITS[unit]:
+            return f"{size / _SIZE_UNITS[unit]:g}{unit}"
+    return f"{size}B"
+
+
+def _paragraphs(rng: random.Random):
+    while True:
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            words = [rng.choice(_WORDS) for _ in range(rng.randint(6, 18))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        yield " ".join(sentences)
+
+
+def generate_txt(path: str, size: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for paragraph in _paragraphs(rng):
+            if written >= size:
+                break
+            f.write(paragraph + "\n\n")
+            written += len(paragraph) + 2
+
+
+def generate_docx(path: str, size: int, seed: int = 0) -> None:
+    """按正文文字量生成 DOCX（含加粗片段、表格、页眉），size 为文字字节数而非文件大小"""
+    from docx import Document
+
+    rng = random.Random(seed)
+    document = Document()
+    document.sections[0].header.paragraphs[0].text = "Benchmark corpus header"
+    written = 0
+    for number, paragraph in enumerate(_paragraphs(rng)):
+        if written >= size:
+            break
+        if number % 50 == 49:
+            table = document.add_table(rows=2, cols=2)
+            for cell in table._cells:
+                cell.text = paragraph[:80]
+            written += 4 * len(paragraph[:80])
+            continue
+        head, _, tail = paragraph.partition(" ")
+        p = document.add_paragraph()
+        p.add_run(head + " ").bold = True
+        p.add_run(tail)
+        written += len(paragraph)
+    document.save(path)
+
+
+def percentile(values: list, fraction: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+class RSSSampler:
+    """定期采样进程的常驻内存，记录各场景内的峰值（psutil 或 /proc）"""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        try:
+            import psutil
+            self._process = psutil.Process(pid)
+        except Exception:
+            self._process = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        if self._process is not None:
+            try:
+                return self._process.memory_info().rss
+            except Exception:
+                return None
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+        return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = self._read()
+            if rss:
+                self.peak = max(self.peak, rss)
+
+    def reset(self) -> None:
+        self.peak = self._read() or 0
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+class ATPProcess:
+    """在临时工作目录中以子进程运行 ATP（单进程、无热重载）"""
+
+    BOOT = (
+        "import sys; sys.path.insert(0, {root!r}); from main import app; "
+        "app.run(host='127.0.0.1', port={port}, threaded=True, debug=False, use_reloader=False)"
+    )
+
+    def __init__(self, base_url: str, workdir: str, extra_env: dict = None):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ)
+        env.update({
+            "OPENROUTER_BASE_URL": base_url,
+            "ATP_DATA_DIR": os.path.join(workdir, "data"),
+            "ATP_MAX_UPLOAD_MB": "128",
+            "PYTHONUNBUFFERED": "1",
+        })
+        env.update(extra_env or {})
+        self.log = open(os.path.join(workdir, "atp.log"), "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", self.BOOT.format(root=REPO_ROOT, port=self.port)],
+            cwd=workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT,
+        )
+
+    def wait_ready(self, timeout: float = 30) -> None:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"ATP 启动失败，日志见 {self.log.name}")
+            try:
+                requests.get(f"{self.url}/stats", timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError("等待 ATP 启动超时")
+
+    def stop(self) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_concurrently(task, count: int, concurrency: int) -> tuple:
+    """并发执行 count 次 task()，返回 (每次的延迟列表, 失败次数, 总耗时)"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def timed(_):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = task()
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        list(pool.map(timed, range(count)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def summarize(name: str, latencies: list, errors: int, wall: float, peak_rss: int,
+              payload_bytes: int = None) -> dict:
+    completed = len(latencies)
+    result = {
+        "scenario": name,
+        "requests": completed + errors,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(completed / wall, 3) if wall else None,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "peak_rss_mb": round(peak_rss / 1024 / 1024, 1) if peak_rss else None,
+    }
+    for field in ("p50", "p95", "p99"):
+        if result[field] is not None:
+            result[field] = round(result[field], 4)
+    if payload_bytes is not None:
+        result["throughput_mb_s"] = round(payload_bytes / 1024 / 1024 / wall, 3) if wall else None
+    return result
+
+
+def translate_task(url: str, text: str):
+    def task():
+        response = requests.post(f"{url}/translate", json={
+            "user_message": text,
+            "api_key": API_KEY,
+            "model": MODEL,
+            "source_lang": "英文",
+            "target_lang": "中文",
+            "use_cache": False,
+        }, timeout=120)
+        return response.ok and response.json().get("success")
+    return task
+
+
+def upload_task(url: str, path: str, timeout: float, context: str = ""):
+    def task():
+        with open(path, "rb") as f:
+            response = requests.post(f"{url}/upload", files={"file": (os.path.basename(path), f)}, data={
+                "api_key": API_KEY,
+                "model": MODEL,
+                "source_lang": "英文",
+                "target_lang": "中文",
+                "use_cache": "0",
+                "incremental": "0",
+                "context": context,
+            }, timeout=300)
+        if response.status_code != 202:
+            return False
+        status_url = f"{url}{response.json()['status_url']}"
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = requests.get(status_url, timeout=30).json()
+            if job.get("status") == "completed":
+                return True
+            if job.get("status") == "failed":
+                return False
+            time.sleep(0.1)
+        return False
+    return task
+
+
+def review_payload(mode: str, source: str, target: str) -> dict:
+    config = {"api_key": API_KEY, "model": MODEL}
+    payload = {"mode": mode, "source_text": source, "target_text": target,
+               "source_lang": "英文", "target_lang": "中文"}
+    if mode in ("single", "multi"):
+        payload["config"] = config
+    if mode == "multi":
+        payload["translations"] = [{"model": f"候选{i}", "output": target} for i in range(1, 4)]
+    elif mode == "dual":
+        payload.update(config1=config, config2=config)
+    elif mode == "two-stage":
+        payload.update(scan_config=config, calibration_config=config)
+    elif mode == "meeting":
+        payload["experts"] = [
+            {"role": role, "config": config}
+            for role in ("术语专家", "流畅度专家", "准确性专家")
+        ]
+    return payload
+
+
+def review_task(url: str, payload: dict):
+    def task():
+        response = requests.post(f"{url}/review", json=payload, timeout=300)
+        return response.ok and not response.json().get("error")
+    return task
+
+
+def compare_with_baseline(results: list, baseline: list, tolerance: float) -> list:
+    """p95 延迟上升或吞吐量下降超过 tolerance 比例的场景视为退化"""
+    previous = {entry["scenario"]: entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        old = previous.get(entry["scenario"])
+        if not old:
+            continue
+        if old.get("p95") and entry.get("p95") and entry["p95"] > old["p95"] * (1 + tolerance):
+            regressions.append(f"{entry['scenario']}: p95 {old['p95']}s -> {entry['p95']}s")
+        if old.get("throughput_rps") and entry.get("throughput_rps") is not None \
+                and entry["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{entry['scenario']}: 吞吐量 {old['throughput_rps']}/s -> {entry['throughput_rps']}/s"
+            )
+        if old.get("peak_rss_mb") and entry.get("peak_rss_mb") \
+                and entry["peak_rss_mb"] > old["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{entry['scenario']}: 峰值内存 {old['peak_rss_mb']}MB -> {entry['peak_rss_mb']}MB")
+    return regressions
+
+
+def print_table(results: list) -> None:
+    columns = ("scenario", "requests", "errors", "throughput_rps", "throughput_mb_s",
+               "p50", "p95", "p99", "peak_rss_mb")
+    rows = [[str(entry.get(column, "") if entry.get(column) is not None else "-") for column in columns]
+            for entry in results]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ATP 离线压测")
+    parser.add_argument("--sizes", default="10KB,1MB,10MB", help="文档语料大小，逗号分隔（10KB～50MB）")
+    parser.add_argument("--formats", default="txt,docx", help="文档格式：txt、docx")
+    parser.add_argument("--translate-requests", type=int, default=100)
+    parser.add_argument("--review-requests", type=int, default=20)
+    parser.add_argument("--doc-repeats", type=int, default=1, help="每份语料上传的次数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--context", default="", help="文档翻译的上文模式：off、source、full（默认按服务端配置）")
+    parser.add_argument("--doc-timeout", type=float, default=1800, help="单份文档的最长等待秒数")
+    parser.add_argument("--skip", default="", help="跳过的场景组：translate,upload,review")
+    parser.add_argument("--cache", action="store_true", help="启用翻译记忆（默认关闭，测量真实吞吐）")
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    parser.add_argument("--baseline", help="用于比较的基线 JSON 文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例（默认0.2）")
+    parser.add_argument("--workdir", help="ATP 工作目录（默认临时目录）")
+    add_arguments(parser)
+    args = parser.parse_args()
+    skip = {item.strip() for item in args.skip.split(",") if item.strip()}
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="atp-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    stub = start_in_thread(options_from_args(args))
+    print(f"桩服务: {stub.base_url}")
+    atp = ATPProcess(stub.base_url, workdir, {} if args.cache else {"ATP_TM_ENABLED": "0"})
+    results = []
+    try:
+        atp.wait_ready()
+        print(f"ATP: {atp.url}（工作目录 {workdir}）")
+        sampler = RSSSampler(atp.process.pid)
+
+        def scenario(name, task, count, concurrency, payload_bytes=None):
+            sampler.reset()
+            latencies, errors, wall = run_concurrently(task, count, concurrency)
+            entry = summarize(name, latencies, errors, wall, sampler.peak,
+                              payload_bytes * count if payload_bytes is not None else None)
+            results.append(entry)
+            print(f"  {name}: {entry['throughput_rps']}/s, p95 {entry['p95']}s, "
+                  f"失败 {errors}, 峰值内存 {entry['peak_rss_mb']}MB")
+
+        sample = " ".join(next(_paragraphs(random.Random(1))) for _ in range(3))
+        if "translate" not in skip:
+            print("压测 /translate")
+            scenario("translate", translate_task(atp.url, sample),
+                     args.translate_requests, args.concurrency)
+
+        if "upload" not in skip:
+            print("压测 /upload")
+            corpus_dir = os.path.join(workdir, "corpus")
+            os.makedirs(corpus_dir, exist_ok=True)
+            for fmt in [item.strip() for item in args.formats.split(",") if item.strip()]:
+                for size in [parse_size(item) for item in args.sizes.split(",") if item.strip()]:
+                    path = os.path.join(corpus_dir, f"corpus_{format_size(size)}.{fmt}")
+                    try:
+                        (generate_docx if fmt == "docx" else generate_txt)(path, size)
+                    except ImportError:
+                        print(f"  跳过 {fmt}：未安装 python-docx")
+                        break
+                    # 文档逐份上传，测量单份文档的端到端耗时
+                    scenario(f"upload_{fmt}_{format_size(size)}", upload_task(atp.url, path, args.doc_timeout, args.context),
+                             args.doc_repeats, 1, payload_bytes=size)
+
+        if "review" not in skip:
+            print("压测 /review")
+            for mode in REVIEW_MODES:
+                scenario(f"review_{mode}", review_task(atp.url, review_payload(mode, sample, sample)),
+                         args.review_requests, args.concurrency)
+
+        sampler.stop()
+        try:
+            results.append({"scenario": "stub", "counts": requests.get(f"{stub.base_url}/stats", timeout=5).json()})
+        except requests.RequestException:
+            pass
+    finally:
+        atp.stop()
+        stub.shutdown()
+
+    print()
+    print_table([entry for entry in results if "p95" in entry])
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"created_at": time.time(), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_with_baseline([e for e in results if "p95" in e], baseline, args.tolerance)
+        if regressions:
+            print("\n性能退化：")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\n与基线相比无明显退化")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+本地 OpenRouter 桩服务：实现 /chat/completions（含流式），延迟、错误率、限流均可控制，
+用于离线压测，不消耗真实额度。
+
+使用方法：
+    python -m bench.stub_server --port 8090 --latency 200 --error-rate 0.02 --rps 20
+    OPENROUTER_BASE_URL=http://127.0.0.1:8090/api/v1 python main.py
+
+只依赖标准库。
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTINUATION_MARK = "译文在上面中断了"
+# 翻译指令之前可能带有上文，一并去掉
+_PROMPT_PREFIX_RE = re.compile(r"^.*?请将以下内容翻译为[^\n]*\n(?:翻译要求：[^\n]*\n)?\n", re.DOTALL)
+
+
+class StubOptions:
+    def __init__(self, latency: float = 0.05, jitter: float = 0.2, token_latency: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, rps: float = 0.0,
+                 flag_rate: float = 0.0, honor_max_tokens: bool = True, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rps = rps
+        self.flag_rate = flag_rate
+        self.honor_max_tokens = honor_max_tokens
+        self.random = random.Random(seed)
+
+
+class StubState:
+    """服务端令牌桶（模拟真实的速率限制）和请求计数"""
+
+    def __init__(self, options: StubOptions):
+        self.options = options
+        self.lock = threading.Lock()
+        self.tokens = max(1.0, options.rps)
+        self.updated = time.monotonic()
+        self.counts = {"requests": 0, "ok": 0, "errors": 0, "throttled": 0, "streams": 0}
+        # 见过的 system 前缀，重复出现时按命中前缀缓存报告 cached_tokens
+        self.prefixes = OrderedDict()
+
+    def count(self, field: str) -> None:
+        with self.lock:
+            self.counts[field] += 1
+
+    def take(self):
+        """返回 None 表示放行，否则返回建议的等待秒数"""
+        options = self.options
+        with self.lock:
+            if options.throttle_rate and options.random.random() < options.throttle_rate:
+                return 1.0
+            if options.rps <= 0:
+                return None
+            now = time.monotonic()
+            self.tokens = min(max(1.0, options.rps), self.tokens + (now - self.updated) * options.rps)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            return (1 - self.tokens) / options.rps
+
+    def cached_tokens(self, messages: list) -> int:
+        system = "".join(_content(m) for m in messages if m.get("role") == "system")
+        if not system:
+            return 0
+        with self.lock:
+            seen = system in self.prefixes
+            self.prefixes[system] = True
+            self.prefixes.move_to_end(system)
+            while len(self.prefixes) > 1000:
+                self.prefixes.popitem(last=False)
+        return estimate_tokens(system) if seen else 0
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return bool(rate) and self.options.random.random() < rate
+
+    def delay(self, output_tokens: int) -> float:
+        options = self.options
+        with self.lock:
+            spread = options.random.uniform(-options.jitter, options.jitter)
+        return max(0.0, options.latency * (1 + spread)) + options.token_latency * output_tokens
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 3)
+
+
+def _content(message) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def build_reply(payload: dict, state: StubState):
+    """按请求内容构造回复，返回 (回复文本, finish_reason)"""
+    messages = payload.get("messages") or []
+    system = " ".join(_content(m) for m in messages if m.get("role") == "system")
+    users = [_content(m) for m in messages if m.get("role") == "user"]
+    last_user = users[-1] if users else ""
+
+    if "分类器" in system or '"allow"' in system:
+        return json.dumps({"allow": True, "reason": "stub"}), "stop"
+    if "JSON数组" in system:
+        errors = []
+        if state.roll(state.options.flag_rate):
+            errors.append({"index": 0, "type": "术语", "original": "", "suggestion": "",
+                           "reason": "stub", "severity": "minor"})
+        return json.dumps(errors, ensure_ascii=False), "stop"
+    if "JSON对象" in system:
+        return json.dumps({"summary": "stub", "errors": [], "consistency_notes": "",
+                           "final_suggestion": ""}, ensure_ascii=False), "stop"
+
+    # 翻译请求：原样回显待翻译文本（去掉提示词前缀），续写时返回剩余部分
+    source = users[0] if users else ""
+    source = _PROMPT_PREFIX_RE.sub("", source, count=1)
+    if CONTINUATION_MARK in last_user and len(messages) >= 2:
+        partial = next((_content(m) for m in reversed(messages) if m.get("role") == "assistant"), "")
+        reply = source[len(partial):]
+    else:
+        reply = source
+
+    max_tokens = payload.get("max_tokens")
+    if state.options.honor_max_tokens and isinstance(max_tokens, int) and estimate_tokens(reply) > max_tokens:
+        return reply[:max_tokens * 3], "length"
+    return reply, "stop"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "ATPStub/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self) -> StubState:
+        return self.server.state
+
+    def _send_json(self, status: int, body: dict, headers: dict = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            with self.state.lock:
+                counts = dict(self.state.counts)
+            self._send_json(200, counts)
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json"}})
+            return
+        state = self.state
+        state.count("requests")
+
+        wait = state.take()
+        if wait is not None:
+            state.count("throttled")
+            reset_ms = int((time.time() + wait) * 1000)
+            self._send_json(429, {"error": {"message": "rate limited", "code": 429}}, {
+                "Retry-After": str(max(1, math.ceil(wait))),
+                "X-RateLimit-Remaining": "0",
+                "X-RateLimit-Reset": str(reset_ms),
+            })
+            return
+        if state.roll(state.options.error_rate):
+            state.count("errors")
+            time.sleep(state.delay(0))
+            self._send_json(503, {"error": {"message": "stub upstream error", "code": 503}})
+            return
+
+        reply, finish_reason = build_reply(payload, state)
+        prompt_tokens = sum(estimate_tokens(_content(m)) for m in payload.get("messages") or [])
+        completion_tokens = estimate_tokens(reply)
+        cached_tokens = state.cached_tokens(payload.get("messages") or [])
+        model = payload.get("model") or "stub"
+        if payload.get("stream"):
+            state.count("streams")
+            self._stream(reply, finish_reason, model)
+        else:
+            time.sleep(state.delay(completion_tokens))
+            self._send_json(200, {
+                "id": f"gen-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                },
+            })
+        state.count("ok")
+
+    def _stream(self, reply: str, finish_reason: str, model: str) -> None:
+        state = self.state
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        time.sleep(state.delay(0))
+
+        def emit(chunk: dict) -> None:
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+        pieces = [reply[i:i + 24] for i in range(0, len(reply), 24)] or [""]
+        for piece in pieces:
+            if state.options.token_latency:
+                time.sleep(state.options.token_latency * estimate_tokens(piece))
+            emit({"model": model, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+        emit({"model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options: StubOptions):
+        super().__init__(address, StubHandler)
+        self.state = StubState(options)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+
+def start_in_thread(options: StubOptions, host: str = "127.0.0.1", port: int = 0) -> StubServer:
+    """在后台线程中启动桩服务，port 为 0 时自动分配端口"""
+    server = StubServer((host, port), options)
+    threading.Thread(target=server.serve_forever, name="atp-stub", daemon=True).start()
+    return server
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", type=float, default=50, help="基础延迟（毫秒，默认50）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟随机浮动比例（默认0.2）")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="每个输出 token 增加的延迟（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的比例")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="随机返回 429 的比例")
+    parser.add_argument("--rps", type=float, default=0.0, help="服务端速率上限（每秒请求数，0 为不限）")
+    parser.add_argument("--flag-rate", type=float, default=0.0, help="译审初筛报告错误的比例")
+    parser.add_argument("--ignore-max-tokens", action="store_true", help="不按 max_tokens 截断输出")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+
+
+def options_from_args(args) -> StubOptions:
+    return StubOptions(
+        latency=args.latency / 1000,
+        jitter=args.jitter,
+        token_latency=args.token_latency / 1000,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        rps=args.rps,
+        flag_rate=args.flag_rate,
+        honor_max_tokens=not args.ignore_max_tokens,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenRouter 桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), options_from_args(args))
+    print(f"桩服务已启动: {server.base_url}")
+    print(f"设置 OPENROUTER_BASE_URL={server.base_url} 后启动 ATP")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
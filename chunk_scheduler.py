@@ -0,0 +1,494 @@
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+from collections import OrderedDict, defaultdict, deque
+
+from translators.metrics import metrics
+from translators.rate_limiter import backoff_delay, worker_share
+
+logger = logging.getLogger(__name__)
+
+FAILED_CHUNK_PREFIX = "[翻译失败]"
+
+# 同一个 API Key 允许同时在途的请求数（可被 app.config 覆盖）
+# 多进程部署时配置值为所有工作进程合计，每个进程分得其中一份
+DEFAULT_MAX_INFLIGHT_PER_KEY = worker_share(int(os.getenv("ATP_MAX_INFLIGHT_PER_KEY", "4")))
+# 同一模型允许同时在途的请求数（跨所有 API Key），0 表示不限制
+DEFAULT_MAX_INFLIGHT_PER_MODEL = worker_share(int(os.getenv("ATP_MAX_INFLIGHT_PER_MODEL", "0")))
+# 输出被截断时最多续写的次数，以及续写失败后拆分重译的最大层数
+DEFAULT_MAX_CONTINUATIONS = int(os.getenv("ATP_MAX_CONTINUATIONS", "2"))
+DEFAULT_MAX_SPLIT_DEPTH = int(os.getenv("ATP_MAX_SPLIT_DEPTH", "3"))
+# 流式翻译时已开始但译文尚未被取走的块数上限，为 Key 并发上限的倍数
+DEFAULT_PENDING_PER_SLOT = int(os.getenv("ATP_PENDING_CHUNKS_PER_SLOT", "4"))
+# 上文：off 不带上文；source 带上一块原文的结尾（各块仍并发翻译）；
+# full 同时带上一块的译文结尾（每块等上一块译完，术语更一致但文档内串行）
+CONTEXT_MODES = ("off", "source", "full")
+
+
+class KeyedLimiter:
+    """按 API Key 限制在途请求数，名额在多个流之间轮转分配
+
+    Flask 的异步视图每个请求使用独立的事件循环，因此这里用线程锁保存计数，
+    等待者的 future 通过 call_soon_threadsafe 唤醒，可在多个事件循环间共享。
+    等待者按 flow（通常为文档）分组，释放名额时依次轮到各组，块数多的大文档
+    不会让后到的小文档一直排队；不指定 flow 的调用共用一组，按先来后到。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = defaultdict(int)
+        # key -> OrderedDict(flow -> deque[(loop, future)])，OrderedDict 的顺序即轮转顺序
+        self._waiters = defaultdict(OrderedDict)
+
+    async def acquire(self, key: str, limit: int, flow=None) -> None:
+        loop = asyncio.get_running_loop()
+        limit = max(1, int(limit))
+        with self._lock:
+            if self._inflight[key] < limit and not self._waiters[key]:
+                self._inflight[key] += 1
+                return
+            future = loop.create_future()
+            self._waiters[key].setdefault(flow, deque()).append((loop, future))
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                flows = self._waiters[key]
+                waiters = flows.get(flow)
+                if waiters is not None:
+                    for item in waiters:
+                        if item[1] is future:
+                            waiters.remove(item)
+                            break
+                    if not waiters:
+                        del flows[flow]
+            # 名额已经转交但任务被取消，需要归还
+            if future.done() and not future.cancelled():
+                self.release(key)
+            raise
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            flows = self._waiters[key]
+            while flows:
+                flow, waiters = next(iter(flows.items()))
+                loop, future = waiters.popleft()
+                # 该组还有等待者时移到队尾，下一个名额轮到其他组
+                if waiters:
+                    flows.move_to_end(flow)
+                else:
+                    del flows[flow]
+                if loop.is_closed():
+                    continue
+                # 名额直接转交给下一个等待者，计数不变
+                loop.call_soon_threadsafe(self._grant, key, future)
+                return
+            self._inflight[key] -= 1
+            if self._inflight[key] <= 0:
+                del self._inflight[key]
+                del self._waiters[key]
+
+    @contextlib.asynccontextmanager
+    async def hold(self, slots, flow=None):
+        """依次占用 slots 中各 (key, limit) 的名额，退出时全部归还"""
+        acquired = []
+        try:
+            for key, limit in slots:
+                await self.acquire(key, limit, flow=flow)
+                acquired.append(key)
+            yield
+        finally:
+            for key in reversed(acquired):
+                self.release(key)
+
+    def _grant(self, key: str, future: asyncio.Future) -> None:
+        if future.done():
+            self.release(key)
+        else:
+            future.set_result(None)
+
+    def inflight(self, key: str) -> int:
+        with self._lock:
+            return self._inflight.get(key, 0)
+
+    def waiting(self, key: str) -> int:
+        with self._lock:
+            return sum(len(waiters) for waiters in self._waiters.get(key, {}).values())
+
+
+key_limiter = KeyedLimiter()
+
+
+def request_slots(api_key: str = None, model: str = None, max_inflight: int = None,
+                  max_inflight_per_model: int = None) -> list:
+    """一次模型请求需要占用的名额 [(key, limit)]
+
+    先占模型名额再占 Key 名额，所有调用方按相同顺序获取，不会互相等待成环；
+    api_key 为 None 或模型上限为 0 时不占对应的名额。
+    """
+    if max_inflight_per_model is None:
+        max_inflight_per_model = DEFAULT_MAX_INFLIGHT_PER_MODEL
+    slots = []
+    if model and max_inflight_per_model > 0:
+        slots.append((f"model:{model}", max_inflight_per_model))
+    if api_key is not None:
+        slots.append((api_key, max_inflight or DEFAULT_MAX_INFLIGHT_PER_KEY))
+    return slots
+
+
+async def iterate_in_thread(iterator):
+    """在线程中逐个取出同步迭代器的元素（如文件读取），不阻塞事件循环"""
+    sentinel = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, sentinel)
+        if item is sentinel:
+            return
+        yield item
+
+
+class TruncationStats:
+    """按模型统计输出被截断、不完整的次数及处理结果"""
+
+    FIELDS = ("chunks", "truncated", "incomplete", "continuations", "continued",
+              "resplits", "unrecovered")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+
+    def record(self, model: str, field: str, count: int = 1) -> None:
+        with self._lock:
+            self._models[model or "unknown"][field] += count
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            result = {}
+            for model, counts in self._models.items():
+                entry = dict(counts)
+                entry["truncation_rate"] = (
+                    round(counts["truncated"] / counts["chunks"], 4) if counts["chunks"] else 0.0
+                )
+                result[model] = entry
+            return result
+
+
+truncation_stats = TruncationStats()
+
+
+class ChunkScheduler:
+    """并发翻译文本块，按原始顺序返回结果
+
+    输出被截断（finish_reason 为 "length"）时先请求续写，续写失败或完整性检查不通过时
+    把该块拆成两半并发重译，因此块大小可以设得激进而不会丢失内容。
+
+    参数:
+        translate_fn: 异步函数 translate_fn(text, continuation=None)，返回译文字符串或
+            {"text", "finish_reason"} 字典（失败返回空值）；continuation 为被截断的译文时应续写
+        limiter_key: 并发限制所依据的键（通常为 API Key）；为 None 时不占名额，
+            由 translate_fn 自行按实际请求的后端占用（如多后端路由）
+        max_inflight: 同一键允许的最大在途请求数
+        retry_delay: 单块失败后重试前的最长等待秒数（随机抖动，避免各块同时重试）
+        on_progress: 每完成一块时调用 on_progress(已完成块数, 总块数)
+        model: 统计截断次数时使用的模型名
+        is_complete: 完整性检查 is_complete(原文, 译文)，不通过时拆分重译
+        split_fn: 拆分函数 split_fn(text)，返回 (片段列表, 连接符)，为空时不拆分
+        on_recovered: 续写或拆分重译成功后调用 on_recovered(原文, 完整译文, translated_by=模型)，有上文时
+            另传 context；translated_by 为给出全部片段的模型（结果字典的 "model" 字段，缺省为 model 参数），
+            片段来自不同模型时为 None
+        flow: 公平排队的分组（通常为文档），多个文档共用同一 Key 时轮流获得名额
+        max_inflight_per_model: 同一模型跨所有 Key 的最大在途请求数，0 表示不限制
+        context_mode: 上文模式（见 CONTEXT_MODES），非 off 时以 context={"source", "translation"}
+            调用 translate_fn
+        context_tail: 截取上文的函数 context_tail(text)，返回长度受限的结尾部分
+        max_pending: stream 中已开始但译文尚未被取走的最大块数，默认为 max_inflight 的
+            DEFAULT_PENDING_PER_SLOT 倍
+    """
+
+    def __init__(self, translate_fn, limiter_key: str, max_inflight: int = None,
+                 retry_delay: float = 2.0, limiter: KeyedLimiter = None, on_progress=None,
+                 model: str = None, is_complete=None, split_fn=None, on_recovered=None,
+                 max_continuations: int = None, max_split_depth: int = None,
+                 stats: TruncationStats = None, flow=None, max_inflight_per_model: int = None,
+                 context_mode: str = "off", context_tail=None, max_pending: int = None):
+        self.translate_fn = translate_fn
+        self.limiter_key = limiter_key
+        self.max_inflight = max_inflight or DEFAULT_MAX_INFLIGHT_PER_KEY
+        self.retry_delay = retry_delay
+        self.limiter = limiter or key_limiter
+        self.on_progress = on_progress
+        self.model = model
+        self.is_complete = is_complete
+        self.split_fn = split_fn
+        self.on_recovered = on_recovered
+        self.max_continuations = (
+            max_continuations if max_continuations is not None else DEFAULT_MAX_CONTINUATIONS
+        )
+        self.max_split_depth = (
+            max_split_depth if max_split_depth is not None else DEFAULT_MAX_SPLIT_DEPTH
+        )
+        self.stats = stats or truncation_stats
+        self.flow = flow
+        self.max_inflight_per_model = (
+            max_inflight_per_model if max_inflight_per_model is not None
+            else DEFAULT_MAX_INFLIGHT_PER_MODEL
+        )
+        if context_mode not in CONTEXT_MODES:
+            raise ValueError(f"不支持的上文模式: {context_mode}")
+        self.context_mode = context_mode
+        self.context_tail = context_tail or (lambda text: text)
+        self.max_pending = max_pending or self.max_inflight * DEFAULT_PENDING_PER_SLOT
+
+    def _context(self, prev_text: str, prev_translation: str = None):
+        """由上一块的原文（和译文）构造上文，off 模式或没有上一块时返回 None"""
+        if self.context_mode == "off" or not prev_text:
+            return None
+        translation = None
+        if self.context_mode == "full" and prev_translation \
+                and not prev_translation.startswith(FAILED_CHUNK_PREFIX):
+            translation = self.context_tail(prev_translation)
+        return {"source": self.context_tail(prev_text), "translation": translation}
+
+    async def run(self, chunks) -> list:
+        """chunks 为 TextProcessor.process_text 返回的 (prev_text, current_text) 列表
+
+        所有块同时开始，full 模式也只带上一块的原文。
+        """
+        total = len(chunks)
+        results = [None] * total
+        done = 0
+
+        async def worker(index, prev_text, current_text):
+            nonlocal done
+            results[index] = await self._translate_chunk(index, total, current_text, self._context(prev_text))
+            done += 1
+            if self.on_progress:
+                self.on_progress(done, total)
+
+        await asyncio.gather(*(
+            worker(index, prev_text, current_text)
+            for index, (prev_text, current_text) in enumerate(chunks)
+        ))
+        return results
+
+    async def run_stream(self, chunks) -> list:
+        """同 stream，译文按原始顺序收集为列表返回"""
+        return [result async for result in self.stream(chunks)]
+
+    async def stream(self, chunks):
+        """chunks 为产出 (prev_text, current_text) 的异步迭代器，每产出一块立即开始翻译，
+        译文按原始顺序逐块产出；full 模式下每块等上一块译完，带上其译文。
+        上文不是上一块时（如中间隔着复用旧译文的段落）产出 (prev_text, current_text, prev_translation)，
+        full 模式直接使用给出的译文（可为 None），不等上一块
+
+        已开始但译文尚未被取走的块不超过 max_pending 个：读取下一块前先占一个名额，译文被取走后归还，
+        调用方处理得慢时读取随之暂停，内存占用不随文档长度增长。
+        总块数在迭代结束前未知，on_progress 收到的总数为当前已知的块数。
+        """
+        iterator = chunks.__aiter__()
+        window = asyncio.Semaphore(self.max_pending)
+        queue = asyncio.Queue()
+        outstanding = set()
+        started = 0
+        done = 0
+
+        async def worker(index, prev_text, current_text, previous, prev_translation=None):
+            nonlocal done
+            if self.context_mode == "full" and previous is not None:
+                # shield：本块被取消时不连带取消上一块
+                prev_translation = await asyncio.shield(previous)
+            context = self._context(prev_text, prev_translation)
+            result = await self._translate_chunk(index, None, current_text, context)
+            done += 1
+            if self.on_progress:
+                self.on_progress(done, started)
+            return result
+
+        async def feed():
+            nonlocal started
+            previous = None
+            try:
+                while True:
+                    await window.acquire()
+                    try:
+                        prev_text, current_text, *known = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    previous = asyncio.ensure_future(worker(
+                        started, prev_text, current_text, None if known else previous, *known
+                    ))
+                    outstanding.add(previous)
+                    started += 1
+                    queue.put_nowait(previous)
+                    if self.on_progress:
+                        self.on_progress(done, started)
+            finally:
+                queue.put_nowait(None)
+
+        feeder = asyncio.ensure_future(feed())
+        try:
+            while True:
+                task = await queue.get()
+                if task is None:
+                    break
+                result = await task
+                outstanding.discard(task)
+                window.release()
+                yield result
+            # 读取文本块出错时在这里抛出
+            await feeder
+        finally:
+            feeder.cancel()
+            for task in outstanding:
+                task.cancel()
+            await asyncio.gather(feeder, *outstanding, return_exceptions=True)
+
+    async def _attempt(self, text, context=None, **kwargs):
+        # limiter_key 为 None 时由 translate_fn 按实际请求的后端占用名额
+        slots = request_slots(self.limiter_key, self.model if self.limiter_key is not None else None,
+                              self.max_inflight, self.max_inflight_per_model)
+        async with self.limiter.hold(slots, flow=self.flow):
+            try:
+                if context is not None:
+                    kwargs["context"] = context
+                return await self.translate_fn(text, **kwargs)
+            except Exception as exc:
+                logger.error("块翻译调用异常: %s", exc)
+                return None
+
+    @staticmethod
+    def _unpack(result, raw: bool = False):
+        """返回 (译文, finish_reason)；raw 为 True 时取未去除首尾空白的原始输出（用于续写拼接）"""
+        if isinstance(result, dict):
+            text = result.get("text")
+            if raw and result.get("raw_text"):
+                text = result["raw_text"]
+            return text, result.get("finish_reason")
+        return result, None
+
+    def _model_of(self, result):
+        """给出该结果的模型：多后端路由时为结果中的 "model" 字段"""
+        if isinstance(result, dict):
+            return result.get("model") or self.model
+        return self.model
+
+    @staticmethod
+    def _join_continuation(partial: str, more: str) -> str:
+        """拼接截断的译文和续写：两侧的空白只保留一份，优先保留含换行的一侧，避免段落或单词粘连"""
+        head = partial.rstrip()
+        body = more.lstrip()
+        whitespace = max(partial[len(head):], more[:len(more) - len(body)],
+                         key=lambda value: (value.count("\n"), len(value)))
+        return head + whitespace + body
+
+    def _complete(self, source: str, translation: str) -> bool:
+        return self.is_complete is None or self.is_complete(source, translation)
+
+    def _recovered(self, source: str, translation: str, models: set, context=None) -> None:
+        if self.on_recovered:
+            model = next(iter(models)) if len(models) == 1 else None
+            try:
+                if context is not None:
+                    self.on_recovered(source, translation, translated_by=model, context=context)
+                else:
+                    self.on_recovered(source, translation, translated_by=model)
+            except Exception as exc:
+                logger.warning("记录恢复后的译文失败: %s", exc)
+
+    async def _continue(self, text: str, partial: str, context=None, models: set = None):
+        """请求模型从截断处续写，返回拼接后的完整译文，失败返回 None；成功时把续写所用的模型加入 models"""
+        used = set()
+        for _ in range(self.max_continuations):
+            self.stats.record(self.model, "continuations")
+            result = await self._attempt(text, context, continuation=partial)
+            more, finish_reason = self._unpack(result, raw=True)
+            if not more or not more.strip():
+                return None
+            used.add(self._model_of(result))
+            partial = self._join_continuation(partial, more)
+            if finish_reason != "length":
+                partial = partial.strip()
+                if not self._complete(text, partial):
+                    return None
+                if models is not None:
+                    models.update(used)
+                return partial
+        return None
+
+    async def _translate_text(self, text: str, depth: int = 0, context=None, models: set = None):
+        """翻译一段文本，必要时续写或拆分重译（各片段沿用整块的上文）；无法得到完整译文时返回 None
+
+        models 不为 None 时加入给出返回译文的各模型。
+        """
+        result = await self._attempt(text, context)
+        translation, finish_reason = self._unpack(result)
+        if not translation:
+            return None
+        if models is None:
+            models = set()
+        truncated = finish_reason == "length"
+        if not truncated and self._complete(text, translation):
+            models.add(self._model_of(result))
+            return translation
+
+        self.stats.record(self.model, "truncated" if truncated else "incomplete")
+        if truncated and self.max_continuations > 0:
+            logger.warning(f"译文被截断（{len(text)} 字符），尝试续写")
+            used = {self._model_of(result)}
+            continued = await self._continue(text, self._unpack(result, raw=True)[0], context, used)
+            if continued:
+                self.stats.record(self.model, "continued")
+                self._recovered(text, continued, used, context)
+                models.update(used)
+                return continued
+
+        pieces, separator = self.split_fn(text) if self.split_fn else ([], None)
+        if pieces and depth < self.max_split_depth:
+            logger.warning(f"译文{'被截断' if truncated else '不完整'}，拆分为 {len(pieces)} 段重译")
+            self.stats.record(self.model, "resplits")
+            used = set()
+            parts = await asyncio.gather(*(
+                self._translate_text(piece, depth + 1, context, used) for piece in pieces
+            ))
+            if all(parts):
+                joined = parts[0]
+                for part in parts[1:]:
+                    if separator is not None:
+                        joined += separator + part
+                    else:
+                        # 按句拆分时，西文译文之间补空格，中日韩译文直接相连
+                        joined += (" " if joined[-1:].isascii() else "") + part
+                self._recovered(text, joined, used, context)
+                models.update(used)
+                return joined
+
+        if truncated:
+            if depth == 0:
+                self.stats.record(self.model, "unrecovered")
+            return None
+        # 完整性检查是启发式的，无法再拆分时接受原译文
+        models.add(self._model_of(result))
+        return translation
+
+    async def _translate_chunk(self, index: int, total, current_text: str, context=None) -> str:
+        logger.info(f"正在翻译第 {index+1}/{total or '?'} 块...")
+        self.stats.record(self.model, "chunks")
+        with metrics.time("atp_chunk_seconds", model=self.model):
+            translated_chunk = await self._translate_text(current_text, context=context)
+            if translated_chunk:
+                logger.info(f"块 {index+1} 翻译完成")
+                return translated_chunk
+
+            logger.warning(f"块 {index+1} 翻译失败，将重试...")
+            metrics.inc("atp_chunk_retries_total", model=self.model)
+            # 重试一次（限流已由翻译器按服务端提示退避，这里只需错开重试时间）
+            await asyncio.sleep(backoff_delay(0, base=self.retry_delay))
+            translated_chunk = await self._translate_text(current_text, context=context)
+            if translated_chunk:
+                logger.info(f"块 {index+1} 重试翻译成功")
+                return translated_chunk
+
+        logger.error(f"块 {index+1} 翻译失败")
+        return f"{FAILED_CHUNK_PREFIX} {current_text[:100]}..."
@@ -0,0 +1,131 @@
+import logging
+import sqlite3
+
+from chunk_scheduler import FAILED_CHUNK_PREFIX
+from revision_store import translation_lines
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentDeduplicator:
+    """文档内重复段落去重：每段文本（按段落指纹，即折叠空白并统一 Unicode 形式后的摘要比较）
+    只翻译首次出现的一份，之后的副本直接复用其译文
+
+    待翻译的块经 register 登记后，只把 segment["unique"] 中的段落送去翻译；各块按文档顺序译完并
+    逐行对齐后调用 resolve，记下首次出现的段落的译文，并把副本的译文填回各自的位置。
+    已登记的段落和译文存放在临时 SQLite 库中，内存占用不随文档长度增长。
+    """
+
+    def __init__(self, enabled: bool = True, count_tokens=None):
+        self.enabled = enabled
+        self.count_tokens = count_tokens
+        self._conn = None
+        self.duplicate_paragraphs = 0
+        self.tokens_saved = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # 文件名为空时 SQLite 使用私有的临时库，连接关闭后自动删除
+            conn = sqlite3.connect("")
+            # 段落指纹 -> 首次出现的段落的译文；done 表示其所在的块已处理，copies 为已登记的副本数
+            conn.execute(
+                """CREATE TABLE paragraphs (
+                    fingerprint TEXT PRIMARY KEY,
+                    line TEXT,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    copies INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+            self._conn = conn
+        return self._conn
+
+    def register(self, segment: dict) -> list:
+        """登记一个待翻译的块，返回其中需要翻译的段落（可能为空）"""
+        unique = []
+        slots = []
+        conn = self._connect() if self.enabled else None
+        for paragraph, fingerprint in zip(segment["paragraphs"], segment["fps"]):
+            if conn is not None:
+                row = conn.execute(
+                    "SELECT done, line FROM paragraphs WHERE fingerprint = ?", (fingerprint,)
+                ).fetchone()
+                # 首次出现的段落已处理但没有可用的译文（翻译失败或行数不符）时重新翻译，由本块接替
+                if row is not None and not (row[0] and row[1] is None):
+                    conn.execute(
+                        "UPDATE paragraphs SET copies = copies + 1 WHERE fingerprint = ?", (fingerprint,)
+                    )
+                    slots.append(fingerprint)
+                    self.duplicate_paragraphs += 1
+                    if self.count_tokens:
+                        self.tokens_saved += self.count_tokens(paragraph)
+                    continue
+                conn.execute("INSERT OR REPLACE INTO paragraphs (fingerprint) VALUES (?)", (fingerprint,))
+            slots.append(None)
+            unique.append(paragraph)
+        segment["unique"] = unique
+        segment["slots"] = slots
+        return unique
+
+    def needs_alignment(self, segment: dict) -> bool:
+        """块的译文是否需要与段落逐行对应（含副本，或已有副本以其为译文来源）"""
+        if len(segment["unique"]) < len(segment["slots"]):
+            return True
+        if not self.enabled or not segment["unique"]:
+            return False
+        fingerprints = [fp for fp, slot in zip(segment["fps"], segment["slots"]) if slot is None]
+        placeholders = ",".join("?" * len(fingerprints))
+        row = self._connect().execute(
+            f"SELECT 1 FROM paragraphs WHERE copies > 0 AND fingerprint IN ({placeholders}) LIMIT 1",
+            fingerprints,
+        ).fetchone()
+        return row is not None
+
+    def resolve(self, segment: dict) -> None:
+        """按文档顺序处理译完的块：记下其中首次出现的段落的逐行译文，把副本的译文填回原位置；
+        译文来源失败的块整体标记为失败，下次重新翻译"""
+        if not self.enabled:
+            return
+        conn = self._connect()
+        own = self._unique_lines(segment)
+        own_iter = iter(own or [])
+        lines = []
+        for fingerprint, slot in zip(segment["fps"], segment["slots"]):
+            if slot is None:
+                line = next(own_iter, None)
+                conn.execute(
+                    "UPDATE paragraphs SET done = 1, line = ? WHERE fingerprint = ?", (line, fingerprint)
+                )
+            else:
+                row = conn.execute("SELECT line FROM paragraphs WHERE fingerprint = ?", (slot,)).fetchone()
+                line = row[0] if row else None
+            lines.append(line)
+        if len(segment["unique"]) == len(segment["slots"]):
+            return
+        if own is None or None in lines:
+            segment["translation"] = f"{FAILED_CHUNK_PREFIX} {segment['paragraphs'][0][:100]}..."
+        else:
+            segment["translation"] = "\n".join(lines)
+
+    @staticmethod
+    def _unique_lines(segment: dict):
+        """块中待译段落的逐行译文，失败或行数不符时返回 None"""
+        if not segment["unique"]:
+            return []
+        translation = segment.get("translation") or ""
+        if not translation or translation.startswith(FAILED_CHUNK_PREFIX):
+            return None
+        lines = translation_lines(translation)
+        if len(lines) != len(segment["unique"]):
+            return None
+        return lines
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def report(self) -> dict:
+        return {
+            "duplicate_paragraphs": self.duplicate_paragraphs,
+            "source_tokens_saved": self.tokens_saved,
+        }
@@ -0,0 +1,245 @@
+import logging
+import re
+import shutil
+import zipfile
+
+from docx.oxml.ns import qn
+from docx.oxml.parser import element_class_lookup
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# 提示模型保留格式标记的补充要求
+MARKUP_INSTRUCTION = (
+    "文中的 <r1>…</r1>、<r2>…</r2> 等标记对应原文的格式片段（如加粗、斜体、链接），"
+    "<br/> 表示段内换行。请在译文中对应的位置原样保留这些标记，不要增删或改写标记。"
+)
+
+_SPAN_RE = re.compile(r"<r(\d+)>(.*?)</r\1>", re.DOTALL)
+_ANY_TAG_RE = re.compile(r"</?r\d+>")
+_BR_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+_TEXT_TAGS = (qn("w:t"), qn("w:tab"), qn("w:br"), qn("w:cr"))
+# 段落中承载文字的 run：直接子元素，以及超链接、修订插入、智能标记中的 run
+_RUN_XPATH = "./w:r | ./w:hyperlink/w:r | ./w:ins/w:r | ./w:smartTag/w:r | ./w:fldSimple/w:r"
+_P_TAG = qn("w:p")
+_BODY_TAG = qn("w:body")
+
+DOCX_HEADER_PART = re.compile(r"word/header\d*\.xml$")
+DOCX_FOOTER_PART = re.compile(r"word/footer\d*\.xml$")
+
+
+def is_docx_package(file_path: str) -> bool:
+    if not zipfile.is_zipfile(file_path):
+        return False
+    with zipfile.ZipFile(file_path) as archive:
+        return "word/document.xml" in archive.namelist()
+
+
+def docx_text_parts(names) -> list:
+    """含待翻译段落的部件，顺序与 docx2txt 相同：页眉、正文、页脚"""
+    headers = [name for name in names if DOCX_HEADER_PART.match(name)]
+    footers = [name for name in names if DOCX_FOOTER_PART.match(name)]
+    return headers + ["word/document.xml"] + footers
+
+
+def _iter_part_paragraphs(xml_file, xf=None):
+    """用 iterparse 逐个产出部件中的段落元素；嵌套在段落内的段落（如文本框）不单独产出
+
+    根元素和正文的 w:body 逐层写出，其下的顶层元素（段落、表格等）在解析完后整体写出并释放，
+    内存中只保留当前的一个顶层元素。给定 xf（lxml.etree.xmlfile）时，调用方在继续迭代前
+    对产出的段落所做的修改随所在的顶层元素一起写出。
+    """
+    context = etree.iterparse(xml_file, events=("start", "end"), resolve_entities=False)
+    # 使用 python-docx 的元素类，段落可直接交给 Paragraph / Run 处理
+    context.set_element_class_lookup(element_class_lookup)
+    # 逐层写出的外层元素及其写出上下文
+    wrappers = []
+    paragraph = None
+    for event, elem in context:
+        parent = elem.getparent()
+        if event == "start":
+            if parent is None or (elem.tag == _BODY_TAG and parent.getparent() is None):
+                writer = None
+                if xf is not None:
+                    writer = xf.element(elem.tag, dict(elem.attrib), nsmap=elem.nsmap if parent is None else None)
+                    writer.__enter__()
+                wrappers.append((elem, writer))
+            elif elem.tag == _P_TAG and paragraph is None:
+                paragraph = elem
+            continue
+
+        if elem is paragraph:
+            paragraph = None
+            yield elem
+            if xf is None:
+                elem.clear()
+        if wrappers and elem is wrappers[-1][0]:
+            _, writer = wrappers.pop()
+            if writer is not None:
+                writer.__exit__(None, None, None)
+        elif wrappers and parent is wrappers[-1][0]:
+            # 先从树中摘下再写出：只带上用到的命名空间声明，不重复外层已声明的全部命名空间
+            parent.remove(elem)
+            if xf is not None:
+                xf.write(elem)
+            elem.clear()
+
+
+class DocxSegment:
+    """一个待翻译的段落，记录其中按格式分组的 run，写回时无需重新解析 XML"""
+
+    def __init__(self, location: str, paragraph: Paragraph):
+        self.location = location
+        self.spans = self._group_runs(paragraph)
+
+    @staticmethod
+    def _group_runs(paragraph: Paragraph) -> list:
+        """把格式相同的相邻 run 合为一组，返回 [(runs, text)]，不含文字的 run（如图片）不参与"""
+        spans = []
+        previous_format = None
+        for r in paragraph._p.xpath(_RUN_XPATH):
+            run = Run(r, paragraph)
+            text = run.text
+            if not text:
+                continue
+            run_format = r.rPr.xml if r.rPr is not None else ""
+            if spans and run_format == previous_format:
+                runs, joined = spans[-1]
+                spans[-1] = (runs + [run], joined + text)
+            else:
+                spans.append(([run], text))
+            previous_format = run_format
+        return spans
+
+    @property
+    def text(self) -> str:
+        return "".join(text for _, text in self.spans)
+
+    def encode(self) -> str:
+        """生成送去翻译的单行文本：多个格式片段用 <rN> 标记包裹，换行写作 <br/>"""
+        if len(self.spans) == 1:
+            encoded = self.spans[0][1]
+        else:
+            encoded = "".join(
+                f"<r{number}>{text}</r{number}>"
+                for number, (_, text) in enumerate(self.spans, 1)
+            )
+        return encoded.replace("\n", "<br/>")
+
+    def decode(self, translation: str) -> list:
+        """把译文拆回各格式片段；标记缺失或错乱时整段译文放入第一个片段"""
+        translation = _BR_RE.sub("\n", translation)
+        if len(self.spans) == 1:
+            return [_ANY_TAG_RE.sub("", translation)]
+
+        parts = [""] * len(self.spans)
+        matches = list(_SPAN_RE.finditer(translation))
+        numbers = [int(match.group(1)) for match in matches]
+        if sorted(numbers) != list(range(1, len(self.spans) + 1)):
+            logger.debug(f"{self.location} 的格式标记未能保留，整段写入第一个片段")
+            parts[0] = _ANY_TAG_RE.sub("", translation)
+            return parts
+
+        # 标记之外的文字并入前一个片段（开头的并入紧随其后的片段）
+        position = 0
+        leading = ""
+        previous = None
+        for match in matches:
+            between = _ANY_TAG_RE.sub("", translation[position:match.start()])
+            if previous is None:
+                leading = between
+            else:
+                parts[previous] += between
+            index = int(match.group(1)) - 1
+            parts[index] += _ANY_TAG_RE.sub("", match.group(2))
+            previous = index
+            position = match.end()
+        parts[previous] += _ANY_TAG_RE.sub("", translation[position:])
+        first = int(matches[0].group(1)) - 1
+        parts[first] = leading + parts[first]
+        return parts
+
+    def apply(self, translation: str) -> None:
+        for (runs, _), text in zip(self.spans, self.decode(translation)):
+            _set_run_text(runs[0], text)
+            for run in runs[1:]:
+                _set_run_text(run, "")
+
+
+def _set_run_text(run: Run, text: str) -> None:
+    """只替换 run 中的文字节点，保留格式属性和图片等其他内容"""
+    r = run._r
+    for child in list(r):
+        if child.tag in _TEXT_TAGS:
+            r.remove(child)
+    lines = text.split("\n")
+    for number, line in enumerate(lines):
+        if number:
+            r.add_br()
+        pieces = line.split("\t")
+        for position, piece in enumerate(pieces):
+            if position:
+                r.add_tab()
+            if piece:
+                t = r.add_t(piece)
+                if piece != piece.strip():
+                    t.set(qn("xml:space"), "preserve")
+
+
+class DocxDocument:
+    """保留格式的 DOCX 翻译：依次流式解析页眉、正文（含表格）和页脚中的段落，
+    译文按相同顺序逐段写回原文档的副本，格式、图片和版式保持不变
+
+    读取和写回都逐个顶层元素处理，内存占用不随文档大小增长。文本框、脚注和批注不在处理范围内，保留原文。
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    @staticmethod
+    def _segments(part: str, paragraphs):
+        for element in paragraphs:
+            segment = DocxSegment(part, Paragraph(element, None))
+            if segment.text.strip():
+                yield segment
+
+    def iter_texts(self):
+        """逐段产出送去翻译的文本，空白段落跳过"""
+        with zipfile.ZipFile(self.file_path) as archive:
+            for part in docx_text_parts(archive.namelist()):
+                with archive.open(part) as xml_file:
+                    for segment in self._segments(part, _iter_part_paragraphs(xml_file)):
+                        yield segment.encode()
+
+    def save(self, output_path: str, translations) -> None:
+        """按 iter_texts 的顺序逐段写回译文，值为 None 的段落保留原文；translations 可以是只能遍历一次的迭代器
+
+        含段落的部件逐元素改写，其余部件原样复制。
+        """
+        translations = iter(translations)
+        with zipfile.ZipFile(self.file_path) as source, \
+                zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as target:
+            names = source.namelist()
+            text_parts = docx_text_parts(names)
+            for name in names:
+                if name not in text_parts:
+                    with source.open(name) as src, target.open(_copy_info(source.getinfo(name)), "w") as dst:
+                        shutil.copyfileobj(src, dst)
+            for part in text_parts:
+                with source.open(part) as src, target.open(_copy_info(source.getinfo(part)), "w") as dst:
+                    with etree.xmlfile(dst, encoding="UTF-8") as xf:
+                        xf.write_declaration(standalone=True)
+                        for segment in self._segments(part, _iter_part_paragraphs(src, xf)):
+                            translation = next(translations, None)
+                            if translation:
+                                segment.apply(translation)
+
+
+def _copy_info(info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    copy = zipfile.ZipInfo(info.filename, info.date_time)
+    copy.compress_type = info.compress_type
+    copy.external_attr = info.external_attr
+    copy.file_size = info.file_size
+    return copy
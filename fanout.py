@@ -0,0 +1,58 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def gather_quorum(coros, quorum: int = None, timeout: float = None, grace: float = 0.0) -> list:
+    """并发运行多个协程，容忍部分失败
+
+    每个协程单独计时，超时或抛出异常的位置结果为 None。成功（返回非空值）的数量达到
+    quorum 后，再最多等待 grace 秒让其余协程完成，之后取消仍未完成的协程。
+    quorum 为空时等待全部协程结束。返回与输入同序的结果列表。
+    """
+    tasks = [
+        asyncio.ensure_future(asyncio.wait_for(coro, timeout) if timeout else coro)
+        for coro in coros
+    ]
+    positions = {task: index for index, task in enumerate(tasks)}
+    results = [None] * len(tasks)
+    quorum = len(tasks) if quorum is None else max(1, min(quorum, len(tasks)))
+    loop = asyncio.get_running_loop()
+    pending = set(tasks)
+    succeeded = 0
+    deadline = None
+
+    try:
+        while pending:
+            wait_timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, pending = await asyncio.wait(
+                pending, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for task in done:
+                if task.cancelled():
+                    continue
+                exc = task.exception()
+                if exc is not None:
+                    if isinstance(exc, asyncio.TimeoutError):
+                        logger.warning(f"第 {positions[task] + 1} 个请求超时")
+                    else:
+                        logger.warning(f"第 {positions[task] + 1} 个请求失败: {exc}")
+                    continue
+                result = task.result()
+                if result:
+                    results[positions[task]] = result
+                    succeeded += 1
+            if deadline is None and succeeded >= quorum:
+                if grace <= 0:
+                    break
+                deadline = loop.time() + grace
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    return results
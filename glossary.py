@@ -0,0 +1,291 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from translators.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 拉丁、希腊、西里尔字母和数字按词切分，其余非空白字符（汉字、假名、标点等）逐字切分
+_TOKEN_RE = re.compile(r"[0-9a-zß-öø-ɏͰ-ϿЀ-ӿ]+|\S")
+_ENGLISH_WORD_RE = re.compile(r"[a-z]{3,}")
+# 文本块中的标记：DOCX 的格式片段标记（见 docx_engine）匹配前去掉，段内换行标记 <br/> 视为空白
+_MARKUP_RE = re.compile(r"</?r\d+>")
+_LINE_BREAK_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+_GLOSSARY_ID_RE = re.compile(r"^[0-9a-f]{16}$")
+_HEADER_NAMES = {"source", "src", "term", "source term", "原文", "术语", "源语言"}
+_LEAF = {}
+
+
+def _tokens(text: str) -> list:
+    return _TOKEN_RE.findall(unicodedata.normalize("NFC", text).casefold())
+
+
+def _variants(tokens: list) -> list:
+    """术语本身及末词的英文复数形式（model -> models，policy -> policies）"""
+    variants = [tokens]
+    last = tokens[-1]
+    if _ENGLISH_WORD_RE.fullmatch(last):
+        if last.endswith(("s", "x", "z", "ch", "sh")):
+            plural = last + "es"
+        elif last.endswith("y") and last[-2] not in "aeiou":
+            plural = last[:-1] + "ies"
+        else:
+            plural = last + "s"
+        variants.append(tokens[:-1] + [plural])
+    return variants
+
+
+def parse_glossary(data: bytes, filename: str = "", max_entries: int = None) -> list:
+    """解析术语表文件，返回 [(原文, 译文), ...]
+
+    支持 JSON（{"原文": "译文"} 或 [{"source", "target"}] / [[原文, 译文]]）以及
+    制表符、逗号、分号或等号分隔的文本（CSV/TSV，可带表头，# 开头的行为注释）。
+    """
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = data.decode("gb18030", errors="replace")
+    if filename.lower().endswith(".json") or text.lstrip().startswith(("{", "[")):
+        try:
+            rows = _json_rows(json.loads(text))
+        except ValueError as exc:
+            raise ValueError(f"术语表 JSON 格式错误: {exc}")
+    else:
+        rows = _table_rows(text)
+
+    entries = []
+    for row in rows:
+        if len(row) < 2:
+            continue
+        source, target = str(row[0]).strip(), str(row[1]).strip()
+        if source and target and not source.startswith("#"):
+            entries.append((source, target))
+    if entries and entries[0][0].lower() in _HEADER_NAMES:
+        entries = entries[1:]
+    if not entries:
+        raise ValueError("术语表为空或格式无法识别")
+    max_entries = max_entries or int(os.getenv("ATP_GLOSSARY_MAX_ENTRIES", "200000"))
+    if len(entries) > max_entries:
+        raise ValueError(f"术语表条目过多（{len(entries)}），上限为 {max_entries}")
+    return entries
+
+
+def _json_rows(data) -> list:
+    if isinstance(data, dict):
+        return list(data.items())
+    if not isinstance(data, list):
+        raise ValueError("应为对象或数组")
+    rows = []
+    for item in data:
+        if isinstance(item, dict):
+            rows.append((item.get("source") or item.get("term") or "", item.get("target") or ""))
+        elif isinstance(item, (list, tuple)):
+            rows.append(tuple(item))
+    return rows
+
+
+def _table_rows(text: str) -> list:
+    first_line = next((line for line in text.splitlines() if line.strip() and not line.startswith("#")), "")
+    delimiter = next((d for d in ("\t", ",", ";") if d in first_line), None)
+    if delimiter is None:
+        return [line.split("=", 1) for line in text.splitlines() if "=" in line]
+    return list(csv.reader(io.StringIO(text), delimiter=delimiter))
+
+
+def glossary_digest(entries: list) -> str:
+    raw = json.dumps(entries, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class GlossaryIndex:
+    """术语表的多模式匹配索引（以词为单位的 Aho-Corasick 自动机）
+
+    原文按词（拉丁文字）或逐字（中日文等）切分后建立字典树和失败指针，匹配时对文本块只扫描一遍，
+    耗时与文本长度成正比、与术语条数无关。匹配不区分大小写，拉丁文字按整词匹配，
+    英文术语的复数形式也能命中；重叠时取最靠前、最长的术语。同一原文出现多次时以最后一条为准。
+    """
+
+    def __init__(self, entries: list, glossary_id: str = None):
+        self.glossary_id = glossary_id or glossary_digest(entries)
+        self.entries = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._depth = [0]
+        self._term = [-1]
+        positions = {}
+        for source, target in entries:
+            tokens = _tokens(source)
+            if not tokens:
+                continue
+            key = tuple(tokens)
+            if key in positions:
+                self.entries[positions[key]] = (source, target)
+                continue
+            positions[key] = len(self.entries)
+            self.entries.append((source, target))
+            for variant in _variants(tokens):
+                self._insert(variant, positions[key])
+        self._link()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _insert(self, tokens: list, entry: int) -> None:
+        goto, node = self._goto, 0
+        for token in tokens:
+            children = goto[node]
+            child = children.get(token)
+            if child is None:
+                if children is _LEAF:
+                    children = goto[node] = {}
+                child = children[token] = len(goto)
+                goto.append(_LEAF)
+                self._fail.append(0)
+                self._depth.append(self._depth[node] + 1)
+                self._term.append(-1)
+            node = child
+        if self._term[node] == -1:
+            self._term[node] = entry
+
+    def _link(self) -> None:
+        """按层计算失败指针，以及沿失败链最近的带术语的节点（输出链）"""
+        goto, fail, term = self._goto, self._fail, self._term
+        output = [0] * len(goto)
+        queue = list(goto[0].values())
+        for node in queue:
+            output[node] = node if term[node] != -1 else 0
+        for node in queue:
+            for token, child in goto[node].items():
+                state = fail[node]
+                while state and token not in goto[state]:
+                    state = fail[state]
+                fallback = goto[state].get(token, 0)
+                fail[child] = fallback if fallback != child else 0
+                output[child] = child if term[child] != -1 else output[fail[child]]
+                queue.append(child)
+        self._output = output
+
+    def find(self, text: str) -> list:
+        """返回文本中命中的术语序号，按首次出现的顺序去重"""
+        tokens = _tokens(_LINE_BREAK_RE.sub(" ", _MARKUP_RE.sub("", text)))
+        goto, fail, depth, term, output = self._goto, self._fail, self._depth, self._term, self._output
+        matches = []
+        state = 0
+        for position, token in enumerate(tokens):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            node = output[state]
+            while node:
+                matches.append((position - depth[node] + 1, -depth[node], term[node]))
+                node = output[fail[node]]
+        if not matches:
+            return []
+        matches.sort()
+        found = []
+        seen = set()
+        covered = 0
+        for start, negative_length, entry in matches:
+            if start < covered:
+                continue
+            covered = start - negative_length
+            if entry not in seen:
+                seen.add(entry)
+                found.append(entry)
+        return found
+
+    def match(self, text: str, max_terms: int = None) -> list:
+        """文本块中出现的术语 [(原文, 译文), ...]，最多 max_terms 条"""
+        started = time.perf_counter()
+        found = self.find(text)
+        metrics.observe("atp_glossary_match_seconds", time.perf_counter() - started)
+        if max_terms:
+            found = found[:max_terms]
+        return [self.entries[entry] for entry in found]
+
+
+class GlossaryStore:
+    """保存上传的术语表，并在进程内缓存构建好的索引（按最近使用淘汰）
+
+    术语表以内容摘要为 ID 写入磁盘，多个工作进程可共享；每个进程对同一术语表只构建一次索引。
+    """
+
+    def __init__(self, directory: str = None, max_cached: int = None):
+        self.directory = directory or os.getenv("ATP_GLOSSARY_DIR") or os.path.join(
+            os.getenv("ATP_DATA_DIR", "data"), "glossaries"
+        )
+        self.max_cached = max_cached or int(os.getenv("ATP_GLOSSARY_CACHE", "4"))
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    def _path(self, glossary_id: str) -> str:
+        return os.path.join(self.directory, f"{glossary_id}.json")
+
+    def save(self, entries: list, name: str = "") -> dict:
+        """保存术语表，返回 {"glossary_id", "name", "entries"}；内容相同的术语表共用一个 ID"""
+        glossary_id = glossary_digest(entries)
+        path = self._path(glossary_id)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"name": name, "created_at": time.time(), "entries": entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        return {"glossary_id": glossary_id, "name": name, "entries": len(entries)}
+
+    def info(self, glossary_id: str):
+        """术语表的基本信息，不存在时返回 None"""
+        index = self.get(glossary_id)
+        if index is None:
+            return None
+        return {"glossary_id": glossary_id, "entries": len(index)}
+
+    def get(self, glossary_id: str):
+        """返回术语表的索引，不存在时返回 None；未缓存时读取文件并构建（大术语表需要数百毫秒）"""
+        if not glossary_id or not _GLOSSARY_ID_RE.match(glossary_id):
+            return None
+        with self._lock:
+            index = self._cache.get(glossary_id)
+            if index is not None:
+                self._cache.move_to_end(glossary_id)
+        if index is not None:
+            metrics.inc("atp_cache_lookups_total", cache="glossary", result="hit")
+            return index
+        with self._build_lock:
+            with self._lock:
+                index = self._cache.get(glossary_id)
+            if index is not None:
+                return index
+            try:
+                with open(self._path(glossary_id), encoding="utf-8") as f:
+                    entries = [tuple(entry) for entry in json.load(f)["entries"]]
+            except FileNotFoundError:
+                return None
+            metrics.inc("atp_cache_lookups_total", cache="glossary", result="miss")
+            started = time.perf_counter()
+            index = GlossaryIndex(entries, glossary_id)
+            elapsed = time.perf_counter() - started
+            metrics.observe("atp_glossary_build_seconds", elapsed)
+            logger.info(f"术语表 {glossary_id} 索引构建完成：{len(index)} 条，耗时 {elapsed:.2f} 秒")
+            with self._lock:
+                self._cache[glossary_id] = index
+                while len(self._cache) > self.max_cached:
+                    self._cache.popitem(last=False)
+        return index
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"cached": list(self._cache), "max_cached": self.max_cached}
+
+
+glossary_store = GlossaryStore()
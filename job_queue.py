@@ -0,0 +1,267 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 进度快照写盘的最小间隔（秒），状态变化时总是立即写入
+PROGRESS_SAVE_INTERVAL = 1.0
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class QueueClosedError(RuntimeError):
+    """任务队列已关闭（服务正在关闭），不再接收新任务"""
+
+
+class Job:
+    """一个后台文档翻译任务的状态"""
+
+    def __init__(self, name: str = "", on_change=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.total_chunks = 0
+        self.done_chunks = 0
+        self.output_file = None
+        self.error = None
+        self.result = None
+        self._on_change = on_change
+        self._saved_at = 0.0
+
+    def update_progress(self, done: int, total: int) -> None:
+        self.done_chunks = done
+        self.total_chunks = total
+        self.changed(force=False)
+
+    def changed(self, force: bool = True) -> None:
+        """通知状态变化（用于写入快照），进度更新按 PROGRESS_SAVE_INTERVAL 节流"""
+        if self._on_change is None:
+            return
+        now = time.time()
+        if force or now - self._saved_at >= PROGRESS_SAVE_INTERVAL:
+            self._saved_at = now
+            self._on_change(self)
+
+    def eta_seconds(self):
+        """按已完成块的平均耗时估算剩余时间"""
+        if self.status != "running" or not self.started_at:
+            return None
+        if not self.total_chunks or not self.done_chunks:
+            return None
+        elapsed = time.time() - self.started_at
+        remaining = self.total_chunks - self.done_chunks
+        return round(elapsed / self.done_chunks * remaining, 1)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "total_chunks": self.total_chunks,
+            "done_chunks": self.done_chunks,
+            "eta_seconds": self.eta_seconds(),
+            "output_file": self.output_file,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Job":
+        job = cls(data.get("name", ""))
+        job.id = data["job_id"]
+        for field in ("status", "total_chunks", "done_chunks", "output_file", "error", "result",
+                      "created_at", "started_at", "finished_at"):
+            setattr(job, field, data.get(field))
+        return job
+
+
+class JobQueue:
+    """在后台事件循环中运行文档翻译任务，同时运行的任务数有上限
+
+    任务状态同时以 JSON 快照写入 state_dir，多进程部署时任一工作进程都能查询其他进程的任务。
+
+    参数:
+        max_concurrent: 同时运行的任务数上限
+        max_history: 保留的已结束任务数量，超出后淘汰最早的记录
+        state_dir: 任务快照目录，为空字符串时不写快照
+    """
+
+    def __init__(self, max_concurrent: int = None, max_history: int = None, state_dir: str = None):
+        self.max_concurrent = (
+            max_concurrent if max_concurrent is not None
+            else int(os.getenv("ATP_MAX_CONCURRENT_JOBS", "2"))
+        )
+        self.max_history = (
+            max_history if max_history is not None
+            else int(os.getenv("ATP_JOB_HISTORY", "200"))
+        )
+        self.state_dir = (
+            state_dir if state_dir is not None
+            else os.getenv("ATP_JOBS_DIR") or os.path.join(os.getenv("ATP_DATA_DIR", "data"), "jobs")
+        )
+        self.closed = False
+        self._jobs = OrderedDict()
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(max(1, self.max_concurrent))
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="atp-jobs",
+                    daemon=True,
+                )
+                self._thread.start()
+            return self._loop
+
+    def submit(self, runner, name: str = "") -> Job:
+        """提交任务，runner 为接收 Job 的异步函数，返回结果字典"""
+        if self.closed:
+            raise QueueClosedError("任务队列已关闭")
+        loop = self._ensure_loop()
+        job = Job(name, on_change=self._save)
+        with self._lock:
+            # 关闭检查和登记在同一把锁内：shutdown 之后提交的任务被拒绝，之前的都在其等待列表中
+            if self.closed:
+                raise QueueClosedError("任务队列已关闭")
+            self._jobs[job.id] = job
+            self._prune()
+            job.changed()
+            future = asyncio.run_coroutine_threadsafe(self._run(job, runner), loop)
+            self._futures[future] = job
+        future.add_done_callback(self._forget)
+        logger.info(f"任务已排队: {job.id} ({name})")
+        return job
+
+    def _forget(self, future) -> None:
+        with self._lock:
+            self._futures.pop(future, None)
+
+    async def _run(self, job: Job, runner) -> None:
+        try:
+            await self._run_limited(job, runner)
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = "服务关闭，任务已中断"
+            job.finished_at = time.time()
+            job.changed()
+            logger.warning(f"任务被中断: {job.id}")
+            raise
+
+    async def _run_limited(self, job: Job, runner) -> None:
+        async with self._semaphore:
+            job.status = "running"
+            job.started_at = time.time()
+            job.changed()
+            logger.info(f"任务开始: {job.id}")
+            try:
+                result = await runner(job)
+            except Exception as exc:
+                logger.error(f"任务执行出错: {job.id}: {exc}")
+                logger.error(traceback.format_exc())
+                result = {"error": f"处理失败: {exc}"}
+            job.result = result
+            job.finished_at = time.time()
+            if result.get("error"):
+                job.status = "failed"
+                job.error = result["error"]
+            else:
+                job.status = "completed"
+                job.output_file = result.get("output_file")
+            job.changed()
+            logger.info(f"任务结束: {job.id}, 状态: {job.status}")
+
+    def get(self, job_id: str) -> Job:
+        """查询任务，本进程没有时从快照读取（由其他工作进程提交的任务）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or not self.state_dir or not _JOB_ID_RE.match(job_id):
+            return job
+        try:
+            with open(self._snapshot_path(job_id), encoding="utf-8") as f:
+                return Job.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def pending(self) -> int:
+        """排队和运行中的任务数"""
+        with self._lock:
+            return len(self._futures)
+
+    def shutdown(self, timeout: float = None) -> bool:
+        """停止接收新任务，等待排队和运行中的任务结束；超时后取消剩余任务（标记为失败）
+
+        返回是否所有任务都在超时前正常结束。
+        """
+        with self._lock:
+            self.closed = True
+            futures = dict(self._futures)
+        if futures:
+            logger.info(f"等待 {len(futures)} 个任务结束" + (f"（最多 {timeout:.0f} 秒）" if timeout else ""))
+        _, pending = concurrent.futures.wait(futures, timeout=timeout)
+        if pending:
+            logger.warning(f"{len(pending)} 个任务未能在关闭前完成，已中断")
+            for future in pending:
+                future.cancel()
+            # 等待被取消的任务写入失败状态
+            deadline = time.time() + 5
+            while time.time() < deadline and not all(futures[future].finished for future in pending):
+                time.sleep(0.05)
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(loop.stop)
+        return not pending
+
+    def _snapshot_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _save(self, job: Job) -> None:
+        if not self.state_dir:
+            return
+        path = self._snapshot_path(job.id)
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(job.to_dict(), f, ensure_ascii=False, default=str)
+            os.replace(temp_path, path)
+        except OSError as exc:
+            logger.warning(f"写入任务快照失败: {job.id}: {exc}")
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+            if self.state_dir:
+                try:
+                    os.remove(self._snapshot_path(job_id))
+                except OSError:
+                    pass
+
+
+job_queue = JobQueue()
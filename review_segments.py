@@ -0,0 +1,180 @@
+import json
+import os
+import re
+
+from translators.tokenizer import count_tokens
+
+# 双阶段译审按原文 token 数分段，超过一段时逐段扫描、只校准有错误的段
+SEGMENT_TOKENS = int(os.getenv("ATP_REVIEW_SEGMENT_TOKENS", "1500"))
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+
+
+_LINE_RE = re.compile(r"[^\n]+")
+
+
+def _paragraphs(text: str) -> list:
+    return [line.strip() for line in text.split("\n") if line.strip()]
+
+
+def _paragraph_spans(text: str) -> list:
+    """每个非空段落（去掉首尾空白）在原文本中的 (起始, 结束) 位置，与 _paragraphs 一一对应"""
+    spans = []
+    for match in _LINE_RE.finditer(text):
+        line = match.group()
+        stripped = line.strip()
+        if stripped:
+            start = match.start() + len(line) - len(line.lstrip())
+            spans.append((start, start + len(stripped)))
+    return spans
+
+
+def _group_by_tokens(paragraphs: list, max_tokens: int) -> list:
+    """按 token 上限把段落下标分组，返回每组的 (起始下标, 结束下标)"""
+    groups = []
+    start = 0
+    tokens = 0
+    for index, paragraph in enumerate(paragraphs):
+        size = count_tokens(paragraph)
+        if index > start and tokens + size > max_tokens:
+            groups.append((start, index))
+            start, tokens = index, 0
+        tokens += size
+    if start < len(paragraphs):
+        groups.append((start, len(paragraphs)))
+    return groups
+
+
+def _proportional_cuts(source_paragraphs: list, target_paragraphs: list, groups: list) -> list:
+    """段落数不一致时，按累计字符比例在译文中找到与原文分组边界最接近的位置"""
+    source_total = sum(len(p) for p in source_paragraphs) or 1
+    target_sizes = [len(p) for p in target_paragraphs]
+    target_total = sum(target_sizes) or 1
+    target_cumulative = []
+    running = 0
+    for size in target_sizes:
+        running += size
+        target_cumulative.append(running / target_total)
+
+    cuts = []
+    previous = 0
+    for _, end in groups[:-1]:
+        fraction = sum(len(p) for p in source_paragraphs[:end]) / source_total
+        cut = min(
+            range(previous + 1, len(target_paragraphs) + 1),
+            key=lambda i: abs(target_cumulative[i - 1] - fraction),
+            default=previous,
+        )
+        cut = min(cut, len(target_paragraphs))
+        cuts.append(cut)
+        previous = cut
+    cuts.append(len(target_paragraphs))
+    return cuts
+
+
+def align_segments(source_text: str, target_text: str, max_tokens: int = None) -> list:
+    """把原文和译文切成对齐的片段
+
+    段落数相同时逐段对齐，否则按篇幅比例对齐。返回字典列表：
+    {"source", "target", "offset"}，target 直接截取自完整译文，offset 为其起始位置，用于换算错误索引。
+    """
+    max_tokens = max_tokens or SEGMENT_TOKENS
+    source_paragraphs = _paragraphs(source_text)
+    target_paragraphs = _paragraphs(target_text)
+    groups = _group_by_tokens(source_paragraphs, max_tokens)
+    if len(groups) <= 1 or not target_paragraphs:
+        return [{"source": source_text, "target": target_text, "offset": 0}]
+
+    if len(source_paragraphs) == len(target_paragraphs):
+        target_ends = [end for _, end in groups]
+    else:
+        target_ends = _proportional_cuts(source_paragraphs, target_paragraphs, groups)
+
+    target_spans = _paragraph_spans(target_text)
+    segments = []
+    target_start = 0
+    for (source_start, source_end), target_end in zip(groups, target_ends):
+        # 片段译文与 offset 取自同一字符串，片段内的索引加上 offset 即为完整译文中的索引
+        if target_end > target_start:
+            offset = target_spans[target_start][0]
+            target = target_text[offset:target_spans[target_end - 1][1]]
+        else:
+            offset, target = 0, ""
+        segments.append({
+            "source": "\n".join(source_paragraphs[source_start:source_end]),
+            "target": target,
+            "offset": offset,
+        })
+        target_start = target_end
+    # 译文段落被分得过少时，后面的片段可能没有译文，只保留有内容的片段
+    return [segment for segment in segments if segment["target"]] or [
+        {"source": source_text, "target": target_text, "offset": 0}
+    ]
+
+
+def parse_json_output(text):
+    """解析模型输出的 JSON，容忍代码块标记和前后的说明文字，无法解析时返回 None"""
+    if not text:
+        return None
+    cleaned = _FENCE_RE.sub("", text.strip())
+    try:
+        return json.loads(cleaned)
+    except ValueError:
+        pass
+    for opening, closing in (("[", "]"), ("{", "}")):
+        start, end = cleaned.find(opening), cleaned.rfind(closing)
+        if 0 <= start < end:
+            try:
+                return json.loads(cleaned[start:end + 1])
+            except ValueError:
+                continue
+    return None
+
+
+def shift_errors(errors, offset: int) -> list:
+    """把片段内的错误索引换算为完整译文中的索引"""
+    shifted = []
+    for error in errors or []:
+        if not isinstance(error, dict):
+            continue
+        error = dict(error)
+        if isinstance(error.get("index"), int):
+            error["index"] += offset
+        shifted.append(error)
+    return shifted
+
+
+def merge_calibrations(results: list) -> dict:
+    """合并各片段的校准结果，格式与整篇校准的 JSON 对象相同
+
+    results 为 {"segment", "flagged", "scan_errors", "calibration"} 列表，segment 从 1 开始编号；
+    初筛未发现错误的片段 flagged 为 False，calibration 为 None。
+    """
+    errors = []
+    summaries = []
+    consistency_notes = []
+    suggestions = []
+    flagged = 0
+    for result in results:
+        number = result["segment"]
+        if result["flagged"]:
+            flagged += 1
+        calibration = result["calibration"]
+        if calibration is None:
+            continue
+        errors.extend(calibration.get("errors") or [])
+        for field, collected in (("summary", summaries),
+                                 ("consistency_notes", consistency_notes),
+                                 ("final_suggestion", suggestions)):
+            value = calibration.get(field)
+            if value:
+                collected.append(f"第{number}段：{value}")
+
+    overview = f"共 {len(results)} 段，初筛在 {flagged} 段发现问题，校准确认 {len(errors)} 处错误。"
+    errors.sort(key=lambda error: error.get("index") if isinstance(error.get("index"), int) else 0)
+    return {
+        "summary": "\n".join([overview] + summaries),
+        "errors": errors,
+        "consistency_notes": "\n".join(consistency_notes),
+        "final_suggestion": "\n".join(suggestions),
+    }
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from translators.memory import normalize_segment
+
+logger = logging.getLogger(__name__)
+
+
+def paragraph_fingerprint(paragraph: str) -> str:
+    """段落指纹：规范化空白后的 SHA-1 前 16 位"""
+    normalized = normalize_segment(paragraph)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def translation_config_key(model, source_lang, target_lang, system_prompt, user_prompt, temperature,
+                           glossary_id=None) -> str:
+    """只有翻译配置完全一致（含所用术语表）时，旧版本的译文才能复用"""
+    parts = [
+        model or "",
+        source_lang or "",
+        target_lang or "",
+        normalize_segment(system_prompt),
+        normalize_segment(user_prompt),
+        round(float(temperature or 0.0), 3),
+    ]
+    if glossary_id:
+        # 不用术语表时键与之前保持一致，已有的版本记录仍可复用
+        parts.append(glossary_id)
+    raw = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def plan_revision(paragraphs, fingerprints, previous_segments):
+    """对照上一版本的段落译文，生成本次的段落分组
+
+    返回段落组列表，每组为 {"fps", "paragraphs", "translation"}；
+    translation 为 None 的组是新增或修改过的连续段落，需要重新翻译。
+    """
+    by_first = {}
+    for segment in previous_segments or []:
+        fps = segment.get("fps") or []
+        if fps and segment.get("translation"):
+            by_first.setdefault(fps[0], []).append(segment)
+
+    plan = []
+    pending_fps, pending_paragraphs = [], []
+
+    def flush_pending():
+        if pending_paragraphs:
+            plan.append({
+                "fps": list(pending_fps),
+                "paragraphs": list(pending_paragraphs),
+                "translation": None,
+            })
+            pending_fps.clear()
+            pending_paragraphs.clear()
+
+    index = 0
+    total = len(paragraphs)
+    while index < total:
+        match = None
+        for segment in by_first.get(fingerprints[index], []):
+            length = len(segment["fps"])
+            if fingerprints[index:index + length] == segment["fps"]:
+                if match is None or length > len(match["fps"]):
+                    match = segment
+        if match is None:
+            pending_fps.append(fingerprints[index])
+            pending_paragraphs.append(paragraphs[index])
+            index += 1
+            continue
+        flush_pending()
+        length = len(match["fps"])
+        plan.append({
+            "fps": list(match["fps"]),
+            "paragraphs": paragraphs[index:index + length],
+            "translation": match["translation"],
+        })
+        index += length
+    flush_pending()
+    return plan
+
+
+def translation_lines(translation: str) -> list:
+    """译文按行拆分，忽略空行"""
+    return [line.strip() for line in (translation or "").split("\n") if line.strip()]
+
+
+def split_segment(segment):
+    """译文行数与原文段落数一致时拆成逐段记录，便于下次按段复用"""
+    fps = segment["fps"]
+    translation = segment.get("translation") or ""
+    if len(fps) > 1:
+        lines = translation_lines(translation)
+        if len(lines) == len(fps):
+            return [{"fps": [fp], "translation": line} for fp, line in zip(fps, lines)]
+    return [{"fps": list(fps), "translation": translation}]
+
+
+class RevisionStore:
+    """记录每次文档翻译的段落指纹与译文，用于识别同一文档的新修订版"""
+
+    def __init__(self, path: str = None, min_overlap: float = None, max_documents: int = None):
+        data_dir = os.getenv("ATP_DATA_DIR", "data")
+        self.path = path or os.path.join(data_dir, "revisions.sqlite3")
+        self.min_overlap = (
+            min_overlap if min_overlap is not None
+            else float(os.getenv("ATP_REVISION_MIN_OVERLAP", "0.3"))
+        )
+        self.max_documents = (
+            max_documents if max_documents is not None
+            else int(os.getenv("ATP_REVISION_MAX_DOCS", "500"))
+        )
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    config_key TEXT NOT NULL,
+                    source_name TEXT,
+                    output_file TEXT,
+                    segments TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS paragraphs (
+                    doc_id INTEGER NOT NULL,
+                    fingerprint TEXT NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_paragraphs_fp ON paragraphs(fingerprint)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_paragraphs_doc ON paragraphs(doc_id)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def find_previous(self, config_key: str, fingerprints) -> dict:
+        """找到段落重合度最高的旧版本，重合度不足时返回 None"""
+        unique = list(dict.fromkeys(fingerprints))
+        if not unique:
+            return None
+        shared = Counter()
+        try:
+            with self._lock:
+                conn = self._connect()
+                for start in range(0, len(unique), 500):
+                    batch = unique[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = conn.execute(
+                        f"SELECT p.doc_id, COUNT(*) FROM paragraphs p "
+                        f"JOIN documents d ON d.id = p.doc_id "
+                        f"WHERE d.config_key = ? AND p.fingerprint IN ({placeholders}) "
+                        f"GROUP BY p.doc_id",
+                        [config_key, *batch],
+                    ).fetchall()
+                    for doc_id, count in rows:
+                        shared[doc_id] += count
+                if not shared:
+                    return None
+                # 重合度相同时取最新的版本
+                doc_id, count = max(shared.items(), key=lambda item: (item[1], item[0]))
+                overlap = count / len(unique)
+                if overlap < self.min_overlap:
+                    return None
+                row = conn.execute(
+                    "SELECT id, source_name, output_file, segments FROM documents WHERE id = ?",
+                    (doc_id,),
+                ).fetchone()
+        except sqlite3.Error as exc:
+            logger.error("读取修订记录失败: %s", exc)
+            return None
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "source_name": row[1],
+            "output_file": row[2],
+            "segments": json.loads(row[3]),
+            "overlap": round(overlap, 4),
+        }
+
+    def save(self, config_key: str, source_name: str, output_file: str, segments) -> None:
+        """segments 可以是只能遍历一次的迭代器（如从临时文件逐条读出）"""
+        fingerprints = set()
+
+        def encoded():
+            for segment in segments:
+                fingerprints.update(segment["fps"])
+                yield json.dumps(segment, ensure_ascii=False)
+
+        payload = "[" + ",".join(encoded()) + "]"
+        try:
+            with self._lock:
+                conn = self._connect()
+                cursor = conn.execute(
+                    "INSERT INTO documents (config_key, source_name, output_file, segments, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (config_key, source_name, output_file, payload, time.time()),
+                )
+                doc_id = cursor.lastrowid
+                conn.executemany(
+                    "INSERT INTO paragraphs (doc_id, fingerprint) VALUES (?, ?)",
+                    [(doc_id, fp) for fp in fingerprints],
+                )
+                self._prune(conn)
+                conn.commit()
+        except sqlite3.Error as exc:
+            logger.error("写入修订记录失败: %s", exc)
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        stale = conn.execute(
+            "SELECT id FROM documents ORDER BY id DESC LIMIT -1 OFFSET ?",
+            (self.max_documents,),
+        ).fetchall()
+        if stale:
+            conn.executemany("DELETE FROM paragraphs WHERE doc_id = ?", stale)
+            conn.executemany("DELETE FROM documents WHERE id = ?", stale)
+
+
+revision_store = RevisionStore()
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+from flask import Flask, Response
+
+import asgi
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route("/thread")
+    def thread_name():
+        return threading.current_thread().name
+
+    @app.route("/stream")
+    def stream():
+        return Response((f"data: {i}\n\n" for i in range(3)), mimetype="text/event-stream")
+
+    @app.route("/echo", methods=["POST"])
+    def echo():
+        from flask import request
+        return request.get_data()
+
+    return app
+
+
+async def call(application, path, method="GET", body=b""):
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"",
+             "headers": [(b"content-length", str(len(body)).encode())], "http_version": "1.1"}
+    await application(scope, receive, send)
+    return sent[0]["status"], [m.get("body", b"") for m in sent[1:]]
+
+
+def test_stream_is_sent_chunk_by_chunk():
+    application = asgi.ASGIApplication(make_app)
+    status, chunks = asyncio.run(call(application, "/stream"))
+    assert status == 200
+    assert [chunk for chunk in chunks if chunk] == [b"data: 0\n\n", b"data: 1\n\n", b"data: 2\n\n"]
+
+
+def test_request_body_is_passed_through():
+    application = asgi.ASGIApplication(make_app)
+    status, chunks = asyncio.run(call(application, "/echo", method="POST", body=b"hello"))
+    assert (status, b"".join(chunks)) == (200, b"hello")
+
+
+def test_requests_run_in_separate_threads():
+    application = asgi.ASGIApplication(make_app)
+
+    async def run_both():
+        return await asyncio.gather(call(application, "/thread"), call(application, "/thread"))
+
+    (_, first), (_, second) = asyncio.run(run_both())
+    assert b"".join(first) != b"".join(second)
+
+
+def test_lifespan_shutdown_drains_jobs(monkeypatch):
+    calls = []
+    monkeypatch.setattr(asgi.job_queue, "shutdown", lambda timeout: calls.append(("jobs", timeout)))
+    monkeypatch.setattr(asgi.http_client, "close", lambda: calls.append(("http",)))
+    application = asgi.ASGIApplication(make_app, shutdown_timeout=5)
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(application({"type": "lifespan"}, receive, send))
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert calls == [("jobs", 5), ("http",)]
@@ -0,0 +1,45 @@
+import os
+import zipfile
+
+import pytest
+
+from batch import bundle_outputs, extract_archive
+
+
+def make_archive(path, files):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def test_extract_flattens_directories_and_skips_other_files(tmp_path):
+    archive = make_archive(tmp_path / "in.zip", {
+        "a/doc.txt": "one",
+        "b/doc.txt": "two",
+        "../escape.txt": "three",
+        ".hidden.txt": "skip",
+        "image.png": "skip",
+    })
+    dest = tmp_path / "out"
+    dest.mkdir()
+    extracted = extract_archive(archive, str(dest), "job", {"txt"}, max_files=10, max_bytes=1024)
+    assert [name for name, _ in extracted] == ["a_doc.txt", "b_doc.txt", "escape.txt"]
+    assert all(os.path.dirname(path) == str(dest) for _, path in extracted)
+    assert open(extracted[1][1]).read() == "two"
+
+
+def test_extract_rejects_too_many_or_too_large_documents(tmp_path):
+    archive = make_archive(tmp_path / "in.zip", {"a.txt": "x" * 600, "b.txt": "y" * 600})
+    with pytest.raises(ValueError):
+        extract_archive(archive, str(tmp_path), "job", {"txt"}, max_files=1, max_bytes=10_000)
+    with pytest.raises(ValueError):
+        extract_archive(archive, str(tmp_path), "job", {"txt"}, max_files=10, max_bytes=1000)
+
+
+def test_bundle_renames_duplicate_entries(tmp_path):
+    source = tmp_path / "result.txt"
+    source.write_text("译文", encoding="utf-8")
+    bundle = str(tmp_path / "out.zip")
+    assert bundle_outputs([("doc.txt", str(source)), ("doc.txt", str(source))], bundle) == 2
+    assert sorted(zipfile.ZipFile(bundle).namelist()) == ["doc.txt", "doc_2.txt"]
@@ -0,0 +1,60 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from bench.benchmark import compare_with_baseline, parse_size, percentile
+from bench.stub_server import StubOptions, start_in_thread
+
+
+def post(server, payload):
+    request = urllib.request.Request(f"{server.base_url}/chat/completions", json.dumps(payload).encode(),
+                                     {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(**options):
+        stub = start_in_thread(StubOptions(latency=0, jitter=0, seed=1, **options))
+        servers.append(stub)
+        return stub
+
+    yield start
+    for stub in servers:
+        stub.shutdown()
+        stub.server_close()
+
+
+def test_stub_echoes_the_text_and_truncates_at_max_tokens(server):
+    stub = server()
+    text = "请将以下内容翻译为中文：\n\nHello world, this is a test."
+    reply = post(stub, {"model": "m", "messages": [{"role": "user", "content": text}]})
+    assert reply["choices"][0]["message"]["content"] == "Hello world, this is a test."
+    assert reply["choices"][0]["finish_reason"] == "stop"
+    truncated = post(stub, {"model": "m", "max_tokens": 2, "messages": [{"role": "user", "content": text}]})
+    assert truncated["choices"][0]["finish_reason"] == "length"
+
+
+def test_stub_throttles_with_retry_after(server):
+    stub = server(throttle_rate=1.0)
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post(stub, {"model": "m", "messages": [{"role": "user", "content": "x"}]})
+    assert error.value.code == 429
+    assert error.value.headers["Retry-After"] == "1"
+
+
+def test_report_helpers():
+    assert parse_size("1.5KB") == 1536
+    assert parse_size("10MB") == 10 * 1024 ** 2
+    assert percentile([5, 1, 4, 2, 3], 0.95) == 5
+    assert percentile([], 0.5) is None
+    baseline = [{"scenario": "upload", "p95": 1.0, "throughput_rps": 10, "peak_rss_mb": 100}]
+    assert compare_with_baseline([{"scenario": "upload", "p95": 1.05, "throughput_rps": 9.5,
+                                   "peak_rss_mb": 105}], baseline, 0.1) == []
+    assert len(compare_with_baseline([{"scenario": "upload", "p95": 2.0, "throughput_rps": 5,
+                                       "peak_rss_mb": 300}], baseline, 0.1)) == 3
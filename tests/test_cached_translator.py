@@ -0,0 +1,41 @@
+import asyncio
+
+from translators.base import BaseTranslator
+from translators.cached import CachedTranslator
+from translators.memory import TranslationMemory, make_memory_key
+
+
+class CountingTranslator(BaseTranslator):
+    def __init__(self):
+        super().__init__("test-key")
+        self.calls = 0
+
+    def translate(self, text, **kwargs):
+        raise NotImplementedError
+
+    async def translate_detailed(self, text, **kwargs):
+        self.calls += 1
+        return {"text": "A complete translated sentence.", "finish_reason": "stop", "usage": None}
+
+
+def test_memory_key_ignores_context_when_memory_prompts_given(tmp_path):
+    inner = CountingTranslator()
+    translator = CachedTranslator(inner, TranslationMemory(path=str(tmp_path / "tm.sqlite3"), enabled=True))
+    text = "A complete source sentence."
+
+    async def translate(context):
+        return await translator.translate_detailed(
+            text, model="m", system_prompt="system", user_prompt=f"{context}\n\n{text}",
+            memory_prompts=("system", text),
+        )
+
+    asyncio.run(translate("context one"))
+    result = asyncio.run(translate("context two"))
+    assert inner.calls == 1
+    assert result["text"] == "A complete translated sentence."
+
+
+def test_memory_key_keeps_line_breaks_but_folds_inline_spaces():
+    key = lambda text: make_memory_key(text, "m", "en", "zh")
+    assert key("A\nB") != key("A B")
+    assert key("A  \t B\r\n C") == key("A B\nC")
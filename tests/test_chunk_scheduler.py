@@ -0,0 +1,169 @@
+import asyncio
+
+from chunk_scheduler import ChunkScheduler, KeyedLimiter, TruncationStats
+
+
+def make_scheduler(translate_fn, **kwargs):
+    return ChunkScheduler(translate_fn, limiter_key="test-key", limiter=KeyedLimiter(),
+                          stats=TruncationStats(), retry_delay=0, **kwargs)
+
+
+def scripted(responses):
+    """按顺序返回预设结果的翻译函数，记录每次调用的 continuation"""
+    calls = []
+
+    async def translate(text, continuation=None, **kwargs):
+        calls.append(continuation)
+        return responses[len(calls) - 1]
+
+    return translate, calls
+
+
+def test_continuation_keeps_newline_at_truncation_point():
+    translate, calls = scripted([
+        {"text": "第一段。", "raw_text": "第一段。\n", "finish_reason": "length"},
+        {"text": "第二段。", "raw_text": "第二段。", "finish_reason": "stop"},
+    ])
+    result = asyncio.run(make_scheduler(translate).run([("", "First.\nSecond.")]))
+    assert result == ["第一段。\n第二段。"]
+    assert calls == [None, "第一段。\n"]
+
+
+def test_continuation_keeps_space_between_words():
+    translate, _ = scripted([
+        {"text": "The quick", "raw_text": "The quick ", "finish_reason": "length"},
+        {"text": "brown fox.", "raw_text": "brown fox.", "finish_reason": "stop"},
+    ])
+    result = asyncio.run(make_scheduler(translate).run([("", "quick brown fox")]))
+    assert result == ["The quick brown fox."]
+
+
+def test_continuation_prefers_the_newline_when_both_sides_have_whitespace():
+    translate, _ = scripted([
+        {"text": "Line one.", "raw_text": "Line one. ", "finish_reason": "length"},
+        {"text": "Line two.", "raw_text": "\nLine two.\n", "finish_reason": "stop"},
+    ])
+    result = asyncio.run(make_scheduler(translate).run([("", "one\ntwo")]))
+    assert result == ["Line one.\nLine two."]
+
+
+def test_recovered_translation_reports_the_producing_model():
+    recovered = []
+    translate, _ = scripted([
+        {"text": "Part one", "raw_text": "Part one ", "finish_reason": "length", "model": "primary"},
+        {"text": "part two.", "raw_text": "part two.", "finish_reason": "stop", "model": "fallback"},
+        {"text": "Part one", "raw_text": "Part one ", "finish_reason": "length", "model": "primary"},
+        {"text": "part two.", "raw_text": "part two.", "finish_reason": "stop", "model": "primary"},
+    ])
+    scheduler = make_scheduler(
+        translate, model="primary",
+        on_recovered=lambda source, translation, translated_by=None: recovered.append(translated_by),
+    )
+    asyncio.run(scheduler.run([("", "one two")]))
+    asyncio.run(scheduler.run([("", "one two")]))
+    assert recovered == [None, "primary"]
+
+
+def test_full_context_uses_the_given_translation_of_a_reused_segment():
+    contexts = []
+
+    async def translate(text, context=None, **kwargs):
+        contexts.append((text, context))
+        return {"text": f"T({text})", "finish_reason": "stop"}
+
+    async def chunks():
+        yield "", "one"
+        # 中间隔着复用旧译文的段落
+        yield "reused", "two", "旧译文"
+
+    scheduler = make_scheduler(translate, context_mode="full")
+    assert asyncio.run(scheduler.run_stream(chunks())) == ["T(one)", "T(two)"]
+    assert contexts[1] == ("two", {"source": "reused", "translation": "旧译文"})
+
+
+def test_run_keeps_chunk_order_when_later_chunks_finish_first():
+    async def translate(text, **kwargs):
+        await asyncio.sleep(0.01 * (5 - int(text)))
+        return f"T{text}"
+
+    chunks = [("", str(index)) for index in range(5)]
+    assert asyncio.run(make_scheduler(translate).run(chunks)) == [f"T{index}" for index in range(5)]
+
+
+def test_incomplete_translation_is_split_and_joined():
+    recovered = []
+
+    async def translate(text, **kwargs):
+        return {"text": text.upper(), "finish_reason": "stop"}
+
+    scheduler = make_scheduler(
+        translate,
+        is_complete=lambda source, translation: "\n" not in source,
+        split_fn=lambda text: (text.split("\n"), "\n"),
+        on_recovered=lambda source, translation, translated_by=None: recovered.append(translation),
+    )
+    assert asyncio.run(scheduler.run([("", "one\ntwo")])) == ["ONE\nTWO"]
+    assert recovered == ["ONE\nTWO"]
+
+
+def test_stream_limits_chunks_started_ahead_of_the_consumer():
+    pulled = 0
+    gaps = []
+
+    async def translate(text, **kwargs):
+        return text
+
+    async def chunks():
+        nonlocal pulled
+        for index in range(10):
+            pulled += 1
+            yield "", str(index)
+
+    async def consume():
+        results = []
+        async for result in make_scheduler(translate, max_pending=2).stream(chunks()):
+            gaps.append(pulled - len(results))
+            results.append(result)
+            await asyncio.sleep(0.01)
+        return results
+
+    assert asyncio.run(consume()) == [str(index) for index in range(10)]
+    assert max(gaps) <= 2
+
+
+def test_limiter_alternates_between_flows():
+    async def scenario():
+        limiter = KeyedLimiter()
+        order = []
+        await limiter.acquire("key", 1)
+
+        async def job(flow, name):
+            await limiter.acquire("key", 1, flow=flow)
+            order.append(name)
+            await asyncio.sleep(0)
+            limiter.release("key")
+
+        tasks = [asyncio.ensure_future(job("big", f"big{i}")) for i in range(3)]
+        tasks.append(asyncio.ensure_future(job("small", "small0")))
+        await asyncio.sleep(0)
+        limiter.release("key")
+        await asyncio.gather(*tasks)
+        return order, limiter.inflight("key")
+
+    order, inflight = asyncio.run(scenario())
+    assert order == ["big0", "small0", "big1", "big2"]
+    assert inflight == 0
+
+
+def test_limiter_cancelled_waiter_does_not_keep_a_slot():
+    async def scenario():
+        limiter = KeyedLimiter()
+        await limiter.acquire("key", 1)
+        waiter = asyncio.ensure_future(limiter.acquire("key", 1))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release("key")
+        return limiter.inflight("key"), limiter.waiting("key")
+
+    assert asyncio.run(scenario()) == (0, 0)
@@ -0,0 +1,57 @@
+import asyncio
+
+import classifier
+from classifier import VerdictCache, prefilter
+
+PROSE = (
+    "The committee reviewed the quarterly figures in detail. Revenue rose slightly "
+    "while operating costs remained stable across all regions."
+)
+
+
+def text_payload(text, source_lang="英文"):
+    return {"mode": "text", "user_text": text, "source_lang": source_lang, "target_lang": "中文"}
+
+
+def test_prefilter_allows_documents_and_plain_prose():
+    assert prefilter({"mode": "document"}) is True
+    assert prefilter(text_payload(PROSE)) is True
+
+
+def test_prefilter_leaves_instructions_questions_and_short_text_to_the_model():
+    assert prefilter(text_payload("Rising revenue.")) is None
+    assert prefilter(text_payload(PROSE + " Could it last?")) is None
+    assert prefilter(text_payload("Write a story about " + PROSE)) is None
+    assert prefilter(text_payload(PROSE, source_lang="中文")) is None
+
+
+def test_verdict_cache_evicts_least_recently_used_and_expires():
+    cache = VerdictCache(max_entries=2, ttl=60)
+    cache.put("a", True)
+    cache.put("b", False)
+    assert cache.get("a") is True
+    cache.put("c", True)
+    assert cache.get("b") is None
+    assert cache.get("c") is True
+
+    expired = VerdictCache(max_entries=2, ttl=-1)
+    expired.put("a", True)
+    assert expired.get("a") is None
+    assert len(expired) == 0
+
+
+def test_model_verdict_is_cached_but_failures_are_not(monkeypatch):
+    verdicts = [None, False]
+    calls = []
+
+    async def classify_with_model(api_key, payload):
+        calls.append(payload)
+        return verdicts[len(calls) - 1]
+
+    monkeypatch.setattr(classifier, "classify_with_model", classify_with_model)
+    monkeypatch.setattr(classifier, "verdict_cache", VerdictCache(max_entries=8, ttl=60))
+    payload = text_payload("Tell me a joke.")
+    assert asyncio.run(classifier.classify_translation_request("key", payload)) is False
+    assert asyncio.run(classifier.classify_translation_request("key", payload)) is False
+    assert asyncio.run(classifier.classify_translation_request("key", payload)) is False
+    assert len(calls) == 2
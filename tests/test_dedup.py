@@ -0,0 +1,64 @@
+import asyncio
+
+import main
+from dedup import SegmentDeduplicator
+from revision_store import RevisionStore, paragraph_fingerprint
+
+
+def make_segment(*paragraphs):
+    return {"fps": [paragraph_fingerprint(p) for p in paragraphs], "paragraphs": list(paragraphs),
+            "translation": None}
+
+
+def test_copies_are_filled_from_the_first_occurrence():
+    deduplicator = SegmentDeduplicator()
+    first = make_segment("Repeated.", "Unique one.")
+    second = make_segment("Unique two.", "Repeated.")
+    assert deduplicator.register(first) == ["Repeated.", "Unique one."]
+    assert deduplicator.register(second) == ["Unique two."]
+    assert deduplicator.needs_alignment(first) and deduplicator.needs_alignment(second)
+
+    first["translation"] = "重复。\n独有一。"
+    deduplicator.resolve(first)
+    second["translation"] = "独有二。"
+    deduplicator.resolve(second)
+    assert second["translation"] == "独有二。\n重复。"
+    assert deduplicator.report()["duplicate_paragraphs"] == 1
+
+
+def test_copy_of_a_failed_paragraph_is_translated_again():
+    deduplicator = SegmentDeduplicator()
+    first = make_segment("Repeated.")
+    deduplicator.register(first)
+    first["translation"] = f"{main.FAILED_CHUNK_PREFIX} Repeated...."
+    deduplicator.resolve(first)
+    assert deduplicator.register(make_segment("Repeated.")) == ["Repeated."]
+
+
+def test_repeated_and_hard_wrapped_paragraphs_keep_their_line_breaks(tmp_path, monkeypatch):
+    requests = []
+
+    class LineTranslator:
+        async def translate_detailed(self, text, **kwargs):
+            requests.append(text)
+            return {"text": "\n".join(f"T:{line}" for line in text.split("\n")), "finish_reason": "stop"}
+
+        def _is_translation_complete(self, source, translation):
+            return True
+
+    source = tmp_path / "doc.txt"
+    source.write_text("First.\n\nThird.\nline two of third\n\nFirst.\n\nLast.", encoding="utf-8")
+    monkeypatch.setattr(main, "create_translator", lambda *args, **kwargs: LineTranslator())
+    monkeypatch.setattr(main, "revision_store", RevisionStore(path=str(tmp_path / "revisions.sqlite3")))
+    monkeypatch.setitem(main.app.config, "OUTPUT_FOLDER", str(tmp_path))
+
+    result = asyncio.run(main.process_translation(
+        str(source), "openrouter", "key", "m", "英文", "中文", "", "", 1.0,
+        use_cache=False, incremental=False, context_mode="off",
+    ))
+    assert result["success"]
+    assert result["dedup"]["duplicate_paragraphs"] == 1
+    # 只有一次请求：硬换行的段落没有触发逐段重译
+    assert requests == ["First.\nThird.<br/>line two of third\nLast."]
+    output = (tmp_path / result["output_file"]).read_text(encoding="utf-8")
+    assert output == "T:First.\nT:Third.\nline two of third\nT:First.\nT:Last."
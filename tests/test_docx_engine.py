@@ -0,0 +1,70 @@
+import docx
+
+from docx_engine import DocxDocument, DocxSegment
+
+
+def make_document(path):
+    document = docx.Document()
+    document.sections[0].header.paragraphs[0].text = "Header text"
+    document.sections[0].footer.paragraphs[0].text = "Footer text"
+    paragraph = document.add_paragraph("Plain ")
+    paragraph.add_run("bold").bold = True
+    document.add_paragraph("   ")
+    table = document.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = "Cell one"
+    table.cell(0, 1).text = "Cell two"
+    document.add_paragraph("Last paragraph")
+    document.save(path)
+
+
+def test_texts_stream_headers_body_and_footers_in_order(tmp_path):
+    path = str(tmp_path / "source.docx")
+    make_document(path)
+    assert list(DocxDocument(path).iter_texts()) == [
+        "Header text", "<r1>Plain </r1><r2>bold</r2>", "Cell one", "Cell two", "Last paragraph", "Footer text",
+    ]
+
+
+def test_save_writes_translations_back_and_keeps_formatting(tmp_path):
+    source = str(tmp_path / "source.docx")
+    output = str(tmp_path / "output.docx")
+    make_document(source)
+    translations = iter(["页眉", "<r1>普通</r1><r2>加粗</r2>", "单元格一", None, "最后一段", "页脚"])
+    DocxDocument(source).save(output, translations)
+
+    document = docx.Document(output)
+    assert document.sections[0].header.paragraphs[0].text == "页眉"
+    assert document.sections[0].footer.paragraphs[0].text == "页脚"
+    runs = document.paragraphs[0].runs
+    assert [(run.text, bool(run.bold)) for run in runs] == [("普通", False), ("加粗", True)]
+    assert [cell.text for cell in document.tables[0].rows[0].cells] == ["单元格一", "Cell two"]
+    assert document.paragraphs[-1].text == "最后一段"
+
+
+def make_segment(*runs):
+    paragraph = docx.Document().add_paragraph()
+    for text, bold in runs:
+        paragraph.add_run(text).bold = bold
+    return DocxSegment("test", paragraph)
+
+
+def test_adjacent_runs_with_the_same_format_share_a_span():
+    segment = make_segment(("a", False), ("b", False), ("c", True))
+    assert segment.encode() == "<r1>ab</r1><r2>c</r2>"
+
+
+def test_decode_splits_translation_by_markup_and_keeps_text_between_spans():
+    segment = make_segment(("Hello ", False), ("world", True), ("!", False))
+    assert segment.decode("<r2>世界</r2>，<r1>你好</r1><r3>！</r3>") == ["你好", "世界，", "！"]
+    assert segment.decode("前言<r1>你好</r1><r2>世界</r2><r3>！</r3>") == ["前言你好", "世界", "！"]
+
+
+def test_decode_puts_everything_in_the_first_span_when_markup_is_lost():
+    segment = make_segment(("Hello ", False), ("world", True))
+    assert segment.decode("<r1>你好</r1>世界") == ["你好世界", ""]
+
+
+def test_line_breaks_round_trip_as_br_markup():
+    segment = make_segment(("one\ntwo", False))
+    assert segment.encode() == "one<br/>two"
+    assert segment.decode("一<br/>二") == ["一\n二"]
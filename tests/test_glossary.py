@@ -0,0 +1,45 @@
+from glossary import GlossaryIndex
+
+
+def sources(index, text):
+    return [source for source, _ in index.match(text)]
+
+
+def test_overlapping_terms_prefer_leftmost_then_longest():
+    index = GlossaryIndex([
+        ("machine", "机器"),
+        ("machine learning", "机器学习"),
+        ("learning rate", "学习率"),
+        ("rate", "速率"),
+    ])
+    # learning rate 与 machine learning 重叠被跳过，之后的 rate 不重叠
+    assert sources(index, "The machine learning rate is high") == ["machine learning", "rate"]
+    assert sources(index, "a learning rate and a machine") == ["learning rate", "machine"]
+
+
+def test_matches_whole_words_case_insensitively_including_plurals():
+    index = GlossaryIndex([("Policy", "策略"), ("box", "盒子"), ("model", "模型")])
+    assert sources(index, "Two POLICIES, three boxes and some models") == ["Policy", "box", "model"]
+    assert sources(index, "remodeled boxing") == []
+
+
+def test_matches_cjk_terms_inside_running_text():
+    index = GlossaryIndex([("机器学习", "machine learning"), ("学习", "study")])
+    assert sources(index, "我们研究机器学习方法，也学习统计") == ["机器学习", "学习"]
+
+
+def test_strips_docx_run_markup_before_matching():
+    index = GlossaryIndex([("machine learning", "机器学习")])
+    assert sources(index, "<r1>machine</r1> <r2>learning</r2> works") == ["machine learning"]
+
+
+def test_duplicate_sources_keep_the_last_entry():
+    index = GlossaryIndex([("Model", "模型"), ("model", "模特")])
+    assert len(index) == 1
+    assert index.match("a model") == [("model", "模特")]
+
+
+def test_limits_terms_to_first_occurrences():
+    index = GlossaryIndex([("alpha", "甲"), ("beta", "乙"), ("gamma", "丙")])
+    assert sources(index, "gamma beta alpha gamma") == ["gamma", "beta", "alpha"]
+    assert len(index.match("gamma beta alpha", max_terms=2)) == 2
@@ -0,0 +1,30 @@
+import main
+from translators.cached import CachedTranslator
+from translators.memory import TranslationMemory
+from test_cached_translator import CountingTranslator
+
+
+def test_memory_hit_is_still_classified_with_the_current_request(tmp_path, monkeypatch):
+    translator = CachedTranslator(CountingTranslator(), TranslationMemory(path=str(tmp_path / "tm.sqlite3"),
+                                                                          enabled=True))
+    translator.remember("缓存的译文", "Hello there.", source_lang="英文", target_lang="中文",
+                        model="m", temperature=1.0)
+    payloads = []
+
+    async def classify(api_key, payload):
+        payloads.append(payload)
+        return payload["badge_target"] != "blocked"
+
+    monkeypatch.setattr(main, "create_translator", lambda *args, **kwargs: translator)
+    monkeypatch.setattr(main, "classify_translation_request", classify)
+    client = main.app.test_client()
+    request = {"user_message": "Hello there.", "api_key": "key", "model": "m", "temperature": 1.0,
+               "source_lang": "英文", "target_lang": "中文"}
+
+    response = client.post("/translate", json={**request, "badge_target": "ok"})
+    assert response.status_code == 200
+    assert response.get_json()["translation"] == "缓存的译文"
+    response = client.post("/translate", json={**request, "badge_target": "blocked"})
+    assert response.status_code == 403
+    assert [payload["badge_target"] for payload in payloads] == ["ok", "blocked"]
+    assert translator.inner.calls == 0
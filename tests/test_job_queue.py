@@ -0,0 +1,16 @@
+import pytest
+
+from job_queue import JobQueue, QueueClosedError
+
+
+async def finish(job):
+    return {"output_file": "out.txt"}
+
+
+def test_submit_after_shutdown_is_rejected():
+    queue = JobQueue(max_concurrent=1, state_dir="")
+    job = queue.submit(finish, name="before")
+    assert queue.shutdown(timeout=5)
+    assert queue.get(job.id).status == "completed"
+    with pytest.raises(QueueClosedError):
+        queue.submit(finish, name="after")
@@ -0,0 +1,40 @@
+import pytest
+
+from translators.metrics import MetricsRegistry, timed_iterator
+
+
+def test_histogram_exposition_is_cumulative_with_sum_and_count():
+    registry = MetricsRegistry(buffer_size=10)
+    registry.observe("atp_chunk_seconds", 0.004)
+    registry.observe("atp_chunk_seconds", 0.3)
+    registry.observe("atp_chunk_seconds", 1000)
+    lines = registry.render().splitlines()
+    assert "# TYPE atp_chunk_seconds histogram" in lines
+    assert 'atp_chunk_seconds_bucket{le="0.005"} 1' in lines
+    assert 'atp_chunk_seconds_bucket{le="0.5"} 2' in lines
+    assert 'atp_chunk_seconds_bucket{le="300"} 2' in lines
+    assert 'atp_chunk_seconds_bucket{le="+Inf"} 3' in lines
+    assert "atp_chunk_seconds_sum 1000.304" in lines
+    assert "atp_chunk_seconds_count 3" in lines
+
+
+def test_counter_labels_are_sorted_and_escaped():
+    registry = MetricsRegistry(buffer_size=10)
+    registry.inc("atp_model_requests_total", status=200, model='a"b')
+    registry.inc("atp_model_requests_total", model='a"b', status=200)
+    assert 'atp_model_requests_total{model="a\\"b",status="200"} 2' in registry.render().splitlines()
+    with pytest.raises(KeyError):
+        registry.inc("atp_unknown_total")
+
+
+def test_recent_events_are_bounded():
+    registry = MetricsRegistry(buffer_size=2)
+    for value in range(3):
+        registry.observe("atp_document_seconds", value)
+    assert [event["value"] for event in registry.recent()] == [1, 2]
+
+
+def test_timed_iterator_reports_time_spent_producing_items():
+    elapsed = []
+    assert list(timed_iterator(iter([1, 2]), elapsed.append)) == [1, 2]
+    assert len(elapsed) == 1 and elapsed[0] >= 0
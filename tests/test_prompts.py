@@ -0,0 +1,50 @@
+from translators import prompts
+from translators.prompts import PromptLayout, PromptUsage, apply_cache_control
+
+
+def test_system_prefix_is_byte_stable_across_chunks():
+    layout = PromptLayout("英文", "中文", system_extra="保留术语", user_extra="正式语气",
+                          sections=[("术语表", "cat → 猫")])
+    first = layout.prompt_kwargs("First chunk.", context={"source": "Before.", "translation": "之前。"},
+                                 terms=[("cat", "猫")])
+    second = layout.prompt_kwargs("Second chunk.")
+    assert first["system_prompt"] == second["system_prompt"] == layout.system_prompt
+    assert "chunk" not in layout.system_prompt and "Before." not in layout.system_prompt
+    # 上文和术语在 user 消息中，文本块放在最后
+    assert first["user_prompt"].index("cat → 猫") < first["user_prompt"].index("Before.")
+    assert first["user_prompt"].endswith("First chunk.")
+
+
+def test_default_layout_leaves_prompts_to_translator():
+    layout = PromptLayout("英文", "中文")
+    assert layout.prompt_kwargs("Text.") == {"system_prompt": None, "user_prompt": None}
+    kwargs = layout.prompt_kwargs("Text.", context={"source": "Before."})
+    assert kwargs["system_prompt"] == prompts.default_system_prompt("英文", "中文")
+
+
+def test_cache_control_only_for_supported_models_with_long_prefix(monkeypatch):
+    monkeypatch.setattr(prompts, "PROMPT_CACHE_MIN_TOKENS", 5)
+    messages = [{"role": "system", "content": "长前缀 " * 20}, {"role": "user", "content": "text"}]
+    marked = apply_cache_control(messages, "anthropic/claude-3.5-sonnet")
+    assert marked[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert marked[1] is messages[1]
+    assert apply_cache_control(messages, "openai/gpt-4o") is messages
+    monkeypatch.setattr(prompts, "PROMPT_CACHE_MIN_TOKENS", 100000)
+    assert apply_cache_control(messages, "anthropic/claude-3.5-sonnet") is messages
+
+
+def test_usage_aggregates_both_cache_report_formats():
+    usage = PromptUsage()
+    usage.add({"prompt_tokens": 1000, "completion_tokens": 200,
+               "prompt_tokens_details": {"cached_tokens": 800}})
+    usage.add({"prompt_tokens": 1000, "completion_tokens": 100,
+               "cache_read_input_tokens": 0, "cache_creation_input_tokens": 900})
+    usage.add(None)
+    assert usage.to_dict() == {
+        "requests": 2,
+        "prompt_tokens": 2000,
+        "completion_tokens": 300,
+        "cached_tokens": 800,
+        "cache_write_tokens": 900,
+        "cache_hit_ratio": 0.4,
+    }
@@ -0,0 +1,71 @@
+import asyncio
+import email.utils
+import importlib
+
+from translators.http_client import HTTPResponse
+from translators.rate_limiter import AdaptiveRateLimiter, parse_retry_after
+
+# translators 包导出了同名的限速器实例，按模块路径取模块本身
+rl = importlib.import_module("translators.rate_limiter")
+
+
+def test_retry_after_accepts_seconds_durations_and_http_dates():
+    now = 1_700_000_000.0
+    assert parse_retry_after({"Retry-After": "2.5"}, now) == 2.5
+    assert parse_retry_after({"retry-after": "1m30s"}, now) == 90
+    http_date = email.utils.formatdate(now + 30, usegmt=True)
+    assert parse_retry_after({"Retry-After": http_date}, now) == 30
+    assert parse_retry_after({"Retry-After": "soon"}, now) is None
+
+
+def test_rate_limit_reset_only_applies_when_quota_is_exhausted():
+    now = 1_700_000_000.0
+    assert parse_retry_after({"X-RateLimit-Remaining": "3", "X-RateLimit-Reset": "10"}, now) is None
+    assert parse_retry_after({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "10"}, now) == 10
+    assert parse_retry_after({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int((now + 5) * 1000))},
+                             now) == 5
+    assert parse_retry_after({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(now + 7)}, now) == 7
+
+
+def test_rate_grows_additively_and_halves_on_throttle():
+    limiter = AdaptiveRateLimiter(initial_rate=4, max_rate=5, min_rate=1, increase=0.5)
+    limiter.record_success("key", "m")
+    limiter.record_success("key", "m")
+    limiter.record_success("key", "m")
+    assert limiter._bucket(("key", "m")).rate == 5
+    limiter.record_throttle("key", "m", retry_after=30)
+    assert limiter._bucket(("key", "m")).rate == 2.5
+    assert 29 < limiter.paused("key", "m") <= 30
+    assert limiter.paused("key", "other") == 0
+    for _ in range(5):
+        limiter.record_throttle("key", "m")
+    assert limiter._bucket(("key", "m")).rate == 1
+
+
+def test_reservations_beyond_the_burst_wait_their_turn():
+    limiter = AdaptiveRateLimiter(initial_rate=2, max_rate=2, min_rate=1, increase=1)
+    waits = [limiter.reserve("key", "m") for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert 0.4 < waits[2] <= 0.5 < waits[3] <= 1.0
+
+
+def test_send_with_backoff_retries_throttled_requests(monkeypatch):
+    monkeypatch.setattr(rl, "rate_limiter", AdaptiveRateLimiter(initial_rate=100, max_rate=100,
+                                                                  min_rate=50, increase=1))
+    responses = [HTTPResponse(429, {"Retry-After": "0"}, ""), HTTPResponse(503, {}, ""),
+                 HTTPResponse(200, {}, "ok")]
+    calls = []
+
+    async def send():
+        calls.append(1)
+        return responses[len(calls) - 1]
+
+    monkeypatch.setattr(rl, "backoff_delay", lambda attempt: 0.0)
+    response = asyncio.run(rl.send_with_backoff("key", "m", send))
+    assert response.status == 200 and len(calls) == 3
+    assert rl.rate_limiter._bucket(("key", "m")).throttled == 1
+
+    calls.clear()
+    responses[:] = [HTTPResponse(503, {}, "")] * 3
+    assert asyncio.run(rl.send_with_backoff("key", "m", send, max_retries=1)).status == 503
+    assert len(calls) == 2
@@ -0,0 +1,15 @@
+from review_segments import align_segments, shift_errors
+
+
+def test_segment_offsets_index_into_the_original_target_text():
+    source = "\n".join(f"Source paragraph number {i} with several words in it." for i in range(6))
+    target = "\n\n".join(f"   译文段落 {i} 包含若干文字。" for i in range(6))
+    segments = align_segments(source, target, max_tokens=30)
+    assert len(segments) > 1
+    for segment in segments:
+        offset = segment["offset"]
+        assert target[offset:offset + len(segment["target"])] == segment["target"]
+        # 片段内的错误位置换算后指向完整译文中的同一个字符
+        index = segment["target"].index("包含")
+        shifted = shift_errors([{"index": index}], offset)[0]["index"]
+        assert target[shifted:shifted + 2] == "包含"
@@ -0,0 +1,44 @@
+from revision_store import RevisionStore, plan_revision, split_segment
+
+
+def test_plan_reuses_unchanged_runs_and_groups_changed_paragraphs():
+    previous = [
+        {"fps": ["a"], "translation": "A"},
+        {"fps": ["b", "c"], "translation": "B C"},
+        {"fps": ["d"], "translation": "D"},
+    ]
+    paragraphs = ["pa", "pb", "pc", "px", "py", "pd"]
+    plan = plan_revision(paragraphs, ["a", "b", "c", "x", "y", "d"], previous)
+    assert [(group["fps"], group["translation"]) for group in plan] == [
+        (["a"], "A"),
+        (["b", "c"], "B C"),
+        (["x", "y"], None),
+        (["d"], "D"),
+    ]
+    assert plan[2]["paragraphs"] == ["px", "py"]
+
+
+def test_plan_only_reuses_a_group_when_all_its_paragraphs_are_unchanged():
+    previous = [{"fps": ["a", "b"], "translation": "A B"}]
+    plan = plan_revision(["pa", "pz"], ["a", "z"], previous)
+    assert [(group["fps"], group["translation"]) for group in plan] == [(["a", "z"], None)]
+
+
+def test_split_segment_only_when_lines_match_paragraphs():
+    assert split_segment({"fps": ["a", "b"], "translation": "A\n\nB"}) == [
+        {"fps": ["a"], "translation": "A"},
+        {"fps": ["b"], "translation": "B"},
+    ]
+    assert split_segment({"fps": ["a", "b"], "translation": "A B"}) == [
+        {"fps": ["a", "b"], "translation": "A B"},
+    ]
+
+
+def test_find_previous_picks_the_version_with_enough_overlap(tmp_path):
+    store = RevisionStore(path=str(tmp_path / "revisions.sqlite3"), min_overlap=0.5)
+    store.save("config", "v1.txt", "out1.txt", iter([{"fps": ["a", "b"], "translation": "A B"}]))
+    found = store.find_previous("config", ["a", "b", "c"])
+    assert found["output_file"] == "out1.txt"
+    assert found["segments"] == [{"fps": ["a", "b"], "translation": "A B"}]
+    assert store.find_previous("config", ["a", "x", "y"]) is None
+    assert store.find_previous("other", ["a", "b"]) is None
@@ -0,0 +1,71 @@
+import asyncio
+
+from translators import router
+from translators.router import BackendHealth, RouterTranslator, parse_backends
+
+
+class FakeTranslator:
+    def __init__(self, text, delay=0.0):
+        self.text = text
+        self.delay = delay
+        self.cancelled = False
+
+    async def translate_detailed(self, text, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return {"text": self.text, "finish_reason": "stop"} if self.text else None
+
+
+def make_router(*translators, health=None, hedging=True):
+    translator = RouterTranslator([("key", f"model-{n}") for n in range(len(translators))],
+                                  health=health or BackendHealth(), hedging=hedging)
+    for backend, fake in zip(translator.backends, translators):
+        backend.translator = fake
+    return translator
+
+
+def test_hedge_delay_is_the_p95_of_recent_latencies(monkeypatch):
+    monkeypatch.setattr(router, "HEDGE_MIN_DELAY", 0.5)
+    health = BackendHealth()
+    backend = make_router(FakeTranslator("x")).backends[0]
+    assert health.hedge_delay(backend) == router.HEDGE_DEFAULT_DELAY
+    for latency in range(1, 21):
+        health.started(backend)
+        health.finished(backend, True, latency / 10)
+    assert health.hedge_delay(backend) == 2.0
+    fast = BackendHealth()
+    for _ in range(5):
+        fast.started(backend)
+        fast.finished(backend, True, 0.01)
+    assert fast.hedge_delay(backend) == 0.5
+
+
+def test_slow_primary_is_hedged_and_the_first_success_wins(monkeypatch):
+    monkeypatch.setattr(router, "HEDGE_DEFAULT_DELAY", 0.05)
+    slow, fast = FakeTranslator("slow", delay=5), FakeTranslator("fast")
+    translator = make_router(slow, fast)
+    result = asyncio.run(translator.translate_detailed("text"))
+    assert result["text"] == "fast" and result["model"] == "model-1"
+    assert slow.cancelled
+    assert translator.health.to_dict()["…key/model-1"]["hedges"] == 1
+
+
+def test_failed_backend_is_replaced_and_cooled_down(monkeypatch):
+    monkeypatch.setattr(router, "BACKEND_FAILURE_THRESHOLD", 2)
+    translator = make_router(FakeTranslator(None), FakeTranslator("ok"), hedging=False)
+    assert asyncio.run(translator.translate_detailed("text"))["model"] == "model-1"
+    assert [backend.model for backend in translator.health.rank(translator.backends)] == ["model-1", "model-0"]
+    assert not translator.health.to_dict()["…key/model-0"]["cooling_down"]
+
+    # 第二次连续失败后进入冷却
+    translator.backends[1].translator = FakeTranslator(None)
+    assert asyncio.run(translator.translate_detailed("text")) is None
+    assert translator.health.to_dict()["…key/model-0"]["cooling_down"]
+
+
+def test_parse_backends_accepts_names_and_json():
+    assert parse_backends("a, b,a", "main") == [("main", "a"), ("main", "b")]
+    assert parse_backends('["a", {"model": "b", "api_key": "other"}]', "main") == [("main", "a"), ("other", "b")]
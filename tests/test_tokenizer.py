@@ -0,0 +1,42 @@
+import logging
+
+from translators import tokenizer
+
+
+class CountingCounter:
+    name = "test-counter"
+
+    def __init__(self):
+        self.calls = 0
+
+    def count(self, text):
+        self.calls += 1
+        return len(text)
+
+
+def test_counts_are_cached_by_digest_and_bounded(monkeypatch):
+    counter = CountingCounter()
+    monkeypatch.setitem(tokenizer._counters, counter.name, counter)
+    monkeypatch.setattr(tokenizer, "COUNT_CACHE_SIZE", 2)
+    monkeypatch.setattr(tokenizer, "_count_cache", tokenizer.OrderedDict())
+
+    assert tokenizer.count_tokens("alpha", counter=counter) == 5
+    assert tokenizer.count_tokens("alpha", counter=counter) == 5
+    assert counter.calls == 1
+    tokenizer.count_tokens("beta", counter=counter)
+    tokenizer.count_tokens("gamma", counter=counter)
+    assert len(tokenizer._count_cache) == 2
+    assert all("alpha" not in key for key in tokenizer._count_cache)
+    tokenizer.count_tokens("alpha", counter=counter)
+    assert counter.calls == 4
+
+
+def test_missing_vocab_falls_back_to_the_estimate_with_a_warning(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(tokenizer, "TOKENIZER_DIR", str(tmp_path))
+    monkeypatch.setattr(tokenizer, "_encodings", {})
+    monkeypatch.setattr(tokenizer, "_warned_no_tiktoken", False)
+    with caplog.at_level(logging.WARNING, logger=tokenizer.__name__):
+        counter = tokenizer.get_token_counter("openai/gpt-4o")
+        tokenizer.get_token_counter("openai/gpt-4o")
+    assert counter.name == "script-estimate"
+    assert len(caplog.records) == 1
@@ -1,16 +1,42 @@
 import os
 import re
+import zipfile
+import xml.etree.ElementTree as ET
 import docx2txt
 from docx import Document
 import logging
 
+from docx_engine import docx_text_parts
+from translators.tokenizer import count_tokens, get_model_budget, get_token_counter
+
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 句子边界：中日文句末标点之后，或西文句末标点加空白之后
+SENTENCE_BOUNDARY = re.compile(r'(?<=[。！？；])\s*|(?<=[.!?;])\s+')
+
+CONTROL_CHARS = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]')
+# 流式读取 TXT 时单次读取的最大字符数，超长的行会被分成多次读取
+LINE_READ_LIMIT = 64 * 1024
+
+# 段内换行在文本块中写作 <br/>（与 DOCX 的格式标记相同），每段恰好占一行，译文可按行对应回各段
+LINE_BREAK_MARKUP = '<br/>'
+LINE_BREAK_RE = re.compile(r'<br\s*/?>', re.IGNORECASE)
+LINE_BREAK_INSTRUCTION = "文中的 <br/> 表示段内换行，请在译文中对应的位置原样保留，不要删除或改写。"
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
 class TextProcessor:
-    def __init__(self, max_tokens=2000):
+    def __init__(self, max_tokens=2000, token_counter=None):
         self.max_tokens = max_tokens
+        self.token_counter = token_counter or get_token_counter()
+    
+    @classmethod
+    def for_model(cls, model):
+        """按模型的上下文窗口和最大输出确定分块大小，并使用该模型的 token 计数器"""
+        budget = get_model_budget(model)
+        return cls(max_tokens=budget.chunk_tokens(), token_counter=get_token_counter(model))
     
     def extract_from_file(self, file_path):
         """从文件中提取文本内容"""
@@ -35,6 +61,101 @@ class TextProcessor:
         logger.info(f"文本提取完成，共 {len(text)} 字符")
         return text
     
+    def iter_paragraphs(self, file_path, mark_line_breaks=False):
+        """流式提取文件中的段落，逐段清理后产出
+
+        TXT 按行读取，DOCX 用 iterparse 逐段解析页眉、正文和页脚，都不会把整个文件读入内存；
+        超过 max_tokens 的段落按行切开产出。无法流式解析的 .doc 文件退回整篇提取。
+        mark_line_breaks 为 True 时段内换行替换为 LINE_BREAK_MARKUP。
+        """
+        for paragraph in self._iter_file_paragraphs(file_path):
+            yield paragraph.replace('\n', LINE_BREAK_MARKUP) if mark_line_breaks else paragraph
+
+    def _iter_file_paragraphs(self, file_path):
+        _, file_extension = os.path.splitext(file_path)
+        file_extension = file_extension.lower()
+        logger.info(f"开始流式提取文件: {file_path}")
+
+        if file_extension == '.txt':
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
+                yield from self._clean_paragraphs(self._iter_text_paragraphs(file))
+        elif file_extension in ['.docx', '.doc']:
+            if self._is_docx_package(file_path):
+                yield from self._clean_paragraphs(self._iter_docx_paragraphs(file_path))
+            else:
+                text = self.extract_from_file(file_path)
+                yield from self._clean_paragraphs(self.split_paragraphs(self.clean_text(text)))
+        else:
+            raise ValueError(f"不支持的文件格式: {file_extension}")
+
+    def _clean_paragraphs(self, paragraphs):
+        for paragraph in paragraphs:
+            paragraph = CONTROL_CHARS.sub('', paragraph).strip()
+            if paragraph:
+                yield paragraph
+
+    def _iter_text_paragraphs(self, file):
+        """以空行分段；段落超过 max_tokens 时在行边界切开，避免超长段落整段驻留内存"""
+        buffer = []
+        tokens = 0
+        for piece in iter(lambda: file.readline(LINE_READ_LIMIT), ''):
+            if not piece.strip():
+                if buffer:
+                    yield ''.join(buffer)
+                    buffer, tokens = [], 0
+                continue
+            buffer.append(piece)
+            # 逐行计数不经过计数缓存，避免大文件的每一行都进入缓存
+            tokens += self.token_counter.count(piece)
+            if tokens >= self.max_tokens:
+                yield ''.join(buffer)
+                buffer, tokens = [], 0
+        if buffer:
+            yield ''.join(buffer)
+
+    @staticmethod
+    def _is_docx_package(file_path):
+        if not zipfile.is_zipfile(file_path):
+            return False
+        with zipfile.ZipFile(file_path) as archive:
+            return 'word/document.xml' in archive.namelist()
+
+    def _iter_docx_paragraphs(self, file_path):
+        """逐个产出 w:p 段落的文本（依次为页眉、正文、页脚），处理完的元素随即释放"""
+        with zipfile.ZipFile(file_path) as archive:
+            for part in docx_text_parts(archive.namelist()):
+                with archive.open(part) as xml_file:
+                    yield from self._iter_part_paragraphs(xml_file)
+
+    @staticmethod
+    def _iter_part_paragraphs(xml_file):
+        depth = 0
+        # 段落和表格的直接容器：正文的 w:body，页眉页脚的根元素 w:hdr / w:ftr
+        container = None
+        container_depth = 0
+        for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if elem.tag in (_W + 'body', _W + 'hdr', _W + 'ftr'):
+                    container, container_depth = elem, depth
+                continue
+            depth -= 1
+            if elem.tag == _W + 'p':
+                parts = []
+                for node in elem.iter():
+                    if node.tag == _W + 't' and node.text:
+                        parts.append(node.text)
+                    elif node.tag == _W + 'tab':
+                        parts.append('\t')
+                    elif node.tag in (_W + 'br', _W + 'cr'):
+                        parts.append('\n')
+                yield ''.join(parts)
+                # 清空后外层段落（如文本框所在段落）不会重复包含这段文字
+                elem.clear()
+            if container is not None and depth == container_depth:
+                # 容器的直接子元素（段落、表格等）处理完毕，释放已解析的部分
+                container.clear()
+
     def clean_text(self, text):
         """清理文本，保留基本格式"""
         # 替换多个空行为单个空行
@@ -53,31 +174,25 @@ class TextProcessor:
         return paragraphs
     
     def count_tokens(self, text):
-        """估算文本的token数量"""
-        words = len(text.split())
-        chinese_chars = sum(1 for c in text if '\u4e00' <= c <= '\u9fff')
-        return int(words * 1.3 + chinese_chars * 2)
+        """计算文本的token数量（有本地BPE词表时精确计数，否则按文字系统估算）"""
+        return count_tokens(text, counter=self.token_counter)
     
-    def chunk_text(self, paragraphs):
-        """将文本分块，确保每块不超过最大token数"""
-        chunks = []
+    def iter_groups(self, paragraphs):
+        """按最大token数把段落分组，每凑满一组即产出（paragraphs 可以是生成器）"""
         current_batch = []
         current_tokens = 0
-        previous_batch = ""
         
         for para in paragraphs:
-            para_tokens = self.count_tokens(para)
+            # 每段只计数一次，不经过计数缓存，缓存大小不随文档增长
+            para_tokens = self.token_counter.count(para)
             
             if current_tokens + para_tokens > self.max_tokens:
                 if current_batch:
-                    current_text = '\n'.join(current_batch)
-                    chunks.append((previous_batch, current_text))
-                    previous_batch = current_text
+                    yield current_batch
                     current_batch = [para]
                     current_tokens = para_tokens
                 else:
-                    chunks.append((previous_batch, para))
-                    previous_batch = para
+                    yield [para]
                     current_batch = []
                     current_tokens = 0
             else:
@@ -85,14 +200,91 @@ class TextProcessor:
                 current_tokens += para_tokens
         
         if current_batch:
-            chunks.append((previous_batch, '\n'.join(current_batch)))
+            yield current_batch
+    
+    def group_paragraphs(self, paragraphs):
+        """按最大token数把段落分组，每组对应一个文本块"""
+        return list(self.iter_groups(paragraphs))
+    
+    def chunk_text(self, paragraphs):
+        """将文本分块，确保每块不超过最大token数"""
+        chunks = []
+        previous_batch = ""
+        
+        for group in self.group_paragraphs(paragraphs):
+            current_text = '\n'.join(group)
+            chunks.append((previous_batch, current_text))
+            previous_batch = current_text
         
         logger.info(f"文本分块完成，共 {len(chunks)} 块")
         return chunks
     
-    def process_text(self, text):
-        """处理文本的主函数"""
-        logger.info("开始处理文本...")
+    def split_in_half(self, text):
+        """把一个文本块按token数大致对半拆开，返回 (片段列表, 连接符)
+
+        优先按行拆分；只有一行时按句子拆分，连接符为 None 表示由调用方按译文决定。
+        无法再拆分时返回 ([], None)。
+        """
+        text = text.strip()
+        lines = [line for line in text.split('\n') if line.strip()]
+        if len(lines) >= 2:
+            sizes = [self.count_tokens(line) for line in lines]
+            cut = self._half_index(sizes)
+            return ['\n'.join(lines[:cut]), '\n'.join(lines[cut:])], '\n'
+
+        # 单行文本按句子拆分，保留原文中句间的空白
+        boundaries = [m for m in SENTENCE_BOUNDARY.finditer(text) if 0 < m.start() and m.end() < len(text)]
+        if not boundaries:
+            return [], None
+        starts = [0] + [m.end() for m in boundaries]
+        ends = [m.start() for m in boundaries] + [len(text)]
+        sizes = [self.count_tokens(text[a:b]) for a, b in zip(starts, ends)]
+        boundary = boundaries[self._half_index(sizes) - 1]
+        return [text[:boundary.start()], text[boundary.end():]], None
+
+    def tail(self, text, max_tokens):
+        """取文本末尾不超过 max_tokens 个token的部分，优先保留完整的行，其次完整的句子"""
+        if not text or max_tokens <= 0:
+            return ""
+        text = text.strip()
+        if self.token_counter.count(text) <= max_tokens:
+            return text
+
+        kept = []
+        used = 0
+        for line in reversed(text.split('\n')):
+            size = self.token_counter.count(line)
+            if used + size > max_tokens:
+                if not kept:
+                    kept.append(self._tail_of_line(line, max_tokens))
+                break
+            kept.append(line)
+            used += size
+        return '\n'.join(reversed(kept)).strip()
+
+    def _tail_of_line(self, line, max_tokens):
+        """单行超出预算时按句子截取末尾；最后一句也超出时按比例截取字符"""
+        starts = [m.end() for m in SENTENCE_BOUNDARY.finditer(line) if 0 < m.end() < len(line)]
+        for start in starts:
+            if self.token_counter.count(line[start:]) <= max_tokens:
+                return line[start:]
+        piece = line[starts[-1]:] if starts else line
+        keep = max(1, len(piece) * max_tokens // max(1, self.token_counter.count(piece)))
+        return piece[-keep:]
+
+    @staticmethod
+    def _half_index(sizes):
+        """返回使左右两部分token数最接近的切分位置（1 到 len-1）"""
+        half = sum(sizes) / 2
+        running = 0
+        for index, size in enumerate(sizes[:-1], start=1):
+            running += size
+            if running >= half:
+                return index
+        return len(sizes) - 1
+    
+    def prepare_paragraphs(self, text):
+        """清理并分段，返回段落列表"""
         cleaned_text = self.clean_text(text)
         
         if not cleaned_text:
@@ -104,12 +296,19 @@ class TextProcessor:
         if not paragraphs:
             logger.error("分段后没有内容")
             paragraphs = [cleaned_text]
-            
+        
+        return paragraphs
+    
+    def process_text(self, text):
+        """处理文本的主函数"""
+        logger.info("开始处理文本...")
+        paragraphs = self.prepare_paragraphs(text)
         chunks = self.chunk_text(paragraphs)
         
         if not chunks:
             logger.error("分块后没有内容")
+            cleaned_text = '\n\n'.join(paragraphs)
             chunks = [(cleaned_text, cleaned_text)]
         
         logger.info(f"文本处理完成，共生成 {len(chunks)} 个文本块")
-        return chunks 
\ No newline at end of file
+        return chunks
\ No newline at end of file
@@ -1,16 +1,31 @@
+from .cached import CachedTranslator
+from .http_client import http_client
+from .memory import translation_memory
 from .openrouter import OpenRouterTranslator
+from .rate_limiter import rate_limiter
+from .router import RouterTranslator, backend_health, parse_backends
 
-def create_translator(api_type, api_key):
+def create_translator(api_type, api_key, use_cache=False, model=None, fallbacks=None, slot=None):
     """
     根据API类型创建对应的翻译器实例（仅支持 OpenRouter）
 
     参数:
         api_type: API类型（openrouter）
         api_key: API密钥
+        use_cache: 是否包一层翻译记忆（完全相同的请求直接返回缓存）
+        model: 主模型，与 fallbacks 一起组成路由的后端
+        fallbacks: 备用的 (api_key, model) 列表，非空时返回在各后端间路由、对冲的翻译器
+        slot: 路由时每个后端请求的并发名额 slot(api_key, model)，见 RouterTranslator
 
     返回:
         翻译器实例
     """
     if api_type and api_type != 'openrouter':
         raise ValueError(f"不支持的API类型: {api_type}")
-    return OpenRouterTranslator(api_key)
+    if fallbacks:
+        translator = RouterTranslator([(api_key, model)] + list(fallbacks), slot=slot)
+    else:
+        translator = OpenRouterTranslator(api_key)
+    if use_cache and translation_memory.enabled:
+        return CachedTranslator(translator, translation_memory)
+    return translator
@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 
 class BaseTranslator(ABC):
@@ -10,7 +11,75 @@ class BaseTranslator(ABC):
                  include_reasoning=False):
         """翻译文本的抽象方法"""
         pass
+
+    async def translate_async(self, text, source_lang="英文", target_lang="中文",
+                              model=None, system_prompt=None, user_prompt=None, temperature=1.0,
+                              include_reasoning=False):
+        """异步翻译，默认在线程中执行同步的 translate，子类可提供原生实现"""
+        return await asyncio.to_thread(
+            self.translate,
+            text,
+            source_lang=source_lang,
+            target_lang=target_lang,
+            model=model,
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            temperature=temperature,
+            include_reasoning=include_reasoning,
+        )
     
+    async def translate_detailed(self, text, source_lang="英文", target_lang="中文",
+                                 model=None, system_prompt=None, user_prompt=None, temperature=1.0,
+                                 include_reasoning=False, continuation=None):
+        """翻译并返回结果元数据: {"text", "reasoning", "finish_reason", "usage"}，失败返回 None
+
+        continuation 为上次被截断的译文时，请求模型从中断处接着输出；
+        不支持续写的翻译器直接返回 None，由调用方改为拆分重译。
+        """
+        if continuation is not None:
+            return None
+        result = await self.translate_async(
+            text,
+            source_lang=source_lang,
+            target_lang=target_lang,
+            model=model,
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            temperature=temperature,
+            include_reasoning=include_reasoning,
+        )
+        if isinstance(result, dict):
+            content = result.get("text") or result.get("content")
+            reasoning = result.get("reasoning") or ""
+        else:
+            content, reasoning = result, ""
+        if not content:
+            return None
+        return {"text": content, "reasoning": reasoning, "finish_reason": None, "usage": None}
+
+    async def translate_stream(self, text, source_lang="英文", target_lang="中文",
+                               model=None, system_prompt=None, user_prompt=None, temperature=1.0,
+                               include_reasoning=False):
+        """流式翻译，默认一次性产出完整结果，子类可提供真正的增量实现"""
+        result = await self.translate_async(
+            text,
+            source_lang=source_lang,
+            target_lang=target_lang,
+            model=model,
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            temperature=temperature,
+            include_reasoning=include_reasoning,
+        )
+        if isinstance(result, dict):
+            if result.get("reasoning"):
+                yield {"type": "reasoning", "text": result["reasoning"]}
+            result = result.get("text") or result.get("content")
+        if not result:
+            raise RuntimeError("翻译失败")
+        yield {"type": "content", "text": result}
+        yield {"type": "done", "finish_reason": "stop"}
+
     def _is_translation_complete(self, source_text, translated_text):
         """检查翻译是否完整"""
         # 检查翻译结果是否为空
@@ -21,8 +90,10 @@ class BaseTranslator(ABC):
         if len(translated_text) < len(source_text) * 0.1:
             return False
             
-        # 检查是否包含明显的截断标记
-        if translated_text.endswith('...') or translated_text.endswith('…'):
+        # 检查是否包含明显的截断标记（原文本身以省略号结尾时除外）
+        source_tail = source_text.rstrip()
+        if (translated_text.endswith('...') or translated_text.endswith('…')) \
+                and not (source_tail.endswith('...') or source_tail.endswith('…')):
             return False
             
         # 检查段落数量是否合理
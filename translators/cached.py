@@ -0,0 +1,179 @@
+import logging
+import threading
+from typing import Optional, Union
+
+from .base import BaseTranslator
+from .memory import TranslationMemory, make_memory_key
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CachedTranslator(BaseTranslator):
+    """在任意翻译器外包一层翻译记忆，完全相同的请求直接返回缓存结果"""
+
+    def __init__(self, inner: BaseTranslator, memory: TranslationMemory):
+        super().__init__(inner.api_key)
+        self.inner = inner
+        self.memory = memory
+        # lookup 已确认未命中的键，随后的 translate 不再重复查询和计数
+        self._known_misses = set()
+        # 为 True 时写入先暂存，直到 commit_writes（请求通过判定后）才真正落库
+        self.hold_writes = False
+        self._pending_writes = []
+        self._writes_lock = threading.Lock()
+
+    def _key(self, text, source_lang, target_lang, model, system_prompt, user_prompt, temperature):
+        return make_memory_key(text, model, source_lang, target_lang,
+                               system_prompt, user_prompt, temperature)
+
+    @staticmethod
+    def _wrap(translation: str, include_reasoning: bool) -> Union[str, dict]:
+        if include_reasoning:
+            return {"text": translation, "reasoning": ""}
+        return translation
+
+    @staticmethod
+    def _extract_text(result) -> Optional[str]:
+        if isinstance(result, dict):
+            return result.get("text") or result.get("content")
+        return result
+
+    def lookup(self, text, source_lang="英文", target_lang="中文", model=None,
+               system_prompt=None, user_prompt=None, temperature=1.0,
+               include_reasoning=False) -> Optional[Union[str, dict]]:
+        """只查询翻译记忆，不发起网络请求"""
+        key = self._key(text, source_lang, target_lang, model, system_prompt, user_prompt, temperature)
+        if key in self._known_misses:
+            self._known_misses.discard(key)
+            return None
+        cached = self.memory.get(key)
+        metrics.inc("atp_cache_lookups_total", cache="translation_memory",
+                    result="miss" if cached is None else "hit")
+        if cached is None:
+            self._known_misses.add(key)
+            return None
+        return self._wrap(cached, include_reasoning)
+
+    def _store(self, result, text, source_lang, target_lang, model,
+               system_prompt, user_prompt, temperature) -> None:
+        key = self._key(text, source_lang, target_lang, model, system_prompt, user_prompt, temperature)
+        self._known_misses.discard(key)
+        translation = self._extract_text(result)
+        if translation and "[翻译失败]" not in translation:
+            with self._writes_lock:
+                if self.hold_writes:
+                    self._pending_writes.append((key, translation, model))
+                    return
+            self.memory.put(key, translation, model)
+
+    def commit_writes(self) -> None:
+        """写入暂存的译文，之后的写入不再暂存"""
+        with self._writes_lock:
+            self.hold_writes = False
+            pending, self._pending_writes = self._pending_writes, []
+        for key, translation, model in pending:
+            self.memory.put(key, translation, model)
+
+    def discard_writes(self) -> None:
+        with self._writes_lock:
+            self._pending_writes = []
+
+    def translate(self, text, source_lang="英文", target_lang="中文", model=None,
+                  system_prompt=None, user_prompt=None, temperature=1.0,
+                  include_reasoning=False):
+        cached = self.lookup(text, source_lang, target_lang, model,
+                             system_prompt, user_prompt, temperature, include_reasoning)
+        if cached is not None:
+            logger.info("命中翻译记忆，跳过模型调用")
+            return cached
+        result = self.inner.translate(
+            text, source_lang=source_lang, target_lang=target_lang, model=model,
+            system_prompt=system_prompt, user_prompt=user_prompt,
+            temperature=temperature, include_reasoning=include_reasoning,
+        )
+        self._store(result, text, source_lang, target_lang, model,
+                    system_prompt, user_prompt, temperature)
+        return result
+
+    async def translate_async(self, text, source_lang="英文", target_lang="中文", model=None,
+                              system_prompt=None, user_prompt=None, temperature=1.0,
+                              include_reasoning=False):
+        cached = self.lookup(text, source_lang, target_lang, model,
+                             system_prompt, user_prompt, temperature, include_reasoning)
+        if cached is not None:
+            logger.info("命中翻译记忆，跳过模型调用")
+            return cached
+        result = await self.inner.translate_async(
+            text, source_lang=source_lang, target_lang=target_lang, model=model,
+            system_prompt=system_prompt, user_prompt=user_prompt,
+            temperature=temperature, include_reasoning=include_reasoning,
+        )
+        self._store(result, text, source_lang, target_lang, model,
+                    system_prompt, user_prompt, temperature)
+        return result
+
+    async def translate_detailed(self, text, source_lang="英文", target_lang="中文", model=None,
+                                 system_prompt=None, user_prompt=None, temperature=1.0,
+                                 include_reasoning=False, continuation=None, memory_prompts=None):
+        """memory_prompts 为计算翻译记忆键时代替 (system_prompt, user_prompt) 的提示词，
+        如去掉上文后的提示词，使同一段原文不因上文不同而无法命中"""
+        # 续写请求的上下文包含已输出的译文，不按原文查询或写入翻译记忆
+        if continuation is not None:
+            return await self.inner.translate_detailed(
+                text, source_lang=source_lang, target_lang=target_lang, model=model,
+                system_prompt=system_prompt, user_prompt=user_prompt,
+                temperature=temperature, include_reasoning=include_reasoning,
+                continuation=continuation,
+            )
+        key_system_prompt, key_user_prompt = memory_prompts or (system_prompt, user_prompt)
+        cached = self.lookup(text, source_lang, target_lang, model,
+                             key_system_prompt, key_user_prompt, temperature)
+        if cached is not None:
+            logger.info("命中翻译记忆，跳过模型调用")
+            return {"text": cached, "reasoning": "", "finish_reason": "stop", "usage": None}
+        result = await self.inner.translate_detailed(
+            text, source_lang=source_lang, target_lang=target_lang, model=model,
+            system_prompt=system_prompt, user_prompt=user_prompt,
+            temperature=temperature, include_reasoning=include_reasoning,
+        )
+        # 被截断、不完整或由备用模型给出的输出不写入翻译记忆
+        if result and result.get("finish_reason") != "length" \
+                and result.get("model", model) == model \
+                and self._is_translation_complete(text, result["text"]):
+            self._store(result["text"], text, source_lang, target_lang, model,
+                        key_system_prompt, key_user_prompt, temperature)
+        return result
+
+    def remember(self, translation, text, source_lang="英文", target_lang="中文", model=None,
+                 system_prompt=None, user_prompt=None, temperature=1.0) -> None:
+        """写入在外部拼接完成的译文（如续写后的完整译文）"""
+        self._store(translation, text, source_lang, target_lang, model,
+                    system_prompt, user_prompt, temperature)
+
+    async def translate_stream(self, text, source_lang="英文", target_lang="中文", model=None,
+                               system_prompt=None, user_prompt=None, temperature=1.0,
+                               include_reasoning=False):
+        cached = self.lookup(text, source_lang, target_lang, model,
+                             system_prompt, user_prompt, temperature, include_reasoning)
+        if cached is not None:
+            logger.info("命中翻译记忆，跳过模型调用")
+            yield {"type": "content", "text": self._extract_text(cached)}
+            yield {"type": "done", "finish_reason": "stop"}
+            return
+        parts = []
+        finish_reason = None
+        async for event in self.inner.translate_stream(
+            text, source_lang=source_lang, target_lang=target_lang, model=model,
+            system_prompt=system_prompt, user_prompt=user_prompt,
+            temperature=temperature, include_reasoning=include_reasoning,
+        ):
+            if event["type"] == "content":
+                parts.append(event["text"])
+            elif event["type"] == "done":
+                finish_reason = event.get("finish_reason")
+            yield event
+        # 被截断的输出不写入翻译记忆
+        if finish_reason != "length":
+            self._store("".join(parts).strip(), text, source_lang, target_lang, model,
+                        system_prompt, user_prompt, temperature)
@@ -0,0 +1,216 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPResponse:
+    """后台请求的结果快照（状态码、响应头、响应体）"""
+
+    def __init__(self, status: int, headers: dict, text: str):
+        self.status = status
+        self.headers = headers
+        self.text = text
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class HTTPStatusError(Exception):
+    """流式请求返回了错误状态码"""
+
+    def __init__(self, status: int, headers: dict, text: str):
+        super().__init__(f"HTTP {status} - {text}")
+        self.status = status
+        self.headers = headers
+        self.text = text
+
+
+_STREAM_END = object()
+
+
+class BackgroundIterator:
+    """在指定事件循环中消费异步迭代器，调用方线程同步读取结果"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, async_iterable):
+        self._items = queue.Queue()
+        self._future = asyncio.run_coroutine_threadsafe(self._consume(async_iterable), loop)
+
+    async def _consume(self, async_iterable):
+        try:
+            async for item in async_iterable:
+                self._items.put(item)
+        except Exception as exc:
+            self._items.put(exc)
+        finally:
+            self._items.put(_STREAM_END)
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self._items.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """停止消费（客户端断开或请求被拒绝时调用）"""
+        self._future.cancel()
+
+
+class SharedHTTPClient:
+    """共享的 aiohttp 连接池
+
+    Flask 的异步视图每个请求都运行在新的事件循环中，ClientSession 无法跨循环复用，
+    因此连接池固定在一个后台线程的事件循环里，调用方通过 run_coroutine_threadsafe
+    提交请求并在自己的循环中等待结果。调用方取消时，后台请求也会被取消。
+    """
+
+    def __init__(self, limit: int = None, limit_per_host: int = None,
+                 keepalive_timeout: float = None):
+        self.limit = limit if limit is not None else int(os.getenv("ATP_HTTP_POOL_LIMIT", "100"))
+        self.limit_per_host = (
+            limit_per_host if limit_per_host is not None
+            else int(os.getenv("ATP_HTTP_POOL_PER_HOST", "32"))
+        )
+        self.keepalive_timeout = (
+            keepalive_timeout if keepalive_timeout is not None
+            else float(os.getenv("ATP_HTTP_KEEPALIVE", "30"))
+        )
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._session = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="atp-http",
+                    daemon=True,
+                )
+                self._thread.start()
+            return self._loop
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # 只在后台循环中调用，无需加锁
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _post(self, url: str, headers: dict, payload: dict, timeout: float) -> HTTPResponse:
+        session = self._get_session()
+        async with session.post(
+            url,
+            headers=headers,
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            text = await response.text()
+            return HTTPResponse(response.status, dict(response.headers), text)
+
+    def submit(self, coro) -> asyncio.Future:
+        """把协程提交到后台循环，返回可在当前循环中等待的 future"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        return asyncio.wrap_future(future)
+
+    async def post_json(self, url: str, headers: dict, payload: dict,
+                        timeout: float = 60) -> HTTPResponse:
+        return await self.submit(self._post(url, headers, payload, timeout))
+
+    async def stream_lines(self, url: str, headers: dict, payload: dict, timeout: float = 120):
+        """发送流式请求，逐行产出响应体（用于 SSE）
+
+        请求在后台循环中执行，每行通过 call_soon_threadsafe 投递到调用方循环的队列。
+        调用方提前结束迭代时，后台请求随之取消。
+        """
+        caller_loop = asyncio.get_running_loop()
+        lines = asyncio.Queue()
+
+        def push(item):
+            try:
+                caller_loop.call_soon_threadsafe(lines.put_nowait, item)
+            except RuntimeError:
+                # 调用方循环已关闭
+                pass
+
+        async def producer():
+            try:
+                session = self._get_session()
+                async with session.post(
+                    url,
+                    headers=headers,
+                    json=payload,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                ) as response:
+                    if response.status >= 400:
+                        push(HTTPStatusError(response.status, dict(response.headers), await response.text()))
+                        return
+                    async for raw in response.content:
+                        push(raw.decode("utf-8", errors="replace").rstrip("\r\n"))
+            except Exception as exc:
+                push(exc)
+            finally:
+                push(_STREAM_END)
+
+        future = asyncio.run_coroutine_threadsafe(producer(), self._ensure_loop())
+        try:
+            while True:
+                item = await lines.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def iterate_sync(self, async_iterable) -> "BackgroundIterator":
+        """在后台循环中消费异步迭代器，以同步迭代器的形式产出（供 Flask 流式响应使用）
+
+        消费立即开始，产出的元素先缓存在队列中，因此可以在返回响应之前提前启动。
+        """
+        return BackgroundIterator(self._ensure_loop(), async_iterable)
+
+    def close(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None or loop.is_closed():
+            return
+
+        async def _close_session():
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(_close_session(), loop).result(timeout=5)
+        except Exception as exc:
+            logger.warning("关闭 HTTP 连接池时出错: %s", exc)
+        loop.call_soon_threadsafe(loop.stop)
+
+
+http_client = SharedHTTPClient()
+atexit.register(http_client.close)
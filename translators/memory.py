@@ -0,0 +1,183 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_INLINE_SPACE_RE = re.compile(r"[^\S\n]+")
+_LINE_EDGE_RE = re.compile(r" ?\n ?")
+
+
+def normalize_segment(text: Optional[str]) -> str:
+    """规范化文本：统一 Unicode 形式和换行符，折叠行内空白；保留换行，
+    以免分行不同的原文共用同一条译文"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    text = _INLINE_SPACE_RE.sub(" ", text)
+    return _LINE_EDGE_RE.sub("\n", text).strip()
+
+
+def make_memory_key(text, model, source_lang, target_lang,
+                    system_prompt=None, user_prompt=None, temperature=1.0) -> str:
+    """翻译记忆的键：规范化原文 + 模型 + 语言方向 + 提示词 + 温度"""
+    parts = [
+        normalize_segment(text),
+        model or "",
+        source_lang or "",
+        target_lang or "",
+        normalize_segment(system_prompt),
+        normalize_segment(user_prompt),
+        round(float(temperature or 0.0), 3),
+    ]
+    raw = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TranslationMemory:
+    """基于 SQLite 的持久化翻译记忆，按总字节数做 LRU 淘汰
+
+    参数:
+        path: 数据库文件路径
+        max_bytes: 存储译文的总字节上限，超出后按最近使用时间淘汰
+        enabled: 为 False 时完全旁路（不读不写）
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = None, enabled: bool = None):
+        data_dir = os.getenv("ATP_DATA_DIR", "data")
+        self.path = path or os.getenv("ATP_TM_PATH") or os.path.join(data_dir, "translation_memory.sqlite3")
+        self.max_bytes = (
+            max_bytes if max_bytes is not None
+            else int(float(os.getenv("ATP_TM_MAX_MB", "256")) * 1024 * 1024)
+        )
+        self.enabled = (
+            enabled if enabled is not None
+            else os.getenv("ATP_TM_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+        )
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._total_bytes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS memory (
+                    key TEXT PRIMARY KEY,
+                    translation TEXT NOT NULL,
+                    model TEXT,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_last_used ON memory(last_used)")
+            conn.commit()
+            self._total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM memory").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT translation FROM memory WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE memory SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+                self.hits += 1
+                return row[0]
+        except sqlite3.Error as exc:
+            logger.error("读取翻译记忆失败: %s", exc)
+            return None
+
+    def put(self, key: str, translation: str, model: str = None) -> None:
+        if not self.enabled or not translation:
+            return
+        size = len(translation.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                old = conn.execute("SELECT size FROM memory WHERE key = ?", (key,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO memory (key, translation, model, size, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, translation, model, size, now, now),
+                )
+                self._total_bytes += size - (old[0] if old else 0)
+                if self._total_bytes > self.max_bytes:
+                    self._evict(conn)
+                conn.commit()
+        except sqlite3.Error as exc:
+            logger.error("写入翻译记忆失败: %s", exc)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        # 多进程共享同一数据库时本地计数可能偏差，淘汰前重新统计
+        self._total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM memory").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        if self._total_bytes <= self.max_bytes:
+            return
+        cursor = conn.execute("SELECT key, size FROM memory ORDER BY last_used ASC")
+        victims = []
+        freed = 0
+        for key, size in cursor:
+            if self._total_bytes - freed <= target:
+                break
+            victims.append((key,))
+            freed += size
+        conn.executemany("DELETE FROM memory WHERE key = ?", victims)
+        self._total_bytes -= freed
+        self.evictions += len(victims)
+        logger.info("翻译记忆淘汰 %s 条，释放 %s 字节", len(victims), freed)
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM memory")
+            conn.commit()
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        entries = 0
+        if self.enabled:
+            try:
+                with self._lock:
+                    entries = self._connect().execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+            except sqlite3.Error as exc:
+                logger.error("读取翻译记忆统计失败: %s", exc)
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+translation_memory = TranslationMemory()
@@ -0,0 +1,163 @@
+import bisect
+import os
+import threading
+import time
+from collections import deque
+
+# 直方图：名称 -> (说明, 桶上界)
+_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+_FAST_SECONDS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+_TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+HISTOGRAMS = {
+    "atp_document_stage_seconds": ("文档翻译各阶段耗时（extraction/chunking/translation/realign/write）", _SECONDS_BUCKETS),
+    "atp_document_seconds": ("单个文档从开始到写出结果的总耗时", _SECONDS_BUCKETS),
+    "atp_chunk_seconds": ("单个文本块的翻译耗时（含续写、拆分重译和重试）", _SECONDS_BUCKETS),
+    "atp_model_request_seconds": ("单次模型 HTTP 请求的延迟", _SECONDS_BUCKETS),
+    "atp_classifier_seconds": ("请求判定调用模型的延迟", _SECONDS_BUCKETS),
+    "atp_glossary_match_seconds": ("单个文本块的术语匹配耗时", _FAST_SECONDS_BUCKETS),
+    "atp_glossary_build_seconds": ("术语表索引的构建耗时", _SECONDS_BUCKETS),
+    "atp_request_tokens": ("单次模型请求的 token 数（来自响应的 usage）", _TOKEN_BUCKETS),
+}
+# 计数器：名称 -> 说明
+COUNTERS = {
+    "atp_tokens_total": "模型请求累计 token 数（direction=in/out/cached/cache_write，cached 为命中前缀缓存的输入）",
+    "atp_model_requests_total": "模型 HTTP 请求数（按状态码）",
+    "atp_http_retries_total": "限流或上游暂时不可用导致的重试次数",
+    "atp_chunk_retries_total": "文本块翻译失败后的整块重试次数",
+    "atp_cache_lookups_total": "缓存查询次数（cache=translation_memory/verdict/glossary，result=hit/miss）",
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+
+class MetricsRegistry:
+    """进程内的指标：直方图和计数器，按标签分组，以 Prometheus 文本格式导出
+
+    每次记录同时追加到环形缓冲区，可通过 recent() 查看最近的原始事件。
+    """
+
+    def __init__(self, buffer_size: int = None):
+        buffer_size = buffer_size or int(os.getenv("ATP_METRICS_BUFFER", "2000"))
+        self._lock = threading.Lock()
+        self._histograms = {name: {} for name in HISTOGRAMS}
+        self._counters = {name: {} for name in COUNTERS}
+        self._events = deque(maxlen=buffer_size)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        buckets = HISTOGRAMS[name][1]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms[name].get(key)
+            if series is None:
+                series = self._histograms[name][key] = _Histogram(buckets)
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                series.counts[index] += 1
+            series.total += 1
+            series.sum += value
+            self._events.append((time.time(), name, labels, value))
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        if name not in COUNTERS:
+            raise KeyError(name)
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counters = self._counters[name]
+            counters[key] = counters.get(key, 0) + amount
+            self._events.append((time.time(), name, labels, amount))
+
+    def time(self, name: str, **labels) -> "_Timer":
+        """with metrics.time(...): 记录代码块耗时"""
+        return _Timer(self, name, labels)
+
+    def recent(self, limit: int = 200, name: str = None) -> list:
+        with self._lock:
+            events = list(self._events)
+        if name:
+            events = [event for event in events if event[1] == name]
+        return [
+            {"time": round(timestamp, 3), "metric": metric, "labels": labels, "value": value}
+            for timestamp, metric, labels, value in events[-limit:]
+        ]
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            for name, (help_text, buckets) in HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, series in self._histograms[name].items():
+                    cumulative = 0
+                    for bound, count in zip(buckets, series.counts):
+                        cumulative += count
+                        le = 'le="%s"' % _format_number(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key, le)} {cumulative}")
+                    le = 'le="+Inf"'
+                    lines.append(f"{name}_bucket{_format_labels(key, le)} {series.total}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_number(series.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {series.total}")
+            for name, help_text in COUNTERS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in self._counters[name].items():
+                    lines.append(f"{name}{_format_labels(key)} {_format_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class _Timer:
+    def __init__(self, registry: MetricsRegistry, name: str, labels: dict):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+def timed_iterator(iterator, on_elapsed):
+    """逐个产出 iterator 的元素，取每个元素花费的时间累加后交给 on_elapsed(秒数)"""
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                return
+            elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        on_elapsed(elapsed)
+
+
+metrics = MetricsRegistry()
@@ -1,20 +1,52 @@
+import asyncio
+import json
 import logging
 import os
+import time
 from typing import Optional, Union
 
 import requests
 
 from .base import BaseTranslator
+from .http_client import HTTPStatusError, http_client
+from .metrics import metrics
+from .prompts import (
+    apply_cache_control,
+    cache_write_tokens,
+    cached_prompt_tokens,
+    default_system_prompt,
+    default_user_prompt,
+)
+from .rate_limiter import (
+    MAX_RATE_RETRIES,
+    RETRYABLE_STATUS,
+    backoff_delay,
+    parse_retry_after,
+    rate_limiter,
+    send_with_backoff,
+)
+from .tokenizer import output_token_limit
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+
+
+def openrouter_base_url() -> str:
+    """OpenRouter 兼容接口的地址，可用 OPENROUTER_BASE_URL 指向代理或本地桩服务"""
+    return (os.getenv("OPENROUTER_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+
+
+CONTINUATION_PROMPT = "译文在上面中断了。请从中断处继续输出剩余的译文，不要重复已输出的内容，也不要添加任何说明。"
+
 
 class OpenRouterTranslator(BaseTranslator):
     def __init__(self, api_key: str):
         super().__init__(api_key)
-        self.base_url = "https://openrouter.ai/api/v1"
+        self.base_url = openrouter_base_url()
         self.site_url = os.getenv("OPENROUTER_SITE_URL") or os.getenv("OPENROUTER_REFERRER")
         self.app_title = os.getenv("OPENROUTER_APP_NAME", "ATP")
+        self.timeout = 60
 
     def _build_headers(self) -> dict:
         headers = {
@@ -27,6 +59,96 @@ class OpenRouterTranslator(BaseTranslator):
             headers["X-Title"] = self.app_title
         return headers
 
+    def _build_payload(
+        self,
+        text: str,
+        source_lang: str,
+        target_lang: str,
+        model: str,
+        system_prompt: Optional[str],
+        user_prompt: Optional[str],
+        temperature: float,
+        include_reasoning: bool,
+        continuation: Optional[str] = None,
+    ) -> dict:
+        if not self.api_key:
+            raise ValueError("OpenRouter API密钥不能为空")
+
+        if not model:
+            raise ValueError("模型名称不能为空")
+
+        if not system_prompt:
+            system_prompt = default_system_prompt(source_lang, target_lang)
+
+        if not user_prompt:
+            user_prompt = default_user_prompt(text, target_lang)
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        if continuation is not None:
+            # 把已输出的部分作为助手消息带回，请求模型接着写；部分提供方不接受以空白结尾的助手消息，
+            # 截断处的空白由调用方在拼接时保留
+            messages.append({"role": "assistant", "content": continuation.rstrip()})
+            messages.append({"role": "user", "content": CONTINUATION_PROMPT})
+
+        payload = {
+            "model": model,
+            # system 消息是同一任务各块共用的前缀，支持的模型上标记为可缓存
+            "messages": apply_cache_control(messages, model),
+            "temperature": temperature,
+            "top_p": 0.95,
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0,
+            "max_tokens": output_token_limit(model, text),
+        }
+        if include_reasoning:
+            payload["include_reasoning"] = True
+        return payload
+
+    def _parse_result(self, result: dict, include_reasoning: bool) -> Optional[Union[str, dict]]:
+        if "choices" in result and result["choices"]:
+            message = result["choices"][0].get("message", {})
+            content = (message.get("content") or "").strip()
+            reasoning = message.get("reasoning") or message.get("reasoning_content")
+            if include_reasoning:
+                return {"text": content, "reasoning": reasoning}
+            return content
+
+        logger.error("OpenRouter 返回结果格式错误: %s", result)
+        return None
+
+    @staticmethod
+    def _record_usage(model: str, usage) -> None:
+        if not isinstance(usage, dict):
+            return
+        for direction, field in (("in", "prompt_tokens"), ("out", "completion_tokens")):
+            tokens = usage.get(field)
+            if isinstance(tokens, (int, float)):
+                metrics.inc("atp_tokens_total", tokens, model=model, direction=direction)
+                metrics.observe("atp_request_tokens", tokens, model=model, direction=direction)
+        for direction, tokens in (("cached", cached_prompt_tokens(usage)), ("cache_write", cache_write_tokens(usage))):
+            if tokens:
+                metrics.inc("atp_tokens_total", tokens, model=model, direction=direction)
+
+    def _parse_detailed(self, result: dict) -> Optional[dict]:
+        if "choices" in result and result["choices"]:
+            choice = result["choices"][0]
+            message = choice.get("message", {})
+            content = message.get("content") or ""
+            return {
+                "text": content.strip(),
+                # 原始输出：续写拼接时需要保留截断处的换行和空格
+                "raw_text": content,
+                "reasoning": message.get("reasoning") or message.get("reasoning_content") or "",
+                "finish_reason": choice.get("finish_reason"),
+                "usage": result.get("usage"),
+            }
+
+        logger.error("OpenRouter 返回结果格式错误: %s", result)
+        return None
+
     def translate(
         self,
         text: str,
@@ -39,58 +161,34 @@ class OpenRouterTranslator(BaseTranslator):
         include_reasoning: bool = False,
     ) -> Optional[Union[str, dict]]:
         try:
-            if not self.api_key:
-                raise ValueError("OpenRouter API密钥不能为空")
-
-            if not model:
-                raise ValueError("模型名称不能为空")
+            payload = self._build_payload(
+                text, source_lang, target_lang, model,
+                system_prompt, user_prompt, temperature, include_reasoning,
+            )
 
-            if not system_prompt:
-                system_prompt = (
-                    f"你是一个专业翻译，擅长从{source_lang}到{target_lang}的翻译。"
-                    "请保持原文的语气和风格，确保翻译准确、流畅。"
+            for attempt in range(MAX_RATE_RETRIES + 1):
+                rate_limiter.acquire_sync(self.api_key, model)
+                response = requests.post(
+                    f"{self.base_url}/chat/completions",
+                    headers=self._build_headers(),
+                    json=payload,
+                    timeout=self.timeout,
                 )
-
-            if not user_prompt:
-                user_prompt = f"请将以下内容翻译为{target_lang}:\n\n{text}"
-
-            payload = {
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "temperature": temperature,
-                "top_p": 0.95,
-                "frequency_penalty": 0.0,
-                "presence_penalty": 0.0,
-                "max_tokens": 2000,
-            }
-            if include_reasoning:
-                payload["include_reasoning"] = True
-
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self._build_headers(),
-                json=payload,
-                timeout=60,
-            )
+                if response.status_code not in RETRYABLE_STATUS or attempt == MAX_RATE_RETRIES:
+                    break
+                retry_after = parse_retry_after(response.headers)
+                if response.status_code == 429:
+                    rate_limiter.record_throttle(self.api_key, model, retry_after)
+                    if retry_after is not None:
+                        continue
+                time.sleep(retry_after if retry_after is not None else backoff_delay(attempt))
             response.raise_for_status()
-            result = response.json()
-
-            if "choices" in result and result["choices"]:
-                message = result["choices"][0].get("message", {})
-                content = (message.get("content") or "").strip()
-                reasoning = message.get("reasoning") or message.get("reasoning_content")
-                if include_reasoning:
-                    return {"text": content, "reasoning": reasoning}
-                return content
-
-            logger.error("OpenRouter 返回结果格式错误: %s", result)
-            return None
+            rate_limiter.record_success(self.api_key, model, response.headers)
+            return self._parse_result(response.json(), include_reasoning)
         except requests.HTTPError as exc:
-            status = exc.response.status_code if exc.response else "unknown"
-            detail = exc.response.text if exc.response else "no response body"
+            # Response 的布尔值表示是否成功，这里必须与 None 比较
+            status = exc.response.status_code if exc.response is not None else "unknown"
+            detail = exc.response.text if exc.response is not None else "no response body"
             if include_reasoning and detail and "reason" in detail.lower():
                 logger.warning("OpenRouter 推理字段不可用，回退为普通请求: %s", detail)
                 return self.translate(
@@ -108,3 +206,185 @@ class OpenRouterTranslator(BaseTranslator):
         except Exception as exc:
             logger.error("OpenRouter 翻译出错: %s", exc)
             return None
+
+    async def translate_async(
+        self,
+        text: str,
+        source_lang: str = "英文",
+        target_lang: str = "中文",
+        model: str = "openai/gpt-4o",
+        system_prompt: Optional[str] = None,
+        user_prompt: Optional[str] = None,
+        temperature: float = 1.0,
+        include_reasoning: bool = False,
+    ) -> Optional[Union[str, dict]]:
+        """与 translate 相同，但通过共享的 aiohttp 连接池发送请求"""
+        detailed = await self.translate_detailed(
+            text,
+            source_lang=source_lang,
+            target_lang=target_lang,
+            model=model,
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            temperature=temperature,
+            include_reasoning=include_reasoning,
+        )
+        if detailed is None:
+            return None
+        if include_reasoning:
+            return {"text": detailed["text"], "reasoning": detailed["reasoning"]}
+        return detailed["text"]
+
+    async def translate_detailed(
+        self,
+        text: str,
+        source_lang: str = "英文",
+        target_lang: str = "中文",
+        model: str = "openai/gpt-4o",
+        system_prompt: Optional[str] = None,
+        user_prompt: Optional[str] = None,
+        temperature: float = 1.0,
+        include_reasoning: bool = False,
+        continuation: Optional[str] = None,
+    ) -> Optional[dict]:
+        """返回译文及 finish_reason、usage；continuation 为被截断的译文时请求续写
+
+        text 为去掉首尾空白的译文，raw_text 为模型的原始输出，续写时用后者拼接。
+        """
+        try:
+            payload = self._build_payload(
+                text, source_lang, target_lang, model,
+                system_prompt, user_prompt, temperature, include_reasoning, continuation,
+            )
+
+            response = await send_with_backoff(
+                self.api_key, model,
+                lambda: http_client.post_json(
+                    f"{self.base_url}/chat/completions",
+                    headers=self._build_headers(),
+                    payload=payload,
+                    timeout=self.timeout,
+                ),
+            )
+            if not response.ok:
+                detail = response.text or "no response body"
+                if include_reasoning and "reason" in detail.lower():
+                    logger.warning("OpenRouter 推理字段不可用，回退为普通请求: %s", detail)
+                    return await self.translate_detailed(
+                        text,
+                        source_lang=source_lang,
+                        target_lang=target_lang,
+                        model=model,
+                        system_prompt=system_prompt,
+                        user_prompt=user_prompt,
+                        temperature=temperature,
+                        include_reasoning=False,
+                        continuation=continuation,
+                    )
+                logger.error("OpenRouter 翻译出错: HTTP %s - %s", response.status, detail)
+                return None
+            result = response.json()
+            self._record_usage(model, result.get("usage"))
+            return self._parse_detailed(result)
+        except Exception as exc:
+            logger.error("OpenRouter 翻译出错: %s", exc)
+            return None
+
+    async def _stream_with_backoff(self, payload: dict, model: str):
+        """发送流式请求；尚未收到任何内容时遇到限流或暂时不可用，按限速器退避后重试"""
+        attempt = 0
+        while True:
+            await rate_limiter.acquire(self.api_key, model)
+            started = False
+            try:
+                async for line in http_client.stream_lines(
+                    f"{self.base_url}/chat/completions",
+                    headers=self._build_headers(),
+                    payload=payload,
+                    timeout=self.timeout * 2,
+                ):
+                    if not started:
+                        started = True
+                        rate_limiter.record_success(self.api_key, model)
+                    yield line
+                return
+            except HTTPStatusError as exc:
+                if started or exc.status not in RETRYABLE_STATUS or attempt >= MAX_RATE_RETRIES:
+                    raise
+                retry_after = parse_retry_after(exc.headers)
+                if exc.status == 429:
+                    rate_limiter.record_throttle(self.api_key, model, retry_after)
+                    delay = 0.0 if retry_after is not None else backoff_delay(attempt)
+                else:
+                    delay = retry_after if retry_after is not None else backoff_delay(attempt)
+                logger.warning("OpenRouter 流式请求 HTTP %s，第 %s 次重试", exc.status, attempt + 1)
+                attempt += 1
+                if delay:
+                    await asyncio.sleep(delay)
+
+    async def translate_stream(
+        self,
+        text: str,
+        source_lang: str = "英文",
+        target_lang: str = "中文",
+        model: str = "openai/gpt-4o",
+        system_prompt: Optional[str] = None,
+        user_prompt: Optional[str] = None,
+        temperature: float = 1.0,
+        include_reasoning: bool = False,
+    ):
+        """使用 stream 模式翻译，逐个产出增量事件
+
+        事件格式: {"type": "reasoning" | "content", "text": 增量文本}，
+        最后产出 {"type": "done", "finish_reason": ...}。
+        """
+        payload = self._build_payload(
+            text, source_lang, target_lang, model,
+            system_prompt, user_prompt, temperature, include_reasoning,
+        )
+        payload["stream"] = True
+
+        finish_reason = None
+        try:
+            async for line in self._stream_with_backoff(payload, model):
+                # 跳过空行和 ": OPENROUTER PROCESSING" 之类的注释行
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"].get("message") or chunk["error"])
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                choice = choices[0]
+                delta = choice.get("delta") or {}
+                reasoning = delta.get("reasoning") or delta.get("reasoning_content")
+                if reasoning and include_reasoning:
+                    yield {"type": "reasoning", "text": reasoning}
+                content = delta.get("content")
+                if content:
+                    yield {"type": "content", "text": content}
+                if choice.get("finish_reason"):
+                    finish_reason = choice["finish_reason"]
+        except HTTPStatusError as exc:
+            if include_reasoning and "reason" in (exc.text or "").lower():
+                logger.warning("OpenRouter 推理字段不可用，回退为普通请求: %s", exc.text)
+                async for event in self.translate_stream(
+                    text,
+                    source_lang=source_lang,
+                    target_lang=target_lang,
+                    model=model,
+                    system_prompt=system_prompt,
+                    user_prompt=user_prompt,
+                    temperature=temperature,
+                    include_reasoning=False,
+                ):
+                    yield event
+                return
+            logger.error("OpenRouter 流式翻译出错: HTTP %s - %s", exc.status, exc.text)
+            raise
+
+        yield {"type": "done", "finish_reason": finish_reason}
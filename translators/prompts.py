@@ -0,0 +1,141 @@
+import os
+from typing import Optional
+
+from .tokenizer import count_tokens
+
+# 支持显式缓存断点（cache_control）的模型；OpenAI、DeepSeek 等提供方会自动缓存相同的前缀
+CACHE_CONTROL_PREFIXES = ("anthropic/", "google/gemini")
+PROMPT_CACHE_ENABLED = os.getenv("ATP_PROMPT_CACHE", "1").lower() not in ("0", "false", "no", "off")
+# 前缀短于该 token 数时不加缓存断点（低于提供方的最小可缓存长度，标记无效）
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("ATP_PROMPT_CACHE_MIN_TOKENS", "1024"))
+
+
+def default_system_prompt(source_lang: str, target_lang: str) -> str:
+    return (
+        f"你是一个专业翻译，擅长从{source_lang}到{target_lang}的翻译。"
+        "请保持原文的语气和风格，确保翻译准确、流畅。"
+    )
+
+
+def default_user_prompt(text: str, target_lang: str) -> str:
+    return f"请将以下内容翻译为{target_lang}:\n\n{text}"
+
+
+class PromptLayout:
+    """一个翻译任务内所有文本块共用的提示词
+
+    system 消息依次为角色说明、补充要求、翻译要求和附加段落（如术语表），在整个任务内逐字节不变，
+    作为服务端可缓存的公共前缀；user 消息为本块出现的术语、上文（均可选）和固定的一行指令，文本块放在最后。
+
+    参数:
+        system_extra: 补充要求（用户的系统提示词、DOCX 格式标记说明等）
+        user_extra: 翻译要求（用户的额外提示词）
+        sections: 附加到 system 消息末尾的 (标题, 内容) 列表
+    """
+
+    def __init__(self, source_lang: str, target_lang: str, system_extra: str = "",
+                 user_extra: str = "", sections=None):
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        parts = [default_system_prompt(source_lang, target_lang)]
+        system_extra = (system_extra or "").strip()
+        user_extra = (user_extra or "").strip()
+        if system_extra:
+            parts.append(f"补充要求：{system_extra}")
+        if user_extra:
+            parts.append(f"翻译要求：{user_extra}")
+        for title, body in sections or []:
+            if body:
+                parts.append(f"{title}：\n{body.strip()}")
+        self.customized = len(parts) > 1
+        self.system_prompt = "\n".join(parts)
+
+    def user_prompt(self, text: str, context: dict = None, terms=None) -> str:
+        """context 为 {"source": 上文原文, "translation": 上文译文}，terms 为本块出现的 (原文, 译文) 术语，
+        均放在指令之前，文本块仍在最后"""
+        parts = []
+        if terms:
+            lines = "\n".join(f"{source} → {target}" for source, target in terms)
+            parts.append(f"术语表（本段出现的术语，请使用以下译法）：\n{lines}")
+        if context and context.get("source"):
+            parts.append(f"上文（仅用于保持术语和风格一致，不要翻译或输出）：\n{context['source']}")
+            if context.get("translation"):
+                parts.append(f"上文译文：\n{context['translation']}")
+        return "\n\n".join(parts + [default_user_prompt(text, self.target_lang)])
+
+    def prompt_kwargs(self, text: str, context: dict = None, terms=None) -> dict:
+        """翻译器的 system_prompt / user_prompt 参数；未定制且没有上文和术语时为 None，由翻译器使用相同的默认提示词"""
+        if not self.customized and not terms and not (context and context.get("source")):
+            return {"system_prompt": None, "user_prompt": None}
+        return {"system_prompt": self.system_prompt, "user_prompt": self.user_prompt(text, context, terms)}
+
+
+def supports_cache_control(model: Optional[str]) -> bool:
+    return bool(model) and model.lower().startswith(CACHE_CONTROL_PREFIXES)
+
+
+def apply_cache_control(messages: list, model: Optional[str]) -> list:
+    """模型支持显式缓存且 system 消息足够长时，在 system 消息末尾加缓存断点"""
+    if not PROMPT_CACHE_ENABLED or not supports_cache_control(model):
+        return messages
+    if not messages or messages[0].get("role") != "system" or not isinstance(messages[0].get("content"), str):
+        return messages
+    system_prompt = messages[0]["content"]
+    if count_tokens(system_prompt, model) < PROMPT_CACHE_MIN_TOKENS:
+        return messages
+    cached = {
+        "role": "system",
+        "content": [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}],
+    }
+    return [cached] + messages[1:]
+
+
+def _details(usage: dict) -> dict:
+    details = usage.get("prompt_tokens_details")
+    return details if isinstance(details, dict) else {}
+
+
+def cached_prompt_tokens(usage) -> int:
+    """响应 usage 中命中前缀缓存的输入 token 数"""
+    if not isinstance(usage, dict):
+        return 0
+    value = _details(usage).get("cached_tokens", usage.get("cache_read_input_tokens"))
+    return int(value) if isinstance(value, (int, float)) else 0
+
+
+def cache_write_tokens(usage) -> int:
+    """响应 usage 中写入前缀缓存的输入 token 数（仅部分提供方返回）"""
+    if not isinstance(usage, dict):
+        return 0
+    value = _details(usage).get("cache_write_tokens", usage.get("cache_creation_input_tokens"))
+    return int(value) if isinstance(value, (int, float)) else 0
+
+
+class PromptUsage:
+    """累计一个任务的输入、输出 token 数及命中前缀缓存的比例"""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cache_write_tokens = 0
+
+    def add(self, usage) -> None:
+        if not isinstance(usage, dict):
+            return
+        self.requests += 1
+        self.prompt_tokens += int(usage.get("prompt_tokens") or 0)
+        self.completion_tokens += int(usage.get("completion_tokens") or 0)
+        self.cached_tokens += cached_prompt_tokens(usage)
+        self.cache_write_tokens += cache_write_tokens(usage)
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+            "cache_hit_ratio": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+        }
@@ -0,0 +1,229 @@
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 触发退避重试的状态码：限流，以及网关/上游暂时不可用
+RETRYABLE_STATUS = {429, 502, 503, 504, 529}
+# 限流或上游暂时不可用时的最大重试次数
+MAX_RATE_RETRIES = int(os.getenv("ATP_RATE_MAX_RETRIES", "4"))
+# 多进程部署时的工作进程数（asgi.serve 启动时设置）。各进程的并发上限和限速互不相通，
+# 按进程数平分配置的总量，所有进程合计不超过配置值
+WORKER_PROCESSES = max(1, int(os.getenv("ATP_WORKER_PROCESSES", "1")))
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def worker_share(value):
+    """每个工作进程分得的份额：整数上限平分后至少为 1（0 表示不限制，保持不变），速率按比例平分"""
+    if isinstance(value, int):
+        return max(1, value // WORKER_PROCESSES) if value > 0 else value
+    return value / WORKER_PROCESSES
+
+
+def _parse_duration(value: str):
+    """解析 "1.5"、"6m0s"、"250ms" 形式的时长（秒），无法解析时返回 None"""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def parse_retry_after(headers, now: float = None):
+    """从响应头推算需要等待的秒数：Retry-After（秒数或 HTTP 日期），
+    或剩余额度为 0 时的 X-RateLimit-Reset（秒/毫秒时间戳或时长）。无提示时返回 None
+    """
+    if not headers:
+        return None
+    now = time.time() if now is None else now
+    lowered = {str(name).lower(): str(value) for name, value in headers.items()}
+
+    retry_after = lowered.get("retry-after")
+    if retry_after:
+        seconds = _parse_duration(retry_after)
+        if seconds is None:
+            try:
+                seconds = email.utils.parsedate_to_datetime(retry_after).timestamp() - now
+            except (TypeError, ValueError):
+                seconds = None
+        if seconds is not None:
+            return max(0.0, seconds)
+
+    remaining = lowered.get("x-ratelimit-remaining") or lowered.get("x-ratelimit-remaining-requests")
+    reset = lowered.get("x-ratelimit-reset") or lowered.get("x-ratelimit-reset-requests")
+    if remaining is None or reset is None:
+        return None
+    try:
+        if float(remaining) > 0:
+            return None
+    except ValueError:
+        return None
+    seconds = _parse_duration(reset)
+    if seconds is None:
+        return None
+    if seconds > 1e12:
+        seconds = seconds / 1000 - now
+    elif seconds > 1e9:
+        seconds -= now
+    return max(0.0, seconds)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """指数退避加全抖动：在 [0, min(cap, base * 2^attempt)] 内均匀取值"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class _Bucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self.requests = 0
+
+
+class AdaptiveRateLimiter:
+    """按 (API Key, 模型) 的令牌桶限速，速率随服务端反馈自适应调整
+
+    起始速率较高，成功响应时缓慢加速（加性增加），收到 429 时速率减半（乘性减少），
+    并按 Retry-After / X-RateLimit-Reset 暂停该桶，因此实际吞吐量会贴近服务端真实的限额，
+    无需预设保守的固定间隔。令牌可预支为负数，等待者按预约顺序依次放行。
+    桶状态用线程锁保护，可在多个事件循环和线程间共享。
+    """
+
+    def __init__(self, initial_rate: float = None, max_rate: float = None,
+                 min_rate: float = None, increase: float = None):
+        # 配置值为所有工作进程合计的速率
+        self.initial_rate = initial_rate or worker_share(float(os.getenv("ATP_RATE_INITIAL_RPS", "8")))
+        self.max_rate = max_rate or worker_share(float(os.getenv("ATP_RATE_MAX_RPS", "50")))
+        self.min_rate = min_rate or worker_share(float(os.getenv("ATP_RATE_MIN_RPS", "0.2")))
+        self.increase = increase or worker_share(float(os.getenv("ATP_RATE_INCREASE", "0.2")))
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _bucket(self, key) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self.initial_rate, max(1.0, self.initial_rate))
+        return bucket
+
+    def reserve(self, api_key: str, model: str = None) -> float:
+        """预约一次请求，返回需要等待的秒数"""
+        with self._lock:
+            bucket = self._bucket((api_key, model))
+            now = time.monotonic()
+            bucket.tokens = min(bucket.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+            bucket.tokens -= 1
+            bucket.requests += 1
+            wait = -bucket.tokens / bucket.rate if bucket.tokens < 0 else 0.0
+            return max(wait, bucket.blocked_until - now)
+
+    def paused(self, api_key: str, model: str = None) -> float:
+        """该桶因限流暂停的剩余秒数"""
+        with self._lock:
+            bucket = self._buckets.get((api_key, model))
+            return max(0.0, bucket.blocked_until - time.monotonic()) if bucket else 0.0
+
+    async def acquire(self, api_key: str, model: str = None) -> None:
+        wait = self.reserve(api_key, model)
+        # 等待期间可能收到限流响应，醒来后若桶已暂停则继续等待
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.paused(api_key, model)
+
+    def acquire_sync(self, api_key: str, model: str = None) -> None:
+        wait = self.reserve(api_key, model)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.paused(api_key, model)
+
+    def record_success(self, api_key: str, model: str = None, headers=None) -> None:
+        """成功响应：加性提速；额度已用尽时按重置时间暂停"""
+        pause = parse_retry_after(headers)
+        with self._lock:
+            bucket = self._bucket((api_key, model))
+            bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+            bucket.burst = max(1.0, bucket.rate)
+            if pause:
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + pause)
+
+    def record_throttle(self, api_key: str, model: str = None, retry_after: float = None) -> None:
+        """收到限流响应：速率减半，并暂停到服务端提示的时间"""
+        with self._lock:
+            bucket = self._bucket((api_key, model))
+            bucket.throttled += 1
+            bucket.rate = max(self.min_rate, bucket.rate / 2)
+            bucket.burst = max(1.0, bucket.rate)
+            bucket.tokens = min(bucket.tokens, 0.0)
+            if retry_after:
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+            rate = bucket.rate
+        logger.warning(f"模型 {model} 被限流，速率降至 {rate:.2f} 次/秒"
+                       + (f"，{retry_after:.1f} 秒后重试" if retry_after else ""))
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                f"…{api_key[-4:] if api_key else ''}/{model}": {
+                    "rate_per_second": round(bucket.rate, 3),
+                    "requests": bucket.requests,
+                    "throttled": bucket.throttled,
+                    "paused_seconds": round(max(0.0, bucket.blocked_until - now), 1),
+                }
+                for (api_key, model), bucket in self._buckets.items()
+            }
+
+
+rate_limiter = AdaptiveRateLimiter()
+
+
+async def send_with_backoff(api_key: str, model: str, send, max_retries: int = None):
+    """按限速器节奏发送请求，限流或暂时不可用时指数退避重试
+
+    send 为无参数的协程函数，返回带 status、headers 的响应；返回最后一次的响应。
+    """
+    max_retries = MAX_RATE_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        await rate_limiter.acquire(api_key, model)
+        started = time.perf_counter()
+        response = await send()
+        metrics.observe("atp_model_request_seconds", time.perf_counter() - started, model=model)
+        metrics.inc("atp_model_requests_total", model=model, status=response.status)
+        if response.status not in RETRYABLE_STATUS:
+            if response.ok:
+                rate_limiter.record_success(api_key, model, response.headers)
+            return response
+        retry_after = parse_retry_after(response.headers)
+        if response.status == 429:
+            rate_limiter.record_throttle(api_key, model, retry_after)
+        if attempt >= max_retries:
+            return response
+        if retry_after is None:
+            delay = backoff_delay(attempt)
+        else:
+            # 429 的 Retry-After 已使限速器暂停该桶，其他状态码直接按提示等待
+            delay = 0.0 if response.status == 429 else retry_after
+        logger.warning(f"HTTP {response.status}，第 {attempt + 1} 次重试" + (f"（{delay:.1f} 秒后）" if delay else ""))
+        metrics.inc("atp_http_retries_total", model=model, status=response.status)
+        attempt += 1
+        if delay:
+            await asyncio.sleep(delay)
@@ -0,0 +1,313 @@
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from .base import BaseTranslator
+from .openrouter import OpenRouterTranslator
+
+logger = logging.getLogger(__name__)
+
+# 对冲请求：主请求超过 p95 延迟仍未返回时，向第二个后端再发一份
+HEDGING_ENABLED = os.getenv("ATP_HEDGE", "1").lower() not in ("0", "false", "no", "off")
+# 延迟样本不足时使用的对冲等待秒数，以及对冲等待的下限
+HEDGE_DEFAULT_DELAY = float(os.getenv("ATP_HEDGE_DEFAULT_DELAY", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("ATP_HEDGE_MIN_DELAY", "2"))
+# 连续失败达到该次数后，后端暂停使用 ATP_BACKEND_COOLDOWN 秒
+BACKEND_FAILURE_THRESHOLD = int(os.getenv("ATP_BACKEND_FAILURE_THRESHOLD", "3"))
+BACKEND_COOLDOWN = float(os.getenv("ATP_BACKEND_COOLDOWN", "30"))
+
+
+class Backend:
+    """一个 (API Key, 模型) 组合"""
+
+    def __init__(self, api_key: str, model: str):
+        self.api_key = api_key
+        self.model = model
+        self.translator = OpenRouterTranslator(api_key)
+
+    @property
+    def key(self) -> tuple:
+        return (self.api_key, self.model)
+
+
+class _Health:
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.inflight = 0
+        self.hedges = 0
+
+
+class BackendHealth:
+    """按后端统计最近的延迟和成功率，跨请求共享
+
+    排序分数为 平均延迟 × (1 + 4 × 错误率) × (1 + 0.25 × 在途请求数)，越小越健康；
+    还没有样本的后端分数为 0，会被优先尝试一次。连续失败的后端冷却一段时间后再参与排序。
+    """
+
+    def __init__(self, window: int = 50):
+        self.window = window
+        self._lock = threading.Lock()
+        self._backends = {}
+
+    def _entry(self, key) -> _Health:
+        entry = self._backends.get(key)
+        if entry is None:
+            entry = self._backends[key] = _Health(self.window)
+        return entry
+
+    def _score(self, entry: _Health, now: float) -> float:
+        if entry.cooldown_until > now:
+            return math.inf
+        if not entry.outcomes and not entry.latencies:
+            return 0.0
+        # 只有失败记录时按默认对冲等待估计延迟
+        latency = sum(entry.latencies) / len(entry.latencies) if entry.latencies else HEDGE_DEFAULT_DELAY
+        error_rate = entry.outcomes.count(False) / len(entry.outcomes) if entry.outcomes else 0.0
+        return latency * (1 + 4 * error_rate) * (1 + 0.25 * entry.inflight)
+
+    def rank(self, backends: list) -> list:
+        """按健康程度排序（冷却中的排在最后，同分保持原顺序）"""
+        with self._lock:
+            now = time.monotonic()
+            scores = {id(backend): self._score(self._entry(backend.key), now) for backend in backends}
+        return sorted(backends, key=lambda backend: scores[id(backend)])
+
+    def hedge_delay(self, backend: Backend) -> float:
+        """该后端最近成功请求延迟的 p95，样本不足时使用默认值"""
+        with self._lock:
+            latencies = sorted(self._entry(backend.key).latencies)
+        if len(latencies) < 5:
+            return HEDGE_DEFAULT_DELAY
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return max(HEDGE_MIN_DELAY, p95)
+
+    def started(self, backend: Backend) -> None:
+        with self._lock:
+            self._entry(backend.key).inflight += 1
+
+    def finished(self, backend: Backend, success: Optional[bool], latency: float) -> None:
+        """success 为 None 表示请求被取消（对冲中落败）：不计成败，
+        已等待的时间作为延迟的下限计入，慢后端因此会排到后面"""
+        with self._lock:
+            entry = self._entry(backend.key)
+            entry.inflight -= 1
+            if success is None:
+                entry.latencies.append(latency)
+                return
+            entry.outcomes.append(success)
+            if success:
+                entry.latencies.append(latency)
+                entry.consecutive_failures = 0
+                return
+            entry.consecutive_failures += 1
+            if entry.consecutive_failures >= BACKEND_FAILURE_THRESHOLD:
+                entry.cooldown_until = time.monotonic() + BACKEND_COOLDOWN
+                entry.consecutive_failures = 0
+                logger.warning(f"后端 {backend.model} 连续失败，暂停使用 {BACKEND_COOLDOWN:.0f} 秒")
+
+    def record_hedge(self, backend: Backend) -> None:
+        with self._lock:
+            self._entry(backend.key).hedges += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            result = {}
+            for (api_key, model), entry in self._backends.items():
+                latencies = sorted(entry.latencies)
+                result[f"…{api_key[-4:] if api_key else ''}/{model}"] = {
+                    "requests": len(entry.outcomes),
+                    "error_rate": round(entry.outcomes.count(False) / len(entry.outcomes), 4)
+                    if entry.outcomes else 0.0,
+                    "avg_latency": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                    "p95_latency": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3)
+                    if latencies else None,
+                    "inflight": entry.inflight,
+                    "hedges": entry.hedges,
+                    "cooling_down": entry.cooldown_until > now,
+                }
+            return result
+
+
+backend_health = BackendHealth()
+
+
+def parse_backends(value, api_key: str) -> list:
+    """解析备用后端配置，返回 [(api_key, model)]
+
+    支持逗号分隔的模型名（使用同一个 API Key），或 JSON 数组：
+    ["model", {"model": "...", "api_key": "..."}]，未给出 api_key 时使用主 Key。
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith("["):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise ValueError("备用模型配置不是有效的 JSON")
+        else:
+            value = [item.strip() for item in value.split(",")]
+
+    backends = []
+    for item in value:
+        if isinstance(item, str):
+            model, key = item, api_key
+        elif isinstance(item, dict):
+            model, key = item.get("model"), item.get("api_key") or api_key
+        else:
+            continue
+        if model and (key, model) not in backends:
+            backends.append((key, model))
+    return backends
+
+
+class RouterTranslator(BaseTranslator):
+    """在多个 (API Key, 模型) 后端之间路由的翻译器
+
+    每次请求发给最健康的后端；失败时立即改用下一个后端；超过该后端 p95 延迟仍未返回时，
+    向下一个后端发出对冲请求，先成功的结果胜出，其余请求取消。调用方传入的 model 参数
+    被忽略，实际使用的模型记录在结果的 "model" 字段中。
+
+    slot 为 slot(api_key, model)，返回异步上下文管理器：每个请求（含对冲和失败后的接替请求）
+    发给某个后端前先进入该后端的上下文，用于按各自的 Key 和模型占用并发名额。
+    """
+
+    def __init__(self, backends, health: BackendHealth = None, hedging: bool = None, slot=None):
+        backends = [Backend(api_key, model) for api_key, model in backends]
+        if not backends:
+            raise ValueError("至少需要一个后端")
+        super().__init__(backends[0].api_key)
+        self.backends = backends
+        self.health = health or backend_health
+        self.hedging = HEDGING_ENABLED if hedging is None else hedging
+        self.slot = slot
+
+    async def _timed(self, backend: Backend, call):
+        # 先占该后端的并发名额，排队等待的时间不计入延迟
+        async with self.slot(backend.api_key, backend.model) if self.slot else contextlib.nullcontext():
+            self.health.started(backend)
+            started = time.monotonic()
+            success = None
+            try:
+                result = await call(backend)
+                success = bool(result)
+                return result
+            except Exception as exc:
+                logger.error(f"后端 {backend.model} 调用异常: {exc}")
+                success = False
+                return None
+            finally:
+                self.health.finished(backend, success, time.monotonic() - started)
+
+    async def _route(self, call):
+        """按健康程度依次尝试各后端，返回 (后端, 结果)，全部失败时返回 (None, None)"""
+        queue = self.health.rank(self.backends)
+        hedge_delay = self.health.hedge_delay(queue[0])
+        running = {}
+
+        def launch():
+            backend = queue.pop(0)
+            running[asyncio.ensure_future(self._timed(backend, call))] = backend
+
+        launch()
+        hedged = False
+        try:
+            while running:
+                can_hedge = self.hedging and queue and not hedged
+                done, _ = await asyncio.wait(
+                    running, timeout=hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    hedged = True
+                    self.health.record_hedge(queue[0])
+                    logger.info(f"请求超过 {hedge_delay:.1f} 秒未返回，向 {queue[0].model} 发出对冲请求")
+                    launch()
+                    continue
+                for task in done:
+                    backend = running.pop(task)
+                    result = task.result()
+                    if result:
+                        return backend, result
+                    logger.warning(f"后端 {backend.model} 翻译失败")
+                # 失败的请求立即由下一个后端接替
+                if queue and len(running) < 1 + hedged:
+                    launch()
+            return None, None
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    def translate(self, text, source_lang="英文", target_lang="中文", model=None,
+                  system_prompt=None, user_prompt=None, temperature=1.0,
+                  include_reasoning=False):
+        for backend in self.health.rank(self.backends):
+            self.health.started(backend)
+            started = time.monotonic()
+            result = backend.translator.translate(
+                text, source_lang=source_lang, target_lang=target_lang, model=backend.model,
+                system_prompt=system_prompt, user_prompt=user_prompt,
+                temperature=temperature, include_reasoning=include_reasoning,
+            )
+            self.health.finished(backend, bool(result), time.monotonic() - started)
+            if result:
+                return result
+        return None
+
+    async def translate_async(self, text, source_lang="英文", target_lang="中文", model=None,
+                              system_prompt=None, user_prompt=None, temperature=1.0,
+                              include_reasoning=False):
+        _, result = await self._route(lambda backend: backend.translator.translate_async(
+            text, source_lang=source_lang, target_lang=target_lang, model=backend.model,
+            system_prompt=system_prompt, user_prompt=user_prompt,
+            temperature=temperature, include_reasoning=include_reasoning,
+        ))
+        return result
+
+    async def translate_detailed(self, text, source_lang="英文", target_lang="中文", model=None,
+                                 system_prompt=None, user_prompt=None, temperature=1.0,
+                                 include_reasoning=False, continuation=None):
+        backend, result = await self._route(lambda backend: backend.translator.translate_detailed(
+            text, source_lang=source_lang, target_lang=target_lang, model=backend.model,
+            system_prompt=system_prompt, user_prompt=user_prompt,
+            temperature=temperature, include_reasoning=include_reasoning,
+            continuation=continuation,
+        ))
+        if result is None:
+            return None
+        return dict(result, model=backend.model)
+
+    async def translate_stream(self, text, source_lang="英文", target_lang="中文", model=None,
+                               system_prompt=None, user_prompt=None, temperature=1.0,
+                               include_reasoning=False):
+        """流式请求不对冲：使用最健康的后端，开始输出前失败时换下一个"""
+        backends = self.health.rank(self.backends)
+        for number, backend in enumerate(backends):
+            started = False
+            try:
+                async for event in backend.translator.translate_stream(
+                    text, source_lang=source_lang, target_lang=target_lang, model=backend.model,
+                    system_prompt=system_prompt, user_prompt=user_prompt,
+                    temperature=temperature, include_reasoning=include_reasoning,
+                ):
+                    started = True
+                    yield event
+                return
+            except Exception as exc:
+                if started or number == len(backends) - 1:
+                    raise
+                logger.warning(f"后端 {backend.model} 流式请求失败，改用下一个后端: {exc}")
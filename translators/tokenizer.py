@@ -0,0 +1,289 @@
+import base64
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+
+try:
+    import tiktoken
+except ImportError:  # 可选依赖，未安装时使用按文字系统估算的计数器
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# BPE 词表目录（<编码名>.tiktoken），需预先离线放置；词表由本模块直接读取并构造编码，运行时从不联网下载
+TOKENIZER_DIR = os.getenv("ATP_TOKENIZER_DIR") or os.path.join(os.getenv("ATP_DATA_DIR", "data"), "tokenizers")
+
+_ENCODING_URLS = {
+    "cl100k_base": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+    "o200k_base": "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken",
+}
+# 各编码的切分正则和特殊 token（与 tiktoken_ext.openai_public 一致）
+_ENCODING_SPECS = {
+    "cl100k_base": (
+        r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+""",
+        {"<|endoftext|>": 100257, "<|fim_prefix|>": 100258, "<|fim_middle|>": 100259,
+         "<|fim_suffix|>": 100260, "<|endofprompt|>": 100276},
+    ),
+    "o200k_base": (
+        "|".join([
+            r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+            r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+            r"""\p{N}{1,3}""",
+            r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+            r"""\s*[\r\n]+""",
+            r"""\s+(?!\S)""",
+            r"""\s+""",
+        ]),
+        {"<|endoftext|>": 199999, "<|endofprompt|>": 200018},
+    ),
+}
+
+# 文字系统估算参数：每个字符（或每个词）的 token 数，取主流 BPE 词表的偏高值
+_LATIN_WORD_RE = re.compile(r"[A-Za-zÀ-ɏ']+")
+_DIGITS_RE = re.compile(r"\d+")
+_SCRIPT_RANGES = (
+    ((0x4E00, 0x9FFF), 1.3),    # 中日韩统一表意文字
+    ((0x3400, 0x4DBF), 1.5),    # 扩展 A
+    ((0x3040, 0x30FF), 1.1),    # 平假名、片假名
+    ((0x31F0, 0x31FF), 1.1),    # 片假名扩展
+    ((0xAC00, 0xD7AF), 1.5),    # 韩文音节
+    ((0x1100, 0x11FF), 1.0),    # 韩文字母
+    ((0x0400, 0x04FF), 0.45),   # 西里尔字母
+    ((0x0370, 0x03FF), 0.5),    # 希腊字母
+    ((0x0590, 0x05FF), 0.5),    # 希伯来字母
+    ((0x0600, 0x06FF), 0.5),    # 阿拉伯字母
+    ((0x0E00, 0x0E7F), 0.6),    # 泰文
+    ((0x0900, 0x097F), 0.8),    # 天城文
+)
+
+
+class ScriptAwareCounter:
+    """不依赖词表的 token 估算：拉丁词按长度、其他文字按字符系数累加"""
+
+    name = "script-estimate"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        tokens = 0.0
+        for word in _LATIN_WORD_RE.findall(text):
+            tokens += max(1.0, len(word) / 4.0)
+        for digits in _DIGITS_RE.findall(text):
+            tokens += math.ceil(len(digits) / 3)
+        for char in text:
+            if char.isascii():
+                if not char.isalnum() and not char.isspace():
+                    tokens += 1
+                continue
+            code_point = ord(char)
+            if 0x00C0 <= code_point <= 0x024F or char.isspace():
+                continue
+            for (start, end), weight in _SCRIPT_RANGES:
+                if start <= code_point <= end:
+                    tokens += weight
+                    break
+            else:
+                tokens += 1
+        return int(math.ceil(tokens))
+
+
+class BPECounter:
+    """基于 tiktoken 的精确计数，factor 用于近似其他厂商的词表"""
+
+    def __init__(self, encoding, factor: float = 1.0):
+        self.encoding = encoding
+        self.factor = factor
+        self.name = f"{encoding.name}x{factor}"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return int(math.ceil(len(self.encoding.encode(text, disallowed_special=())) * self.factor))
+
+
+class ModelBudget:
+    """模型的上下文窗口与最大输出 token 数"""
+
+    def __init__(self, context_window: int, max_output: int):
+        self.context_window = context_window
+        self.max_output = max_output
+
+    def chunk_tokens(self, expansion: float = None, prompt_overhead: int = 512, cap: int = None) -> int:
+        """单个文本块的输入 token 上限：译文须放得进最大输出，输入加输出须放得进上下文"""
+        expansion = expansion or OUTPUT_EXPANSION
+        cap = cap or MAX_CHUNK_TOKENS
+        by_output = (self.max_output - OUTPUT_MARGIN) / expansion
+        by_context = self.context_window - self.max_output - prompt_overhead
+        return max(256, int(min(cap, by_output, by_context)))
+
+
+# 译文相对原文的 token 膨胀系数与输出余量
+OUTPUT_EXPANSION = float(os.getenv("ATP_OUTPUT_EXPANSION", "1.5"))
+OUTPUT_MARGIN = 256
+MIN_OUTPUT_TOKENS = 2000
+# 单块输入上限：块越大请求越少，但可并发的块也越少
+MAX_CHUNK_TOKENS = int(os.getenv("ATP_MAX_CHUNK_TOKENS", "4000"))
+
+# 按模型名前缀匹配（最长前缀优先）：(上下文窗口, 最大输出, tiktoken 编码, 计数系数)
+MODEL_PROFILES = {
+    "openai/gpt-4o": (128000, 16384, "o200k_base", 1.0),
+    "openai/gpt-4.1": (1047576, 32768, "o200k_base", 1.0),
+    "openai/o1": (200000, 100000, "o200k_base", 1.0),
+    "openai/o3": (200000, 100000, "o200k_base", 1.0),
+    "openai/o4": (200000, 100000, "o200k_base", 1.0),
+    "openai/gpt-4-turbo": (128000, 4096, "cl100k_base", 1.0),
+    "openai/gpt-4": (8192, 4096, "cl100k_base", 1.0),
+    "openai/gpt-3.5": (16385, 4096, "cl100k_base", 1.0),
+    "openai/": (128000, 16384, "o200k_base", 1.0),
+    "anthropic/claude-3.5": (200000, 8192, "cl100k_base", 1.15),
+    "anthropic/claude-3.7": (200000, 64000, "cl100k_base", 1.15),
+    "anthropic/": (200000, 8192, "cl100k_base", 1.15),
+    "google/gemini": (1048576, 8192, "o200k_base", 1.1),
+    "deepseek/": (64000, 8192, "cl100k_base", 1.1),
+    "qwen/": (32768, 8192, "cl100k_base", 1.1),
+    "meta-llama/": (128000, 4096, "o200k_base", 1.1),
+    "mistralai/": (32000, 4096, "cl100k_base", 1.2),
+}
+DEFAULT_PROFILE = (32000, 4096, "cl100k_base", 1.2)
+
+
+def _load_profile_overrides():
+    """ATP_MODEL_BUDGETS 可用 JSON 覆盖或补充模型表，如 {"x/y": [32000, 4096]}"""
+    raw = os.getenv("ATP_MODEL_BUDGETS")
+    if not raw:
+        return
+    try:
+        for prefix, values in json.loads(raw).items():
+            base = MODEL_PROFILES.get(prefix, DEFAULT_PROFILE)
+            MODEL_PROFILES[prefix] = tuple(values) + tuple(base[len(values):])
+    except (ValueError, TypeError, AttributeError) as exc:
+        logger.error("ATP_MODEL_BUDGETS 格式错误: %s", exc)
+
+
+_load_profile_overrides()
+
+
+def _model_profile(model: str):
+    normalized = (model or "").lower()
+    best = None
+    for prefix in MODEL_PROFILES:
+        if normalized.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return MODEL_PROFILES[best] if best else DEFAULT_PROFILE
+
+
+def get_model_budget(model: str) -> ModelBudget:
+    context_window, max_output = _model_profile(model)[:2]
+    return ModelBudget(context_window, max_output)
+
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+_warned_no_tiktoken = False
+
+
+def _local_vocab_path(name: str):
+    """本地词表文件：<编码名>.tiktoken，或 tiktoken 缓存目录中以下载地址哈希命名的文件"""
+    cache_name = hashlib.sha1(_ENCODING_URLS[name].encode()).hexdigest()
+    for filename in (f"{name}.tiktoken", cache_name):
+        path = os.path.join(TOKENIZER_DIR, filename)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _read_bpe_ranks(path: str) -> dict:
+    ranks = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                token, rank = line.split()
+                ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+def _load_encoding(name: str):
+    """只从本地词表文件构造编码，文件不存在或无法读取时返回 None（改用估算）
+
+    不调用 tiktoken.get_encoding：它在缓存缺失或 TIKTOKEN_CACHE_DIR 指向别处时会联网下载。
+    """
+    if name not in _ENCODING_SPECS:
+        return None
+    if tiktoken is None:
+        global _warned_no_tiktoken
+        if not _warned_no_tiktoken:
+            _warned_no_tiktoken = True
+            logger.warning("未安装 tiktoken，token 数按文字系统估算，并非精确计数")
+        return None
+    with _encodings_lock:
+        if name in _encodings:
+            return _encodings[name]
+        encoding = None
+        path = _local_vocab_path(name)
+        if path is not None:
+            pat_str, special_tokens = _ENCODING_SPECS[name]
+            try:
+                encoding = tiktoken.Encoding(
+                    name=name,
+                    pat_str=pat_str,
+                    mergeable_ranks=_read_bpe_ranks(path),
+                    special_tokens=special_tokens,
+                )
+            except Exception as exc:
+                logger.warning("加载 BPE 词表 %s 失败，改用估算: %s", name, exc)
+        else:
+            logger.warning("未找到 BPE 词表 %s（%s），token 数按文字系统估算，并非精确计数",
+                           name, os.path.join(TOKENIZER_DIR, f"{name}.tiktoken"))
+        _encodings[name] = encoding
+        return encoding
+
+
+_fallback_counter = ScriptAwareCounter()
+_counters = {_fallback_counter.name: _fallback_counter}
+
+
+def get_token_counter(model: str = None):
+    """返回模型对应的 token 计数器：有本地 BPE 词表时精确计数，否则按文字系统估算"""
+    _, _, encoding_name, factor = _model_profile(model)
+    encoding = _load_encoding(encoding_name)
+    if encoding is None:
+        return _fallback_counter
+    counter = BPECounter(encoding, factor)
+    return _counters.setdefault(counter.name, counter)
+
+
+# 计数缓存按 (计数器, 文本摘要) 存放，不保留原文，内存占用与文本长度无关
+COUNT_CACHE_SIZE = 32768
+_count_cache = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+
+def count_tokens(text: str, model: str = None, counter=None) -> int:
+    """计数结果按 (计数器, 文本) 缓存，同一段落在分块、预算中多次计数时只计算一次"""
+    counter = counter or get_token_counter(model)
+    if not text or counter.name not in _counters:
+        return counter.count(text)
+    key = (counter.name, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+        if cached is not None:
+            _count_cache.move_to_end(key)
+            return cached
+    tokens = counter.count(text)
+    with _count_cache_lock:
+        _count_cache[key] = tokens
+        if len(_count_cache) > COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return tokens
+
+
+def output_token_limit(model: str, text: str) -> int:
+    """请求的 max_tokens：按原文长度预估译文所需，不低于 2000、不超过模型最大输出"""
+    budget = get_model_budget(model)
+    needed = int(count_tokens(text, model) * OUTPUT_EXPANSION) + OUTPUT_MARGIN
+    return min(budget.max_output, max(MIN_OUTPUT_TOKENS, needed))